@@ -1,24 +1,115 @@
 # AI/api/app.py
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
-import joblib, json
-import pandas as pd
-import requests
+import asyncio, hmac, json, logging, os, time
+import httpx
+import numpy as np
+from contextlib import asynccontextmanager
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, Dict, Any
-
-app = FastAPI(title="Flood Risk API", version="0.5.0")
+from typing import Optional, Dict, Any, List, Sequence, Tuple, AsyncIterator, Union
+from starlette.concurrency import run_in_threadpool
+
+from api.archive import SENSORS, WEATHER, Archive, SensorArchiver
+from api.cache import PredictionCache, TTLCache
+from api.inference import InferenceExecutor
+from api.log import log_event, setup_logging
+from api.metrics import UPSTREAM_ERRORS, REQUEST_SECONDS, gauge_lines, register_collector, render as render_metrics, timed
+from api.precompute import Precomputer, Snapshot, encode
+from api.registry import DEFAULT_THRESHOLD, ModelRegistry, ModelVersion
+from api.sites import DEFAULT_LAT, DEFAULT_LON, Site, group_by_cell, load_sites
+from api.stream import Broadcaster
+from api.telemetry import FIELDS as TELEMETRY_FIELDS, TelemetryStore, start_subscribers
+from api.water import WEIGHT_CLIMATE, WEIGHT_WATER, compute_water_score, compute_water_scores_from_packets
+from features import OnlineFeatureEngine
+
+# Logs estructurados no bloqueantes (muestreados) en lugar de print()
+LOG = setup_logging(level=os.getenv("LOG_LEVEL", "INFO"), sample_rate=float(os.getenv("LOG_SAMPLE_RATE", 0.1)))
+
+# Cliente HTTP compartido (keep-alive + pool); se crea al arrancar la app
+HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+HTTP_TIMEOUT = httpx.Timeout(20.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+
+def get_http() -> httpx.AsyncClient:
+    global HTTP_CLIENT
+    if HTTP_CLIENT is None or HTTP_CLIENT.is_closed:
+        HTTP_CLIENT = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return HTTP_CLIENT
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    INFERENCE.start()
+    if SENSOR_ARCHIVE is not None:
+        restore_telemetry()
+    tasks = start_subscribers(get_http(), TELEMETRY, FIREBASE_DB_URL, TELEMETRY_STREAM_DEVICES)
+    if SENSOR_ARCHIVE is not None:
+        tasks.append(asyncio.ensure_future(SENSOR_ARCHIVE.run()))
+    if MODEL_WATCH_S > 0:
+        tasks.append(asyncio.ensure_future(REGISTRY.watch(MODEL_WATCH_S)))
+    tasks += PRECOMPUTE.start()
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if HTTP_CLIENT is not None:
+        await HTTP_CLIENT.aclose()
+    INFERENCE.close()
+
+
+app = FastAPI(title="Flood Risk API", version="0.5.0", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - t0, path=getattr(route, "path", "other"), method=request.method)
+    return response
 
 # --- Modelo y features ---
-PIPE = joblib.load(str(Path("artifacts") / "model.pkl"))
-FEATURES = json.loads((Path("artifacts") / "feature_names.json").read_text(encoding="utf-8"))
-THRESHOLD = 0.25  # corte para riesgo
+ARTIFACTS_DIR = Path(os.getenv("ARTIFACTS_DIR", Path(__file__).resolve().parents[1] / "artifacts"))
+# compiled: arrays .npy con mmap (sin sklearn); pickle: joblib.load(model.pkl) + from_pipeline
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "compiled")
+# Cada cuánto se revisa artifacts/ para recargar el modelo (0 = solo por /admin/model/reload)
+MODEL_WATCH_S = float(os.getenv("MODEL_WATCH_S", 30))
+# Sin token configurado los endpoints /admin/* no existen (404)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Versión activa + anteriores; los handlers toman REGISTRY.active una vez por request
+REGISTRY = ModelRegistry(ARTIFACTS_DIR, MODEL_FORMAT)
+REGISTRY.active  # carga inicial al importar: si artifacts/ está roto, falla el arranque
+# El corte de metrics.json (model.threshold) se eligió sobre la probabilidad climática y solo
+# se aplica a ella (climate_label); el riesgo combinado agua+clima mantiene su propio corte
+RISK_THRESHOLD = float(os.getenv("RISK_THRESHOLD", DEFAULT_THRESHOLD))
+
+# Inferencia en procesos con micro-batching (INFERENCE_WORKERS=0: en línea, como antes)
+INFERENCE = InferenceExecutor(
+    ARTIFACTS_DIR,
+    MODEL_FORMAT,
+    workers=int(os.getenv("INFERENCE_WORKERS", 2)),
+    window_ms=float(os.getenv("INFERENCE_BATCH_WINDOW_MS", 2.0)),
+    max_batch=int(os.getenv("INFERENCE_MAX_BATCH", 512)),
+)
 
-# --- Pesos para el ensamble ---
-WEIGHT_WATER = 0.7
-WEIGHT_CLIMATE = 0.3
+# Probabilidades ya calculadas por vector de features (el dashboard repite la misma hora);
+# PREDICTION_CACHE_SIZE=0 la desactiva. Solo las lecturas crudas del sensor se cuantizan
+# (PREDICTION_CACHE_RESOLUTION="feature=paso,..."); clima, ventanas y lags van exactos.
+# /predict_batch no pasa por aquí: un lote grande desalojaría las entradas del dashboard.
+PREDICTION_CACHE = PredictionCache(
+    "prediction",
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL_S", 60 * 60)),
+    resolution={k: float(v) for k, v in (
+        item.split("=") for item in os.getenv("PREDICTION_CACHE_RESOLUTION", "distance_cm=0.1,level_pct=0.1").split(",")
+        if item
+    )},
+)
 
 # --- CORS ---
 origins = [
@@ -35,19 +126,92 @@ app.add_middleware(
 )
 
 # --- Config de servicios externos ---
-VC_URL_REALTIME = (
-    "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
-    "15.5645%2C-88.0286?unitGroup=metric&include=hours%2Ccurrent&key=HHPMJQETSARBF4BUCVZMRPBH8&contentType=json"
-)
-VC_URL_DAILY = (
-    "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
-    "15.5645%2C-88.0286?unitGroup=metric&include=days&key=HHPMJQETSARBF4BUCVZMRPBH8&contentType=json"
-)
+VC_BASE_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
+VC_KEY = "HHPMJQETSARBF4BUCVZMRPBH8"
+
+
+def vc_url(lat: float, lon: float, include: str, period: str = "") -> str:
+    """`period`: rango "YYYY-MM-DD/YYYY-MM-DD" (histórico); vacío = pronóstico desde hoy."""
+    period = f"/{period}" if period else ""
+    return f"{VC_BASE_URL}{lat}%2C{lon}{period}?unitGroup=metric&include={include}&key={VC_KEY}&contentType=json"
+
+
+VC_URL_REALTIME = vc_url(DEFAULT_LAT, DEFAULT_LON, "hours%2Ccurrent")
+VC_URL_DAILY = vc_url(DEFAULT_LAT, DEFAULT_LON, "days")
+
+# Caché de Visual Crossing: los datos horarios cambian una vez por hora y los diarios aún menos
+VC_REALTIME_TTL_S = float(os.getenv("VC_REALTIME_TTL_S", 15 * 60))
+VC_DAILY_TTL_S = float(os.getenv("VC_DAILY_TTL_S", 3 * 60 * 60))
+VC_STALE_TTL_S = float(os.getenv("VC_STALE_TTL_S", 60 * 60))
+VC_REALTIME_CACHE = TTLCache("vc_realtime", ttl=VC_REALTIME_TTL_S, stale_ttl=VC_STALE_TTL_S)
+VC_DAILY_CACHE = TTLCache("vc_daily", ttl=VC_DAILY_TTL_S, stale_ttl=VC_STALE_TTL_S)
+# Días anteriores a hoy para las ventanas rolling climáticas (archivo local o Visual Crossing)
+VC_HISTORY_CACHE = TTLCache("vc_history", ttl=VC_DAILY_TTL_S, stale_ttl=VC_STALE_TTL_S)
 
 # Firebase RTDB
 FIREBASE_DB_URL = "https://inundatech-ecc38-default-rtdb.firebaseio.com"
 DEVICE_ID = "esp32-water-01"
 
+# Telemetría local: lecturas recientes por dispositivo (ingest + stream de RTDB)
+TELEMETRY = TelemetryStore(capacity=int(os.getenv("TELEMETRY_CAPACITY", 512)))
+# Edad máxima de la lectura en memoria: con el stream de RTDB conectado el buffer está al día;
+# sin stream solo evita repetir la consulta a RTDB entre requests muy seguidos
+TELEMETRY_MAX_AGE_S = float(os.getenv("TELEMETRY_MAX_AGE_S", 10 * 60))
+TELEMETRY_POLL_MAX_AGE_S = float(os.getenv("TELEMETRY_POLL_MAX_AGE_S", 5))
+TELEMETRY_STREAM_DEVICES = [d for d in os.getenv("TELEMETRY_STREAM_DEVICES", "").split(",") if d]
+
+# Archivo local de series (api/archive.py), opcional: con ARCHIVE_DIR (p.ej. AI/archive, el de
+# get_weather.py) cada lectura nueva del ESP32 se guarda en disco y la historia de clima sale de ahí
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_FLUSH_S = float(os.getenv("ARCHIVE_FLUSH_S", 5))
+ARCHIVE = Archive(Path(ARCHIVE_DIR)) if ARCHIVE_DIR else None
+SENSOR_ARCHIVE = SensorArchiver(ARCHIVE, TELEMETRY_FIELDS, ARCHIVE_FLUSH_S) if ARCHIVE is not None else None
+if SENSOR_ARCHIVE is not None:
+    TELEMETRY.listeners.append(
+        lambda device_id: SENSOR_ARCHIVE.record(device_id, TELEMETRY.get(device_id).latest_ts(),
+                                                TELEMETRY.latest(device_id)))
+
+
+def restore_telemetry() -> None:
+    """Al arrancar, la historia reciente de cada dispositivo sale del archivo (sin disparar listeners)."""
+    for device_id in SENSOR_ARCHIVE.archive.keys(SENSORS):
+        buf = TELEMETRY.buffer(device_id)
+        for ts, reading in SENSOR_ARCHIVE.restore(device_id, TELEMETRY.capacity):
+            buf.append(reading, ts)
+
+# Registro de sitios (varios sensores / ubicaciones)
+SITES_FILE = Path(os.getenv("SITES_FILE", Path(__file__).resolve().parents[1] / "sites.json"))
+SITES: List[Site] = load_sites(SITES_FILE, DEVICE_ID)
+REALTIME_ALL_BUDGET_S = float(os.getenv("REALTIME_ALL_BUDGET_S", 8.0))
+
+# Precálculo en segundo plano de /predict_realtime y /predict_daily por dispositivo (0 = desactivado)
+PRECOMPUTE_REALTIME_S = float(os.getenv("PRECOMPUTE_REALTIME_S", 60))
+PRECOMPUTE_DAILY_S = float(os.getenv("PRECOMPUTE_DAILY_S", 10 * 60))
+PRECOMPUTE = Precomputer(REGISTRY)
+
+# Push por SSE: un cálculo (el del precálculo) se reparte a todos los clientes suscritos
+STREAM = Broadcaster(max_queue=int(os.getenv("STREAM_MAX_QUEUE", 8)))
+STREAM_HEARTBEAT_S = float(os.getenv("STREAM_HEARTBEAT_S", 15))
+PRECOMPUTE.listeners.append(lambda name, key, snap: STREAM.publish((name, key), snap.value, snap.body))
+# Una lectura nueva del ESP32 adelanta el recálculo en tiempo real (y su push)
+TELEMETRY.listeners.append(lambda device_id: PRECOMPUTE.wake("realtime"))
+
+# Geometría del tanque para dispositivos que no están en sites.json
+DEFAULT_MAX_DEPTH_CM = 10.0
+DEFAULT_HEADSPACE_CM = 3.0
+DAILY_DAYS = 15
+SITE_BY_DEVICE: Dict[str, Site] = {s.device_id: s for s in SITES}
+
+
+def site_geometry(device_id: str, max_depth_cm: Optional[float] = None,
+                  headspace_cm: Optional[float] = None) -> Tuple[float, float]:
+    """(max_depth_cm, headspace_cm): lo pedido o, si falta, lo del sitio (los snapshots usan esto)."""
+    site = SITE_BY_DEVICE.get(device_id)
+    return (
+        max_depth_cm if max_depth_cm is not None else site.max_depth_cm if site else DEFAULT_MAX_DEPTH_CM,
+        headspace_cm if headspace_cm is not None else site.headspace_cm if site else DEFAULT_HEADSPACE_CM,
+    )
+
 
 class WeatherInput(BaseModel):
     payload: dict
@@ -61,16 +225,36 @@ def get_current_hour_str() -> str:
     return datetime.now().strftime("%H:00:00")
 
 
-def fetch_visualcrossing_realtime() -> Dict[str, Any]:
-    res = requests.get(VC_URL_REALTIME, timeout=15)
-    res.raise_for_status()
-    return res.json()
+async def _get_json(url: str, timeout: float) -> Any:
+    try:
+        res = await get_http().get(url, timeout=timeout)
+        res.raise_for_status()
+        return res.json()
+    except Exception as e:
+        service = "visualcrossing" if url.startswith(VC_BASE_URL) else "firebase"
+        UPSTREAM_ERRORS.inc(service=service, error=type(e).__name__)
+        log_event(LOG, "upstream_error", logging.WARNING, service=service, error=repr(e))
+        raise
+
+
+@timed("weather_fetch")
+async def fetch_visualcrossing_realtime(url: Optional[str] = None) -> Dict[str, Any]:
+    url = url or VC_URL_REALTIME
+    return await VC_REALTIME_CACHE.get_or_fetch(url, lambda: _get_json(url, 15))
+
+
+@timed("weather_fetch")
+async def fetch_visualcrossing_daily() -> Dict[str, Any]:
+    return await VC_DAILY_CACHE.get_or_fetch(VC_URL_DAILY, lambda: _get_json(VC_URL_DAILY, 20))
 
 
-def fetch_visualcrossing_daily() -> Dict[str, Any]:
-    res = requests.get(VC_URL_DAILY, timeout=20)
-    res.raise_for_status()
-    return res.json()
+def pick_current_hour(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(día de hoy, hora actual) de una respuesta de Visual Crossing con horas."""
+    current_hour = get_current_hour_str()
+    today = data["days"][0]
+    hour_data = next((h for h in today.get("hours", []) if h.get("datetime") == current_hour),
+                     (today.get("hours") or [{}])[0])
+    return today, hour_data
 
 
 def build_weather_payload_from_hour(hour: Dict[str, Any]) -> Dict[str, Any]:
@@ -88,8 +272,6 @@ def build_weather_payload_from_hour(hour: Dict[str, Any]) -> Dict[str, Any]:
         "solarenergy": hour.get("solarenergy"),
         "dew": hour.get("dew"),
         "uvindex": hour.get("uvindex"),
-        "precip_sum_3d": 0,
-        "precip_max_3d": 0,
     }
 
 
@@ -116,194 +298,257 @@ def build_weather_payload_from_day(day: Dict[str, Any]) -> Dict[str, Any]:
         "solarenergy": day.get("solarenergy"),
         "dew": day.get("dew"),
         "uvindex": day.get("uvindex"),
-        "precip_sum_3d": 0,
-        "precip_max_3d": 0,
     }
 
 
-def get_latest_esp32(device_id: str = DEVICE_ID) -> Dict[str, Any]:
-    """Busca el último paquete del ESP32 en RTDB."""
-    def pick_fields(d: Dict[str, Any]) -> Dict[str, Any]:
-        return {
-            "distance_cm": d.get("distance_cm"),
-            "level_pct": d.get("level_pct"),
-            "fill_pct": d.get("fill_pct"),
-            "water_height_cm": d.get("water_height_cm"),
-            "max_depth_cm": d.get("max_depth_cm"),
-            "headspace_cm": d.get("headspace_cm"),
-            "usable_depth_cm": d.get("usable_depth_cm"),
-        }
+def _pick_esp32_fields(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "distance_cm": d.get("distance_cm"),
+        "level_pct": d.get("level_pct"),
+        "fill_pct": d.get("fill_pct"),
+        "water_height_cm": d.get("water_height_cm"),
+        "max_depth_cm": d.get("max_depth_cm"),
+        "headspace_cm": d.get("headspace_cm"),
+        "usable_depth_cm": d.get("usable_depth_cm"),
+        "timestamp": d.get("timestamp", d.get("ts")),
+    }
+
 
-    # Caso 1: /last
+async def _esp32_from_node(url: str) -> Optional[Dict[str, Any]]:
+    """Casos /last y /latest: el nodo es directamente el paquete."""
     try:
-        url_last = f"{FIREBASE_DB_URL}/devices/{device_id}/last.json"
-        r = requests.get(url_last, timeout=10); r.raise_for_status()
-        last = r.json()
-        if isinstance(last, dict) and last:
-            return pick_fields(last)
+        data = await _get_json(url, 10)
     except Exception:
-        pass
+        return None
+    if isinstance(data, dict) and data:
+        return _pick_esp32_fields(data)
+    return None
 
-    # Caso 2: /latest
+
+async def _esp32_from_telemetry(url: str) -> Optional[Dict[str, Any]]:
+    """Caso /telemetry: RTDB ya filtra con limitToLast=1."""
     try:
-        url_latest = f"{FIREBASE_DB_URL}/devices/{device_id}/latest.json"
-        r = requests.get(url_latest, timeout=10); r.raise_for_status()
-        latest = r.json()
-        if isinstance(latest, dict) and latest:
-            return pick_fields(latest)
+        data = await _get_json(url, 10) or {}
     except Exception:
-        pass
+        return None
+    if isinstance(data, dict) and data:
+        _, last_item = max(data.items(), key=lambda kv: kv[0])
+        if isinstance(last_item, dict):
+            return _pick_esp32_fields(last_item)
+    return None
+
 
-    # Caso 3: /telemetry
+@timed("esp32_fetch")
+async def get_latest_esp32(device_id: str = DEVICE_ID) -> Dict[str, Any]:
+    """
+    Último paquete del ESP32: primero la telemetría en memoria (si es reciente:
+    TELEMETRY_MAX_AGE_S con el stream de RTDB conectado, TELEMETRY_POLL_MAX_AGE_S
+    si no); si no, RTDB. Las tres rutas de RTDB se consultan en paralelo y se respeta
+    la prioridad /last > /latest > /telemetry; al tener respuesta se cancelan las demás.
+    """
+    max_age_s = TELEMETRY_MAX_AGE_S if device_id in TELEMETRY.streaming else TELEMETRY_POLL_MAX_AGE_S
+    cached = TELEMETRY.latest(device_id, max_age_s=max_age_s)
+    if cached:
+        return cached
+
+    base = f"{FIREBASE_DB_URL}/devices/{device_id}"
+    tasks = [
+        asyncio.ensure_future(_esp32_from_node(f"{base}/last.json")),
+        asyncio.ensure_future(_esp32_from_node(f"{base}/latest.json")),
+        asyncio.ensure_future(_esp32_from_telemetry(f'{base}/telemetry.json?orderBy="timestamp"&limitToLast=1')),
+    ]
     try:
-        url_tele = (
-            f'{FIREBASE_DB_URL}/devices/{device_id}/telemetry.json'
-            f'?orderBy="timestamp"&limitToLast=1'
-        )
-        r = requests.get(url_tele, timeout=10); r.raise_for_status()
-        data = r.json() or {}
-        if isinstance(data, dict) and data:
-            _, last_item = next(iter(sorted(data.items(), key=lambda kv: kv[0])))
-            if isinstance(last_item, dict):
-                return pick_fields(last_item)
-    except Exception:
-        pass
+        for task in tasks:
+            result = await task
+            if result:
+                TELEMETRY.append(device_id, result)
+                return result
+    finally:
+        for task in tasks:
+            task.cancel()
+    return {}
+
 
+async def _no_esp32() -> Dict[str, Any]:
     return {}
 
 
-def merge_features(base: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
-    merged = dict(base or {})
-    for k, v in (extra or {}).items():
-        if v is not None:
-            merged[k] = v
-    return merged
+def _finite(feats: Dict[str, float]) -> Dict[str, float]:
+    return {k: v for k, v in feats.items() if v == v}
 
 
-def run_model(features: Dict[str, Any]) -> Dict[str, Any]:
-    df = pd.DataFrame([features]).apply(pd.to_numeric, errors="coerce")
-    X = df.reindex(columns=FEATURES)
-    proba = float(PIPE.predict_proba(X)[0, 1])
-    label = int(proba >= THRESHOLD)
-    result = {"risk_probability": proba, "risk_label": label, "threshold": THRESHOLD}
+def weather_sources(model: ModelVersion) -> List[str]:
+    return sorted({s.source for s in model.specs if s.source not in TELEMETRY_FIELDS})
 
-    print("=== Predicción IA (solo clima) ===")
-    print("Features usados:", features)
-    print("Probabilidad climática:", proba)
-    print("Label asignado:", label)
-    print("=====================")
 
-    return result
+def history_days(model: ModelVersion) -> int:
+    """Días anteriores a hoy que necesitan las ventanas climáticas del modelo."""
+    return max((s.window for s in model.specs if s.source not in TELEMETRY_FIELDS), default=1) - 1
 
 
-# Conversión segura
-def _to_float(x, default=None):
-    try:
-        if x is None: return default
-        if isinstance(x, (int, float)): return float(x)
-        return float(str(x).strip())
-    except Exception:
-        return default
+def _archived_weather(key: str, days: List[str], sources: List[str]) -> Dict[str, Dict[str, float]]:
+    """Filas del archivo local (get_weather.py) para esos días: {fecha: fila}."""
+    if ARCHIVE is None or key not in ARCHIVE.keys(WEATHER):
+        return {}
+    ts, cols = ARCHIVE.series(WEATHER, key).read(days[0], days[-1], columns=sources)
+    dates = np.datetime_as_string(ts.astype("datetime64[s]"), unit="D")
+    return {d: {c: float(v[i]) for c, v in cols.items()} for i, d in enumerate(dates)}
+
 
+async def _fetch_weather_history(lat: float, lon: float, days: List[str], sources: List[str]) -> List[Dict[str, Any]]:
+    rows = await run_in_threadpool(_archived_weather, f"{lat},{lon}", days, sources)
+    if len(rows) < len(days):
+        data = await _get_json(vc_url(lat, lon, "days", f"{days[0]}/{days[-1]}"), 20)
+        for day in data.get("days", []):
+            rows.setdefault(day.get("datetime"), build_weather_payload_from_day(day))
+    return [rows.get(d, {}) for d in days]
 
-# Conversión segura
-def _to_float(x, default=None):
+
+async def weather_history(lat: float, lon: float, today: Optional[str], model: ModelVersion) -> List[Dict[str, Any]]:
+    """
+    Filas diarias de clima de los días anteriores a `today` (la fecha local de
+    Visual Crossing), de la más vieja a la más nueva; {} = día sin dato. Salen
+    del archivo local y, si le faltan días, de Visual Crossing. Si no se
+    consigue historia devuelve [] (las ventanas solo ven los días pedidos).
+    """
+    n = history_days(model)
+    if n <= 0 or not today:
+        return []
+    sources = weather_sources(model)
+    days = [str(d) for d in np.arange(np.datetime64(today, "D") - n, np.datetime64(today, "D"))]
     try:
-        if x is None: return default
-        if isinstance(x, (int, float)): return float(x)
-        return float(str(x).strip())
+        return await VC_HISTORY_CACHE.get_or_fetch(
+            (lat, lon, today, tuple(sources)), lambda: _fetch_weather_history(lat, lon, days, sources))
     except Exception:
-        return default
+        return []
+
+
+@timed("feature_build")
+def weather_history_features(rows: List[Dict[str, Any]], model: ModelVersion,
+                             history: Sequence[Dict[str, Any]] = ()) -> List[Dict[str, float]]:
+    """
+    Features rolling climáticas de una secuencia de filas (una por día), en
+    orden; `history` son los días anteriores (ver weather_history).
+    """
+    engine = OnlineFeatureEngine(model.specs)
+    sources = [src for src in engine.sources if src not in TELEMETRY_FIELDS]
+    for row in history:
+        for src in sources:
+            engine.push_value(src, row.get(src))
+    return [_finite(engine.push(row, sources)) for row in rows]
+
 
-def compute_water_score(
-    esp32: Dict[str, Any],
-    max_depth_cm: float = 10.0,
-    headspace_cm: float = 3.0
-) -> float:
+@timed("feature_build")
+def esp32_history_features(device_id: str, esp32: Dict[str, Any], model: ModelVersion) -> Dict[str, float]:
     """
-    Devuelve un score ∈ [0,1] donde 1 = nivel crítico.
-    Toma el MÁXIMO entre las señales disponibles:
-      - level_pct / 100
-      - fill_pct / 100
-      - water_height_cm / usable_depth
-      - (max_depth - distance_cm) / usable_depth
-    Así evitamos que un '0' por defecto tape señales reales (>0).
+    Features lag/rolling de agua: historial diario de la telemetría en memoria
+    (última lectura de cada día anterior) + la lectura actual como día de hoy.
     """
-    if not esp32:
-        return 0.0
+    engine = OnlineFeatureEngine(model.specs)
+    sources = [src for src in engine.sources if src in TELEMETRY_FIELDS]
+    if not esp32 or not sources:
+        return {}
+    buf = TELEMETRY.get(device_id)
+    if buf is not None:
+        offset = time.localtime().tm_gmtoff
+        days, values = buf.daily_last(offset)
+        today = int((time.time() + offset) // 86400)
+        for day_values in values[days < today]:
+            for src in sources:
+                engine.push_value(src, day_values[TELEMETRY_FIELDS.index(src)])
+    return _finite(engine.push(esp32, sources))
+
+
+def merge_features(base: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base or {})
+    for k, v in (extra or {}).items():
+        if v is not None:
+            merged[k] = v
+    return merged
 
-    candidates = []
 
-    # 1) Porcentajes directos
-    lp = _to_float(esp32.get("level_pct"))
-    if lp is not None:
-        candidates.append(lp / 100.0)
+async def score_matrix(X: np.ndarray, model: ModelVersion, cache: bool = True) -> np.ndarray:
+    """Caché de predicciones -> pool de inferencia (solo las filas que faltan)."""
+    if not cache:
+        return await INFERENCE.predict(model, X)
+    return await PREDICTION_CACHE.predict_async(X, model.version, lambda missing: INFERENCE.predict(model, missing),
+                                                model.features)
 
-    fp = _to_float(esp32.get("fill_pct"))
-    if fp is not None:
-        candidates.append(fp / 100.0)
 
-    # 2) Geometría (para normalizar alturas/distancia)
-    usable = _to_float(esp32.get("usable_depth_cm"))
-    md = _to_float(esp32.get("max_depth_cm"), max_depth_cm)
-    hs = _to_float(esp32.get("headspace_cm"), headspace_cm)
-    if usable is None and (md is not None and hs is not None):
-        usable = max(0.0, md - hs)
+@timed("model_inference")
+async def run_model(features: Dict[str, Any], model: ModelVersion) -> Dict[str, Any]:
+    proba = float((await score_matrix(model.engine.align(features), model))[0])
+    label = int(proba >= model.threshold)
+    result = {"risk_probability": proba, "risk_label": label, "threshold": model.threshold}
 
-    # 3) Altura de agua útil directa
-    wh = _to_float(esp32.get("water_height_cm"))
-    if wh is not None and usable and usable > 0:
-        candidates.append(wh / usable)
+    log_event(LOG, "climate_prediction", climate_probability=proba, label=label)
+    log_event(LOG, "climate_features", logging.DEBUG, features=features)
 
-    # 4) Distancia al agua -> altura útil
-    d = _to_float(esp32.get("distance_cm"))
-    if d is not None and usable and usable > 0 and md is not None:
-        water_h = max(0.0, min(usable, md - d))
-        candidates.append(water_h / usable)
+    return result
 
-    # Clamp y selección
-    cleaned = [max(0.0, min(1.0, c)) for c in candidates if c is not None]
-    if cleaned:
-        score = max(cleaned)
-        print(f"[AGUA] señales={candidates} -> score={round(score,3)}")
-        return score
 
-    print("[AGUA] Insuficiente info para calcular score. Payload:", esp32)
-    return 0.0
+@timed("model_inference")
+async def run_model_batch(rows: List[Dict[str, Any]], model: ModelVersion, X: Optional[np.ndarray] = None,
+                          cache: bool = True) -> np.ndarray:
+    """Una sola llamada vectorizada para varias filas de features (X: ya alineadas)."""
+    if not rows:
+        return np.empty(0)
+    probas = await score_matrix(model.engine.align_many(rows) if X is None else X, model, cache)
+    log_event(LOG, "climate_prediction_batch", rows=len(rows))
+    return probas
 
 
 # ---------------------- Endpoints ----------------------
 
+def _snapshot_response(snap: Snapshot, value: Optional[Dict[str, Any]] = None) -> Response:
+    """El snapshot ya serializado, o `value` derivado de él, con la edad y la versión en cabeceras."""
+    return Response(snap.body if value is None else encode(value), media_type="application/json",
+                    headers={"X-Snapshot-Age": f"{snap.age_s():.3f}", "X-Model-Version": snap.version})
+
+
 @app.get("/predict_realtime")
-def predict_realtime(
+async def predict_realtime(
     use_esp32: bool = Query(default=True),
     device_id: str = Query(default=DEVICE_ID),
-    max_depth_cm: float = Query(default=10.0),
-    headspace_cm: float = Query(default=3.0)
+    max_depth_cm: Optional[float] = Query(default=None, description="por defecto, la del sitio en sites.json"),
+    headspace_cm: Optional[float] = Query(default=None, description="por defecto, la del sitio en sites.json")
 ):
-    data = fetch_visualcrossing_realtime()
+    geometry = site_geometry(device_id, max_depth_cm, headspace_cm)
+    if use_esp32 and geometry == site_geometry(device_id):
+        snap = PRECOMPUTE.get("realtime", device_id)
+        if snap is not None:
+            return _snapshot_response(snap)
+    return await compute_realtime(REGISTRY.active, device_id, use_esp32, *geometry)
 
-    current_hour = get_current_hour_str()
-    today = data["days"][0]
-    hour_data = next((h for h in today.get("hours", []) if h.get("datetime") == current_hour),
-                     (today.get("hours") or [{}])[0])
+
+async def compute_realtime(
+    model: ModelVersion, device_id: str, use_esp32: bool = True,
+    max_depth_cm: float = DEFAULT_MAX_DEPTH_CM, headspace_cm: float = DEFAULT_HEADSPACE_CM,
+) -> Dict[str, Any]:
+    data, esp32_payload = await asyncio.gather(
+        fetch_visualcrossing_realtime(),
+        get_latest_esp32(device_id) if use_esp32 else _no_esp32(),
+    )
+
+    today, hour_data = pick_current_hour(data)
 
     weather_num = build_weather_payload_from_hour(hour_data)
     weather_meta = build_weather_meta_from_hour(hour_data)
-    esp32_payload = get_latest_esp32(device_id) if use_esp32 else {}
 
-    features = merge_features(weather_num, esp32_payload)
-    out = run_model(features)
+    history = await weather_history(DEFAULT_LAT, DEFAULT_LON, today.get("datetime"), model)
+    weather_feats = weather_history_features([weather_num], model, history)[0]
+    features = merge_features({**weather_num, **weather_feats},
+                              {**esp32_payload, **esp32_history_features(device_id, esp32_payload, model)})
+    out = await run_model(features, model)
 
     climate_probability = out["risk_probability"]
-    water_score = compute_water_score(esp32_payload, max_depth_cm=max_depth_cm, headspace_cm=headspace_cm)
+    with timed("water_score"):
+        water_score = compute_water_score(esp32_payload, max_depth_cm=max_depth_cm, headspace_cm=headspace_cm)
     combined = WEIGHT_WATER * water_score + WEIGHT_CLIMATE * climate_probability
-    label = int(combined >= THRESHOLD)
+    label = int(combined >= RISK_THRESHOLD)
 
-    print("[ENSAMBLE] climate=", round(climate_probability, 3),
-          " water=", round(water_score, 3),
-          " => combined=", round(combined, 3),
-          " esp32=", esp32_payload)
+    log_event(LOG, "ensemble", climate=round(climate_probability, 3), water=round(water_score, 3),
+              combined=round(combined, 3), esp32_used=bool(esp32_payload))
 
     return {
         "location": data.get("resolvedAddress"),
@@ -314,79 +559,528 @@ def predict_realtime(
         "esp32_used": bool(esp32_payload),
 
         "climate_probability": climate_probability,
+        "climate_label": out["risk_label"],
+        "climate_threshold": model.threshold,
         "water_score": water_score,
 
         "risk_probability": combined,
         "risk_label": label,
-        "threshold": THRESHOLD
+        "threshold": RISK_THRESHOLD,
+        "computed_at": time.time(),
     }
 
 
-@app.get("/predict_daily")
-def predict_daily(
-    use_esp32: bool = Query(default=True),
+@app.get("/stream/risk")
+async def stream_risk(
     device_id: str = Query(default=DEVICE_ID),
-    days: int = Query(default=15, ge=1, le=15),
-    max_depth_cm: float = Query(default=10.0),
-    headspace_cm: float = Query(default=3.0)
+    kind: str = Query(default="realtime", pattern="^(realtime|daily)$"),
 ):
-    data = fetch_visualcrossing_daily()
-    esp32_payload = get_latest_esp32(device_id) if use_esp32 else {}
-    results = []
+    """
+    Server-Sent Events con el payload de /predict_realtime (o /predict_daily)
+    del dispositivo; solo se emite cuando cambia el score combinado, risk_label
+    o la lectura del ESP32. Al conectarse se recibe el último estado conocido.
+    """
+    job = PRECOMPUTE.jobs.get(kind)
+    if job is None or device_id not in job.keys:
+        raise HTTPException(status_code=404, detail=f"Sin precálculo '{kind}' para el dispositivo {device_id}.")
+    return StreamingResponse(
+        STREAM.sse((kind, device_id), heartbeat_s=STREAM_HEARTBEAT_S),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/predict_realtime_all")
+async def predict_realtime_all(
+    use_esp32: bool = Query(default=True),
+    budget_s: float = Query(default=REALTIME_ALL_BUDGET_S, gt=0, le=60),
+):
+    """
+    Riesgo en tiempo real para todos los sitios registrados. El clima se pide
+    una vez por celda de la grilla y el ESP32 una vez por dispositivo, todo en
+    paralelo y dentro de `budget_s`; lo que no llega a tiempo se reporta como
+    error del sitio. Todos los sitios se puntúan en una sola llamada al modelo.
+    """
+    started = time.perf_counter()
+    model = REGISTRY.active
+    cells = group_by_cell(SITES)
+
+    async def cell_weather(cell: Tuple[float, float]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        data = await fetch_visualcrossing_realtime(vc_url(cell[0], cell[1], "hours%2Ccurrent"))
+        today, _ = pick_current_hour(data)
+        return data, await weather_history(cell[0], cell[1], today.get("datetime"), model)
+
+    weather_tasks = {cell: asyncio.ensure_future(cell_weather(cell)) for cell in cells}
+    esp_tasks = {
+        site.device_id: asyncio.ensure_future(get_latest_esp32(site.device_id))
+        for site in SITES if use_esp32
+    }
+    pending = list(weather_tasks.values()) + list(esp_tasks.values())
+    if pending:
+        _, late = await asyncio.wait(pending, timeout=budget_s)
+        for task in late:
+            task.cancel()
+
+    def result(task: "asyncio.Future[Any]") -> Tuple[Any, Optional[str]]:
+        if not task.done() or task.cancelled():
+            return None, "timeout"
+        if task.exception() is not None:
+            return None, repr(task.exception())
+        return task.result(), None
+
+    rows, scored, out = [], [], []
+    for cell, sites in cells.items():
+        weather, weather_error = result(weather_tasks[cell])
+        data, history = weather if weather is not None else (None, [])
+        hour_payload: Dict[str, Any] = {}
+        if data is not None:
+            _, hour_data = pick_current_hour(data)
+            hour_payload = build_weather_payload_from_hour(hour_data)
+            hour_payload.update(weather_history_features([hour_payload], model, history)[0])
+        for site in sites:
+            entry: Dict[str, Any] = {
+                "device_id": site.device_id,
+                "name": site.name,
+                "lat": site.lat,
+                "lon": site.lon,
+                "cell": list(cell),
+            }
+            out.append(entry)
+            if data is None:
+                entry["error"] = f"weather: {weather_error}"
+                continue
+            esp, esp_error = result(esp_tasks[site.device_id]) if site.device_id in esp_tasks else ({}, None)
+            esp = esp or {}
+            if esp_error:
+                entry["esp32_error"] = esp_error
+            entry["location"] = data.get("resolvedAddress")
+            entry["esp32"] = esp or None
+            entry["esp32_used"] = bool(esp)
+            rows.append(merge_features(hour_payload, {**esp, **esp32_history_features(site.device_id, esp, model)}))
+            scored.append((entry, site, esp))
+
+    if scored:
+        climate = await run_model_batch(rows, model)
+
+        # Geometría del sitio como respaldo de la que reporta el sensor
+        with timed("water_score"):
+            water = compute_water_scores_from_packets(
+                [esp for _, _, esp in scored],
+                max_depth_cm=[site.max_depth_cm for _, site, _ in scored],
+                headspace_cm=[site.headspace_cm for _, site, _ in scored],
+            )
+        combined = WEIGHT_WATER * water + WEIGHT_CLIMATE * climate
+
+        for k, (entry, _, _) in enumerate(scored):
+            entry.update({
+                "climate_probability": float(climate[k]),
+                "climate_label": int(climate[k] >= model.threshold),
+                "water_score": float(water[k]),
+                "risk_probability": float(combined[k]),
+                "risk_label": int(combined[k] >= RISK_THRESHOLD),
+            })
+
+    return {
+        "sites": out,
+        "n_sites": len(out),
+        "n_cells": len(cells),
+        "threshold": RISK_THRESHOLD,
+        "climate_threshold": model.threshold,
+        "budget_s": budget_s,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
 
-    for day in (data.get("days", [])[:days]):
-        weather_payload = build_weather_payload_from_day(day)
-        features = merge_features(weather_payload, esp32_payload)
-        out = run_model(features)
 
-        climate_probability = out["risk_probability"]
+@app.get("/predict_daily")
+async def predict_daily(
+    use_esp32: bool = Query(default=True),
+    device_id: str = Query(default=DEVICE_ID),
+    days: int = Query(default=DAILY_DAYS, ge=1, le=DAILY_DAYS),
+    max_depth_cm: Optional[float] = Query(default=None, description="por defecto, la del sitio en sites.json"),
+    headspace_cm: Optional[float] = Query(default=None, description="por defecto, la del sitio en sites.json")
+):
+    geometry = site_geometry(device_id, max_depth_cm, headspace_cm)
+    if use_esp32 and geometry == site_geometry(device_id):
+        snap = PRECOMPUTE.get("daily", device_id)
+        if snap is not None:
+            if days == DAILY_DAYS:
+                return _snapshot_response(snap)
+            return _snapshot_response(snap, {**snap.value, "daily_predictions": snap.value["daily_predictions"][:days]})
+    return await compute_daily(REGISTRY.active, device_id, use_esp32, days, *geometry)
+
+
+async def compute_daily(
+    model: ModelVersion, device_id: str, use_esp32: bool = True, days: int = DAILY_DAYS,
+    max_depth_cm: float = DEFAULT_MAX_DEPTH_CM, headspace_cm: float = DEFAULT_HEADSPACE_CM,
+) -> Dict[str, Any]:
+    data, esp32_payload = await asyncio.gather(
+        fetch_visualcrossing_daily(),
+        get_latest_esp32(device_id) if use_esp32 else _no_esp32(),
+    )
+
+    day_list = data.get("days", [])[:days]
+    weather_payloads = [build_weather_payload_from_day(day) for day in day_list]
+    # Día 0 = hoy: sus ventanas (y las de los siguientes) arrancan con los días ya pasados
+    history = await weather_history(DEFAULT_LAT, DEFAULT_LON, day_list[0].get("datetime") if day_list else None, model)
+    water = {**esp32_payload, **esp32_history_features(device_id, esp32_payload, model)}
+    feature_rows = [
+        merge_features({**w, **feats}, water)
+        for w, feats in zip(weather_payloads, weather_history_features(weather_payloads, model, history))
+    ]
+
+    # El paquete del ESP32 es el mismo para todos los días: score de agua una vez
+    climate = await run_model_batch(feature_rows, model)
+    with timed("water_score"):
         water_score = compute_water_score(esp32_payload, max_depth_cm=max_depth_cm, headspace_cm=headspace_cm)
-        combined = WEIGHT_WATER * water_score + WEIGHT_CLIMATE * climate_probability
-        label = int(combined >= THRESHOLD)
+    combined = WEIGHT_WATER * water_score + WEIGHT_CLIMATE * climate
+    labels = combined >= RISK_THRESHOLD
 
+    location = data.get("resolvedAddress")
+    results = []
+    for i, day in enumerate(day_list):
         results.append({
             "date": day.get("datetime"),
-            "location": data.get("resolvedAddress"),
-            "weather": {**weather_payload},
+            "location": location,
+            "weather": weather_payloads[i],
             "esp32": esp32_payload or None,
-            "features": features,
+            "features": feature_rows[i],
             "esp32_used": bool(esp32_payload),
 
-            "climate_probability": climate_probability,
+            "climate_probability": float(climate[i]),
+            "climate_label": int(climate[i] >= model.threshold),
+            "climate_threshold": model.threshold,
             "water_score": water_score,
 
-            "risk_probability": combined,
-            "risk_label": label,
-            "threshold": THRESHOLD
+            "risk_probability": float(combined[i]),
+            "risk_label": int(labels[i]),
+            "threshold": RISK_THRESHOLD
         })
 
-    return {"daily_predictions": results}
+    return {"daily_predictions": results, "computed_at": time.time()}
+
+
+async def precompute_realtime(device_id: str, model: ModelVersion) -> Dict[str, Any]:
+    return await compute_realtime(model, device_id, True, *site_geometry(device_id))
+
+
+async def precompute_daily(device_id: str, model: ModelVersion) -> Dict[str, Any]:
+    return await compute_daily(model, device_id, True, DAILY_DAYS, *site_geometry(device_id))
+
+
+PRECOMPUTE.add_job("realtime", PRECOMPUTE_REALTIME_S, [s.device_id for s in SITES], precompute_realtime)
+PRECOMPUTE.add_job("daily", PRECOMPUTE_DAILY_S, [s.device_id for s in SITES], precompute_daily)
 
 
 @app.get("/health")
-def health():
-    return {"status": "ok", "threshold": THRESHOLD, "n_features": len(FEATURES)}
+async def health():
+    return {
+        "status": "ok",
+        "threshold": RISK_THRESHOLD,
+        "climate_threshold": REGISTRY.active.threshold,
+        "n_features": len(REGISTRY.active.features),
+        "model": REGISTRY.info(),
+        "cache": {c.name: c.info() for c in (VC_REALTIME_CACHE, VC_DAILY_CACHE, VC_HISTORY_CACHE, PREDICTION_CACHE)},
+        "telemetry": TELEMETRY.info(),
+        "precompute": PRECOMPUTE.info(),
+        "stream": STREAM.info(),
+        "inference": INFERENCE.info(),
+        # Recorre el directorio y lee cada meta.json: fuera del event loop
+        "archive": await run_in_threadpool(SENSOR_ARCHIVE.info) if SENSOR_ARCHIVE is not None else None,
+    }
+
+
+def _collect_service_metrics() -> List[str]:
+    caches = (VC_REALTIME_CACHE, VC_DAILY_CACHE, VC_HISTORY_CACHE)
+    lines = gauge_lines(
+        "cache_events_total", "Eventos de las cachés de servicios externos.",
+        {(("cache", c.name), ("result", k)): v for c in caches for k, v in c.stats.items()},
+        kind="counter",
+    )
+    lines += gauge_lines(
+        "telemetry_readings_total", "Lecturas del ESP32 recibidas por la telemetría en memoria.",
+        {(("result", k),): v for k, v in TELEMETRY.stats.items()},
+        kind="counter",
+    )
+    lines += gauge_lines(
+        "model_registry_events_total", "Recargas y rollbacks del registro de modelos.",
+        {(("event", k),): v for k, v in REGISTRY.stats.items()},
+        kind="counter",
+    )
+    lines += gauge_lines(
+        "prediction_cache_events_total", "Hits, misses, desalojos e invalidaciones de la caché de predicciones.",
+        {(("result", k),): v for k, v in PREDICTION_CACHE.stats.items()},
+        kind="counter",
+    )
+    lines += gauge_lines(
+        "precompute_events_total", "Corridas del precálculo y requests servidas desde snapshot.",
+        {(("result", k),): v for k, v in PRECOMPUTE.stats.items()},
+        kind="counter",
+    )
+    lines += gauge_lines(
+        "stream_events_total", "Eventos de riesgo publicados, sin cambios, entregados y descartados por clientes lentos.",
+        {(("result", k),): v for k, v in STREAM.stats.items()},
+        kind="counter",
+    )
+    lines += gauge_lines(
+        "inference_events_total", "Requests, filas y lotes del pool de inferencia (inline/fallbacks/errores).",
+        {(("result", k),): v for k, v in INFERENCE.stats.items()},
+        kind="counter",
+    )
+    lines += gauge_lines(
+        "inference_queue_depth", "Filas esperando la ventana de micro-batch y lotes en los workers.",
+        {(("queue", "rows"),): INFERENCE.queued_rows, (("queue", "in_flight_batches"),): INFERENCE.in_flight},
+    )
+    if SENSOR_ARCHIVE is not None:
+        lines += gauge_lines(
+            "archive_events_total", "Lecturas del ESP32 encoladas y escritas en el archivo local.",
+            {(("result", k),): v for k, v in SENSOR_ARCHIVE.stats.items()},
+            kind="counter",
+        )
+    lines += gauge_lines(
+        "prediction_cache_entries", "Entradas en la caché de predicciones.",
+        {(): len(PREDICTION_CACHE)},
+    )
+    return lines
+
+
+register_collector(_collect_service_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto de Prometheus."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _check_admin(request: Request) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Token de administración inválido.")
+
+
+@app.get("/admin/model")
+async def model_info(request: Request):
+    _check_admin(request)
+    return REGISTRY.info()
+
+
+@app.post("/admin/model/reload")
+async def model_reload(request: Request):
+    """Carga y valida artifacts/ en segundo plano y lo activa sin cortar requests en curso."""
+    _check_admin(request)
+    try:
+        return await REGISTRY.reload()
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Modelo nuevo rechazado: {e!r}")
+
+
+@app.post("/admin/model/rollback")
+async def model_rollback(request: Request):
+    _check_admin(request)
+    try:
+        return await REGISTRY.rollback()
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/telemetry/{device_id}")
+async def ingest_telemetry(device_id: str, body: Union[List[Dict[str, Any]], Dict[str, Any]]):
+    """Ingesta de lecturas del ESP32 (un paquete o una lista) al buffer en memoria."""
+    readings = body if isinstance(body, list) else [body]
+    added = TELEMETRY.extend(device_id, readings)
+    return {"device_id": device_id, "ingested": added, "latest": TELEMETRY.latest(device_id)}
 
 
 @app.post("/predict")
-def predict(inp: WeatherInput):
+async def predict(inp: WeatherInput):
+    model = REGISTRY.active
     base = dict(inp.payload or {})
-    esp = get_latest_esp32(inp.device_id) if inp.use_esp32 else {}
+    esp = await get_latest_esp32(inp.device_id) if inp.use_esp32 else {}
     features = merge_features(base, esp)
-    out = run_model(features)
+    out = await run_model(features, model)
 
     climate_probability = out["risk_probability"]
-    water_score = compute_water_score(esp)
+    with timed("water_score"):
+        water_score = compute_water_score(esp, *site_geometry(inp.device_id))
     combined = WEIGHT_WATER * water_score + WEIGHT_CLIMATE * climate_probability
-    label = int(combined >= THRESHOLD)
+    label = int(combined >= RISK_THRESHOLD)
 
     return {
         "features": features,
         "esp32": esp or None,
         "esp32_used": bool(esp),
         "climate_probability": climate_probability,
+        "climate_label": out["risk_label"],
+        "climate_threshold": model.threshold,
         "water_score": water_score,
         "risk_probability": combined,
         "risk_label": label,
-        "threshold": THRESHOLD
+        "threshold": RISK_THRESHOLD
     }
+
+
+# ---------------------- Batch ----------------------
+
+NDJSON = "application/x-ndjson"
+BATCH_MAX_CHUNK = 10000
+
+
+def _parse_batch_item(obj: Any) -> Any:
+    """
+    Acepta {"payload": {...}, ...} o directamente el dict de features.
+    Devuelve el WeatherInput o la excepción, que se reporta en su índice.
+    """
+    if isinstance(obj, Exception):
+        return obj
+    try:
+        if isinstance(obj, dict) and "payload" in obj:
+            return WeatherInput.parse_obj(obj)
+        return WeatherInput(payload=obj)
+    except Exception as e:
+        return e
+
+
+async def _score_batch_chunk(
+    chunk: List[Tuple[int, Any]],
+    esp_cache: Dict[str, Dict[str, Any]],
+    water_cache: Dict[str, float],
+    include_features: bool,
+    model: ModelVersion,
+) -> List[Dict[str, Any]]:
+    """Puntúa un bloque con una sola llamada al modelo; el agua se calcula una vez por device_id."""
+    items: List[Tuple[int, WeatherInput]] = []
+    results: Dict[int, Dict[str, Any]] = {}
+    for index, it in chunk:
+        if isinstance(it, Exception):
+            results[index] = {"index": index, "error": str(it)}
+        else:
+            items.append((index, it))
+
+    for _, it in items:
+        if it.use_esp32 and it.device_id not in water_cache:
+            with timed("water_score"):
+                water_cache[it.device_id] = compute_water_score(esp_cache[it.device_id], *site_geometry(it.device_id))
+
+    esps = [esp_cache[it.device_id] if it.use_esp32 else {} for _, it in items]
+    rows = [merge_features(dict(it.payload or {}), esp) for (_, it), esp in zip(items, esps)]
+    # Alinear miles de filas es trabajo de CPU: en el threadpool, no en el event loop
+    X = await run_in_threadpool(model.engine.align_many, rows)
+    climate = await run_model_batch(rows, model, X, cache=False)
+
+    for k, (index, it) in enumerate(items):
+        esp = esps[k]
+        water_score = water_cache[it.device_id] if esp else 0.0
+        combined = WEIGHT_WATER * water_score + WEIGHT_CLIMATE * float(climate[k])
+        out = {
+            "index": index,
+            "esp32_used": bool(esp),
+            "climate_probability": float(climate[k]),
+            "climate_label": int(climate[k] >= model.threshold),
+            "climate_threshold": model.threshold,
+            "water_score": water_score,
+            "risk_probability": combined,
+            "risk_label": int(combined >= RISK_THRESHOLD),
+            "threshold": RISK_THRESHOLD,
+        }
+        if include_features:
+            out["features"] = rows[k]
+            out["esp32"] = esp or None
+        results[index] = out
+
+    return [results[index] for index, _ in chunk]
+
+
+async def _resolve_batch_esp32(chunk: List[Tuple[int, Any]], esp_cache: Dict[str, Dict[str, Any]]) -> None:
+    """Lecturas ESP32 de los device_id nuevos del bloque, en paralelo y una vez por dispositivo."""
+    devices = {it.device_id for _, it in chunk if isinstance(it, WeatherInput) and it.use_esp32}
+    devices = list(devices - esp_cache.keys())
+    if devices:
+        found = await asyncio.gather(*(get_latest_esp32(d) for d in devices))
+        esp_cache.update(zip(devices, found))
+
+
+async def _iter_ndjson(request: Request) -> AsyncIterator[Any]:
+    buf = b""
+    async for part in request.stream():
+        buf += part
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+    if buf.strip():
+        try:
+            yield json.loads(buf)
+        except ValueError as e:
+            yield e
+
+
+async def _iter_list(objs: List[Any]) -> AsyncIterator[Any]:
+    for obj in objs:
+        yield obj
+
+
+async def _batch_results(
+    source: AsyncIterator[Any], chunk_size: int, include_features: bool, model: ModelVersion
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    esp_cache: Dict[str, Dict[str, Any]] = {}
+    water_cache: Dict[str, float] = {}
+    chunk: List[Tuple[int, Any]] = []
+    index = 0
+    async for obj in source:
+        chunk.append((index, _parse_batch_item(obj)))
+        index += 1
+        if len(chunk) >= chunk_size:
+            await _resolve_batch_esp32(chunk, esp_cache)
+            yield await _score_batch_chunk(chunk, esp_cache, water_cache, include_features, model)
+            chunk = []
+    if chunk:
+        await _resolve_batch_esp32(chunk, esp_cache)
+        yield await _score_batch_chunk(chunk, esp_cache, water_cache, include_features, model)
+
+
+@app.post("/predict_batch")
+async def predict_batch(
+    request: Request,
+    chunk_size: int = Query(default=1000, ge=1, le=BATCH_MAX_CHUNK),
+    include_features: bool = Query(default=False),
+    stream: bool = Query(default=False),
+):
+    """
+    Lote de payloads: JSON {"items": [...]} (o lista) o NDJSON (un item por línea).
+    Se puntúa por bloques de chunk_size mientras se lee la entrada; con
+    stream=true o Accept NDJSON la respuesta sale como NDJSON a medida que
+    termina cada bloque.
+    """
+    stream_out = stream or NDJSON in request.headers.get("accept", "")
+
+    if request.headers.get("content-type", "").startswith(NDJSON):
+        source = _iter_ndjson(request)
+        if stream_out:
+            # StreamingResponse escucha desconexiones leyendo del mismo canal que
+            # el cuerpo, así que la entrada se termina de leer antes de responder.
+            source = _iter_list([obj async for obj in source])
+    else:
+        body = await request.json()
+        objs = body.get("items") if isinstance(body, dict) else body
+        if not isinstance(objs, list):
+            raise HTTPException(status_code=422, detail='Se esperaba {"items": [...]} o una lista de payloads.')
+        source = _iter_list(objs)
+
+    # Todo el lote se puntúa con la versión activa al recibirlo, aunque haya una recarga en medio
+    results = _batch_results(source, chunk_size, include_features, REGISTRY.active)
+
+    if stream_out:
+        async def body_iter():
+            async for block in results:
+                yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in block)
+        return StreamingResponse(body_iter(), media_type=NDJSON)
+
+    predictions: List[Dict[str, Any]] = []
+    async for block in results:
+        predictions.extend(block)
+    return {"predictions": predictions, "n": len(predictions)}
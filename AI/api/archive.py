@@ -0,0 +1,389 @@
+# AI/api/archive.py
+"""
+Archivo local de series de tiempo: append-only, columnar y leído con mmap.
+
+  archive/
+    archive.json                  marca del archivo + formato
+    weather/<sitio>/              una serie por sitio (esp32/<device_id> para el sensor)
+      meta.json                   clave original, columna de grupo y columnas
+      timestamps.f8               índice: segundos epoch UTC, creciente
+      columns/<columna>.f8        float64 de ancho fijo (NaN = faltante)
+
+Los días de Visual Crossing se guardan como la fecha a las 00:00 UTC; las
+lecturas del ESP32 con su timestamp real.
+
+Agregar filas posteriores a la última es un append de 8 bytes por columna.
+Las columnas se escriben antes que el índice, así que el largo del índice es
+el commit: lo que sobre en las columnas (un proceso que murió a mitad de
+camino) se recorta al volver a escribir. Los timestamps ya archivados se
+ignoran (reimportar es idempotente); filas que caen antes del final (un
+rango viejo que faltaba) reescriben la serie ordenada, como save_frame en
+data.py. Un solo proceso escribe cada serie; leer se puede desde cualquiera.
+
+`Series.read(start, end)` ubica el rango con searchsorted sobre el índice y
+devuelve vistas de los memmap, sin copiar.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from api.log import log_event
+
+LOG = logging.getLogger("floodrisk")
+
+FORMAT_VERSION = 1
+MARKER = "archive.json"
+INDEX = "timestamps.f8"
+DTYPE = np.dtype("<f8")
+
+WEATHER = "weather"
+SENSORS = "esp32"
+# Columnas que identifican la serie (mismo orden de preferencia que train.GROUP_COLUMNS)
+GROUP_COLUMNS = ("device_id", "station", "name")
+
+
+def _slug(key: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", key).strip("_") or "_"
+
+
+def to_epoch(value: Any) -> float:
+    """Segundos epoch UTC de un número, fecha ISO, datetime o Timestamp (naive = UTC)."""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    import pandas as pd
+    return pd.Timestamp(value).timestamp()
+
+
+def _map(path: Path, n: int) -> np.ndarray:
+    if n == 0:
+        return np.empty(0, dtype=DTYPE)
+    return np.memmap(path, dtype=DTYPE, mode="r", shape=(n,))
+
+
+def _write_json(path: Path, value: Dict[str, Any]) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(value, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class Series:
+    def __init__(self, path: Path, key: str, group: Optional[str] = None):
+        self.path = path
+        self.key = key
+        self.group = group
+        self.columns: List[str] = []
+        self._maps: Dict[str, np.ndarray] = {}
+        self._mapped = -1      # largo del índice para el que valen los memmap
+        self._repaired = False
+        self._load_meta()
+
+    # ---------------------- Lectura ----------------------
+
+    def _load_meta(self) -> None:
+        meta = self.path / "meta.json"
+        if meta.exists():
+            m = json.loads(meta.read_text(encoding="utf-8"))
+            self.key, self.group, self.columns = m["key"], m.get("group"), list(m["columns"])
+
+    def __len__(self) -> int:
+        index = self.path / INDEX
+        return index.stat().st_size // DTYPE.itemsize if index.exists() else 0
+
+    def _refresh(self) -> int:
+        n = len(self)
+        if n != self._mapped:
+            self._load_meta()
+            self._maps = {}
+            self._mapped = n
+        return n
+
+    def _get(self, name: str, path: Path) -> np.ndarray:
+        n = self._refresh()
+        arr = self._maps.get(name)
+        if arr is None:
+            arr = self._maps[name] = _map(path, n)
+        return arr
+
+    def timestamps(self) -> np.ndarray:
+        return self._get(INDEX, self.path / INDEX)
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self.columns:
+            return np.full(self._refresh(), np.nan)
+        return self._get(name, self.path / "columns" / f"{name}.f8")
+
+    def bounds(self, start: Any = None, end: Any = None) -> slice:
+        """Filas con start <= ts <= end (extremos opcionales)."""
+        ts = self.timestamps()
+        i = 0 if start is None else int(np.searchsorted(ts, to_epoch(start), "left"))
+        j = len(ts) if end is None else int(np.searchsorted(ts, to_epoch(end), "right"))
+        return slice(i, max(i, j))
+
+    def read(self, start: Any = None, end: Any = None, columns: Optional[Sequence[str]] = None,
+             lookback: int = 0) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        (timestamps, {columna: valores}) del rango pedido, como vistas de solo lectura.
+        `lookback` suma esa cantidad de filas anteriores a start (historia para lags/rolling).
+        """
+        rows = self.bounds(start, end)
+        rows = slice(max(0, rows.start - lookback), rows.stop)
+        return self.timestamps()[rows], {name: self.column(name)[rows]
+                                         for name in (self.columns if columns is None else columns)}
+
+    def last_ts(self) -> Optional[float]:
+        ts = self.timestamps()
+        return float(ts[-1]) if len(ts) else None
+
+    # ---------------------- Escritura ----------------------
+
+    def _write_meta(self) -> None:
+        _write_json(self.path / "meta.json", {"key": self.key, "group": self.group, "columns": self.columns})
+
+    def _repair(self, n: int) -> None:
+        """Recorta (o completa con NaN) cada columna al largo comprometido del índice."""
+        for name in self.columns:
+            path = self.path / "columns" / f"{name}.f8"
+            size = path.stat().st_size if path.exists() else 0
+            if size > n * DTYPE.itemsize:
+                os.truncate(path, n * DTYPE.itemsize)
+            elif size < n * DTYPE.itemsize:
+                with open(path, "ab") as f:
+                    f.write(np.full(n - size // DTYPE.itemsize, np.nan, dtype=DTYPE).tobytes())
+        self._repaired = True
+
+    def append(self, ts: Iterable[float], values: Dict[str, Any]) -> int:
+        """
+        Agrega filas (ts en segundos epoch; columnas faltantes = NaN, columnas
+        nuevas se crean con NaN hacia atrás). Devuelve cuántas filas se agregaron.
+        """
+        ts = np.asarray(ts, dtype=DTYPE).ravel()
+        if not len(ts):
+            return 0
+        values = {k: np.broadcast_to(np.asarray(v, dtype=DTYPE), ts.shape) for k, v in values.items()}
+        ts, first = np.unique(ts, return_index=True)  # ordena y deja la primera de cada ts
+        values = {k: v[first] for k, v in values.items()}
+
+        existing = self.timestamps()
+        n = len(existing)
+        if not n or ts[0] > existing[-1]:
+            fresh = np.ones(len(ts), dtype=bool)
+        else:
+            at = np.searchsorted(existing, ts)
+            fresh = (at == n) | (existing[np.minimum(at, n - 1)] != ts)
+        if not fresh.any():
+            return 0
+        ts, values = ts[fresh], {k: v[fresh] for k, v in values.items()}
+        if n and ts[0] <= existing[-1]:
+            return self._rewrite(ts, values)
+
+        self.path.joinpath("columns").mkdir(parents=True, exist_ok=True)
+        if not self._repaired:
+            self._repair(n)
+        added = [k for k in values if k not in self.columns]
+        if added or not (self.path / "meta.json").exists():
+            for name in added:
+                (self.path / "columns" / f"{name}.f8").write_bytes(np.full(n, np.nan, dtype=DTYPE).tobytes())
+            self.columns += added
+            self._write_meta()
+        for name in self.columns:
+            col = values.get(name)
+            with open(self.path / "columns" / f"{name}.f8", "ab") as f:
+                f.write((np.full(len(ts), np.nan, dtype=DTYPE) if col is None else col).tobytes())
+        with open(self.path / INDEX, "ab") as f:
+            f.write(ts.tobytes())
+        return len(ts)
+
+    def _rewrite(self, ts: np.ndarray, values: Dict[str, np.ndarray]) -> int:
+        """Fusiona filas anteriores al final: reescribe la serie completa ordenada."""
+        old_ts, old = self.read()
+        columns = self.columns + [k for k in values if k not in self.columns]
+        all_ts = np.concatenate([old_ts, ts])
+        order = np.argsort(all_ts, kind="stable")
+
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        (tmp / "columns").mkdir(parents=True)
+        for name in columns:
+            a = old.get(name, np.full(len(all_ts) - len(ts), np.nan))
+            b = values.get(name, np.full(len(ts), np.nan))
+            (tmp / "columns" / f"{name}.f8").write_bytes(np.concatenate([a, b])[order].astype(DTYPE).tobytes())
+        (tmp / INDEX).write_bytes(all_ts[order].astype(DTYPE).tobytes())
+        _write_json(tmp / "meta.json", {"key": self.key, "group": self.group, "columns": columns})
+
+        self._maps, self._mapped = {}, -1
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp, self.path)
+        self._load_meta()
+        self._repaired = True
+        return len(ts)
+
+    def info(self) -> Dict[str, Any]:
+        ts = self.timestamps()
+        return {
+            "rows": len(ts),
+            "first_ts": float(ts[0]) if len(ts) else None,
+            "last_ts": float(ts[-1]) if len(ts) else None,
+            "columns": len(self.columns),
+        }
+
+
+class Archive:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._series: Dict[Tuple[str, str], Series] = {}
+
+    @staticmethod
+    def is_archive(path: Path) -> bool:
+        return (Path(path) / MARKER).is_file()
+
+    def series(self, kind: str, key: str, group: Optional[str] = None) -> Series:
+        """Serie `kind`/`key` (se crea en disco con el primer append)."""
+        s = self._series.get((kind, key))
+        if s is None:
+            if not self.is_archive(self.root):
+                self.root.mkdir(parents=True, exist_ok=True)
+                _write_json(self.root / MARKER, {"format": FORMAT_VERSION})
+            s = self._series[(kind, key)] = Series(self.root / kind / _slug(key), key, group)
+        return s
+
+    def keys(self, kind: str) -> List[str]:
+        base = self.root / kind
+        if not base.is_dir():
+            return []
+        metas = sorted(base.glob("*/meta.json"))
+        return [json.loads(m.read_text(encoding="utf-8"))["key"] for m in metas]
+
+    def state(self) -> List[Tuple[str, str, int, Optional[float], List[str]]]:
+        """(kind, key, filas, último ts, columnas) de cada serie: identifica el contenido (append-only)."""
+        out = []
+        for kind in sorted(p.name for p in self.root.iterdir() if p.is_dir()):
+            for key in self.keys(kind):
+                s = self.series(kind, key)
+                out.append((kind, key, len(s), s.last_ts(), list(s.columns)))
+        return out
+
+    def info(self) -> Dict[str, Any]:
+        return {f"{kind}:{key}": self.series(kind, key).info() for kind, key, *_ in self.state()}
+
+
+# ---------------------- DataFrames (entrenamiento, backfill, importación) ----------------------
+
+def append_frame(archive: Archive, df, kind: str = WEATHER, default_key: str = "default") -> Dict[str, int]:
+    """Agrega las columnas numéricas de un DataFrame (una serie por estación/dispositivo)."""
+    import pandas as pd
+
+    group = next((c for c in GROUP_COLUMNS if c in df.columns), None)
+    ts = pd.to_datetime(df["datetime"]).to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+    numeric = [c for c in df.columns
+               if c not in GROUP_COLUMNS and c != "datetime"
+               and pd.api.types.is_numeric_dtype(df[c]) and not isinstance(df[c].dtype, pd.CategoricalDtype)]
+    keys = df[group].astype(str).to_numpy() if group else np.full(len(df), default_key)
+    added = {}
+    for key in pd.unique(keys):
+        mask = keys == key
+        s = archive.series(kind, key, group)
+        added[key] = s.append(ts[mask], {c: df[c].to_numpy(dtype=np.float64)[mask] for c in numeric})
+    return added
+
+
+def iter_frames(archive: Archive, kind: str = WEATHER, start: Any = None, end: Any = None,
+                lookback: int = 0, chunk_rows: Optional[int] = None) -> Iterator[Any]:
+    """
+    DataFrames (columna de grupo, datetime y columnas) serie por serie, en
+    orden cronológico y en bloques de a lo sumo `chunk_rows` filas.
+    """
+    import pandas as pd
+
+    for key in archive.keys(kind):
+        s = archive.series(kind, key)
+        ts, data = s.read(start, end, lookback=lookback)
+        step = chunk_rows or max(len(ts), 1)
+        for i in range(0, len(ts), step):
+            cols = {s.group or "name": np.full(len(ts[i:i + step]), key, dtype=object),
+                    "datetime": pd.to_datetime(ts[i:i + step], unit="s")}
+            cols.update((c, v[i:i + step]) for c, v in data.items())
+            yield pd.DataFrame(cols, copy=False)
+
+
+def read_frame(archive: Archive, kind: str = WEATHER, start: Any = None, end: Any = None, lookback: int = 0):
+    import pandas as pd
+
+    frames = list(iter_frames(archive, kind, start, end, lookback))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# ---------------------- Lecturas del ESP32 (API) ----------------------
+
+class SensorArchiver:
+    """
+    Guarda en el archivo cada lectura nueva de la telemetría en memoria. Las
+    lecturas se juntan en memoria y se escriben cada `flush_s` en un hilo,
+    para no hacer I/O de disco en el event loop.
+    """
+
+    def __init__(self, archive: Archive, fields: Sequence[str], flush_s: float = 5.0):
+        self.archive = archive
+        self.fields = list(fields)
+        self.flush_s = flush_s
+        self._pending: Dict[str, List[Tuple[float, List[float]]]] = {}
+        self.stats = {"queued": 0, "written": 0, "flushes": 0, "errors": 0}
+
+    def record(self, device_id: str, ts: float, reading: Dict[str, Any]) -> None:
+        row = [np.nan if reading.get(f) is None else float(reading[f]) for f in self.fields]
+        self._pending.setdefault(device_id, []).append((ts, row))
+        self.stats["queued"] += 1
+
+    def write(self, batch: Dict[str, List[Tuple[float, List[float]]]]) -> int:
+        written = 0
+        for device_id, rows in batch.items():
+            ts = np.array([t for t, _ in rows])
+            values = np.array([r for _, r in rows], dtype=np.float64).reshape(len(rows), len(self.fields))
+            written += self.archive.series(SENSORS, device_id, "device_id").append(
+                ts, {f: values[:, i] for i, f in enumerate(self.fields)})
+        return written
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            self.stats["written"] += await asyncio.to_thread(self.write, batch)
+            self.stats["flushes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            log_event(LOG, "archive_write_failed", logging.WARNING, error=repr(e))
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.flush_s)
+                await self.flush()
+        finally:
+            # Al apagar (cancelación) se escribe lo que quedó pendiente
+            batch, self._pending = self._pending, {}
+            if batch:
+                self.write(batch)
+
+    def restore(self, device_id: str, n: int) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """Últimas n lecturas archivadas del dispositivo (ts, lectura), en orden."""
+        if device_id not in self.archive.keys(SENSORS):
+            return
+        ts, data = self.archive.series(SENSORS, device_id).read(columns=self.fields)
+        for i in range(max(0, len(ts) - n), len(ts)):
+            yield float(ts[i]), {f: float(data[f][i]) for f in self.fields}
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "root": str(self.archive.root),
+            "flush_s": self.flush_s,
+            "pending": sum(len(v) for v in self._pending.values()),
+            "series": self.archive.info() if self.archive.is_archive(self.archive.root) else {},
+            **self.stats,
+        }
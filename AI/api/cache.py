@@ -0,0 +1,200 @@
+# AI/api/cache.py
+"""
+Cachés en proceso.
+
+`TTLCache`: llamadas a servicios externos (asyncio).
+- Hit: la entrada tiene menos de `ttl` segundos.
+- Stale-while-revalidate: entre `ttl` y `ttl + stale_ttl` se devuelve el
+  valor viejo y se refresca en segundo plano.
+- Single-flight: si varias requests fallan a la vez para la misma clave,
+  solo una llama al upstream y el resto espera su resultado.
+
+`PredictionCache`: probabilidades del modelo (sync, LRU + TTL). La clave es
+el hash del vector de FEATURES alineado; solo las columnas con `resolution`
+(lecturas del sensor) se cuantizan para absorber su ruido, el resto va exacto.
+Si cambia la versión del modelo se vacía entera.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 256):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._flights: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "errors": 0}
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                if key not in self._flights:
+                    self.stats["refreshes"] += 1
+                    task = self._start(key, fetch)
+                    # Nadie espera el refresco: se consume el error para no ensuciar el log
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                return entry[1]
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.stats["misses"] += 1
+            flight = self._start(key, fetch)
+        else:
+            self.stats["coalesced"] += 1
+        # shield: si un cliente cancela, el fetch compartido sigue para los demás
+        return await asyncio.shield(flight)
+
+    def _start(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> "asyncio.Future[Any]":
+        task = asyncio.ensure_future(self._run(key, fetch))
+        self._flights[key] = task
+        return task
+
+    async def _run(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        else:
+            self._entries[key] = (time.monotonic(), value)
+            if len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            return value
+        finally:
+            self._flights.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def info(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "ttl_s": self.ttl, "stale_ttl_s": self.stale_ttl, **self.stats}
+
+
+class PredictionCache:
+    def __init__(self, name: str, max_entries: int = 4096, ttl: float = 3600.0,
+                 resolution: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Paso de cuantización por feature (p.ej. {"distance_cm": 0.1}); las demás, exactas
+        self.resolution = {k: float(v) for k, v in (resolution or {}).items() if v > 0}
+        self.version: Any = None
+        self._entries: "OrderedDict[bytes, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def keys(self, X: np.ndarray, features: Optional[Sequence[str]] = None) -> List[bytes]:
+        """
+        Una clave por fila (columnas en el orden de `features`). NaN (sin dato)
+        se conserva y -0.0 se normaliza a 0.0.
+        """
+        Xq = np.array(np.atleast_2d(X), dtype=np.float64)
+        if features is not None and self.resolution:
+            step = np.array([self.resolution.get(f, 0.0) for f in features])
+            cols = np.flatnonzero(step)
+            Xq[:, cols] = np.round(Xq[:, cols] / step[cols]) * step[cols]
+        Xq += 0.0
+        return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in Xq]
+
+    def _check_version(self, version: Any) -> None:
+        if version != self.version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+                self._entries.clear()
+            self.version = version
+
+    def _lookup(self, X: np.ndarray, version: Any,
+                features: Optional[Sequence[str]]) -> Tuple[List[bytes], np.ndarray, List[int], float]:
+        keys = self.keys(X, features)
+        out = np.empty(len(keys))
+        missing: List[int] = []
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] >= self.ttl:
+                    del self._entries[key]
+                    self.stats["expirations"] += 1
+                    entry = None
+                if entry is None:
+                    missing.append(i)
+                    continue
+                self._entries.move_to_end(key)
+                out[i] = entry[1]
+            self.stats["hits"] += len(keys) - len(missing)
+            self.stats["misses"] += len(missing)
+        return keys, out, missing, now
+
+    def _store(self, keys: List[bytes], out: np.ndarray, missing: List[int], now: float, version: Any) -> None:
+        with self._lock:
+            # Un reload durante el predict no debe guardar resultados del modelo viejo
+            if version != self.version:
+                return
+            for i in missing:
+                self._entries[keys[i]] = (now, float(out[i]))
+                self._entries.move_to_end(keys[i])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def predict(self, X: np.ndarray, version: Any, predict: Callable[[np.ndarray], np.ndarray],
+                features: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        Probabilidades para la matriz alineada X; solo las filas sin entrada
+        vigente pasan por `predict` (una única llamada vectorizada).
+        """
+        X = np.atleast_2d(X)
+        if self.max_entries <= 0:
+            return predict(X)
+        keys, out, missing, now = self._lookup(X, version, features)
+        if missing:
+            out[missing] = predict(X[missing])
+            self._store(keys, out, missing, now, version)
+        return out
+
+    async def predict_async(self, X: np.ndarray, version: Any,
+                            predict: Callable[[np.ndarray], Awaitable[np.ndarray]],
+                            features: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Igual que `predict` con un `predict` async (p.ej. InferenceExecutor)."""
+        X = np.atleast_2d(X)
+        if self.max_entries <= 0:
+            return await predict(X)
+        keys, out, missing, now = self._lookup(X, version, features)
+        if missing:
+            out[missing] = await predict(X[missing])
+            self._store(keys, out, missing, now, version)
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "resolution": self.resolution,
+            "version": self.version,
+            **self.stats,
+        }
@@ -0,0 +1,342 @@
+# AI/api/compiled.py
+"""
+Predictor "compilado" para el pipeline de train.py.
+
+Extrae de model.pkl (ColumnTransformer -> SimpleImputer -> StandardScaler ->
+RandomForestClassifier) las medianas, escalas y los nodos de todos los árboles
+a buffers planos de NumPy, y evalúa vectores ya alineados a FEATURES sin pasar
+por pandas ni por la maquinaria de sklearn en cada request.
+
+`save`/`load` guardan esos buffers como .npy en artifacts/compiled/<versión>/ junto a un
+manifest.json (versión + hash de feature_names.json y de model.pkl). La API los abre con
+mmap_mode="r": no hace falta importar sklearn ni deserializar el pickle, y
+todos los workers comparten la misma copia en el page cache.
+"""
+import argparse, datetime, hashlib, json, os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+FORMAT_VERSION = 1
+COMPILED_DIR = "compiled"
+MANIFEST = "manifest.json"
+ARRAYS = ("medians", "scale", "keep", "left", "right", "feature", "threshold", "leaf_proba", "roots")
+# Índices de nodos/columnas: int32 alcanza y reduce el artefacto a la mitad
+INDEX_ARRAYS = ("keep", "left", "right", "feature", "roots")
+# Filas por bloque en predict_proba: la memoria del recorrido es O(bloque x árboles)
+BLOCK_ROWS = 1024
+
+
+def features_hash(features: Sequence[str]) -> str:
+    return hashlib.sha256(json.dumps(list(features), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _coerce(v: Any) -> float:
+    """Equivalente escalar de pd.to_numeric(errors='coerce')."""
+    if v is None:
+        return np.nan
+    if isinstance(v, (bool, int, float, np.integer, np.floating)):
+        return float(v)
+    try:
+        return float(str(v).strip())
+    except Exception:
+        return np.nan
+
+
+class CompiledPipeline:
+    def __init__(
+        self,
+        features: Sequence[str],
+        medians: np.ndarray,
+        scale: np.ndarray,
+        keep: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        leaf_proba: np.ndarray,
+        roots: np.ndarray,
+        depth: int,
+        version: Optional[str] = None,
+    ):
+        self.features = list(features)
+        self.index = {name: i for i, name in enumerate(self.features)}
+        self.medians = medians
+        self.scale = scale
+        self.keep = keep
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.depth = depth
+        self.n_trees = len(roots)
+        self.version = version
+
+    # ---------------------- Construcción ----------------------
+
+    @classmethod
+    def from_pipeline(cls, pipe, features: Sequence[str]) -> "CompiledPipeline":
+        pre = pipe.named_steps["pre"]
+        clf = pipe.named_steps["clf"]
+        num = pre.named_transformers_["num"]
+        imp = num.named_steps["imp"]
+        scaler = num.named_steps["scaler"]
+
+        # SimpleImputer descarta columnas sin valores en entrenamiento; los
+        # índices de los árboles se refieren a las columnas que sobreviven.
+        stats = np.asarray(imp.statistics_, dtype=np.float64)
+        if getattr(imp, "keep_empty_features", False):
+            keep = np.arange(len(stats))
+            stats = np.where(np.isnan(stats), 0.0, stats)
+        else:
+            keep = np.flatnonzero(~np.isnan(stats))
+        medians = stats[keep]
+        scale = getattr(scaler, "scale_", None)
+        scale = np.ones(len(keep)) if scale is None else np.asarray(scale, dtype=np.float64)
+
+        # Regresor (modelo destilado de compact.py): el valor del nodo ya es la probabilidad
+        pos = list(clf.classes_).index(1) if hasattr(clf, "classes_") else None
+        lefts, rights, feats, thrs, probas, roots = [], [], [], [], [], []
+        offset, depth = 0, 0
+        for est in clf.estimators_:
+            t = est.tree_
+            n = t.node_count
+            ids = np.arange(n, dtype=np.int64) + offset
+            is_leaf = t.children_left == -1
+            # Las hojas apuntan a sí mismas (umbral inf): un paso que no mueve
+            # el nodo marca que ese (fila, árbol) ya terminó.
+            lefts.append(np.where(is_leaf, ids, t.children_left + offset))
+            rights.append(np.where(is_leaf, ids, t.children_right + offset))
+            feats.append(np.where(is_leaf, 0, t.feature).astype(np.int64))
+            thrs.append(np.where(is_leaf, np.inf, t.threshold))
+            value = t.value[:, 0, :]
+            probas.append(value[:, pos] / value.sum(axis=1) if pos is not None else np.clip(value[:, 0], 0.0, 1.0))
+            roots.append(offset)
+            offset += n
+            depth = max(depth, t.max_depth)
+
+        return cls(
+            features=features,
+            medians=medians,
+            scale=scale,
+            keep=keep,
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            feature=np.concatenate(feats),
+            threshold=np.concatenate(thrs),
+            leaf_proba=np.concatenate(probas),
+            roots=np.asarray(roots, dtype=np.int64),
+            depth=int(depth),
+        )
+
+    def compact(self, n_trees: Optional[int] = None, max_depth: Optional[int] = None) -> "CompiledPipeline":
+        """
+        Sub-ensamble con los primeros `n_trees` árboles, podado a `max_depth`:
+        los nodos a esa profundidad pasan a ser hojas con la probabilidad del
+        nodo (leaf_proba existe para todos los nodos) y los de abajo se eliminan.
+        """
+        n_trees = self.n_trees if n_trees is None else min(n_trees, self.n_trees)
+        depth = self.depth if max_depth is None else min(max_depth, self.depth)
+        n_nodes = int(self.roots[n_trees]) if n_trees < self.n_trees else len(self.left)
+        left, right = np.asarray(self.left[:n_nodes]), np.asarray(self.right[:n_nodes])
+        ids = np.arange(n_nodes)
+
+        # Profundidad de cada nodo, nivel por nivel (-1 = inalcanzable)
+        level = np.full(n_nodes, -1, dtype=np.int64)
+        frontier = np.asarray(self.roots[:n_trees], dtype=np.int64)
+        for d in range(depth + 1):
+            level[frontier] = d
+            inner = frontier[left[frontier] != frontier]
+            frontier = np.concatenate([left[inner], right[inner]])
+
+        kept = np.flatnonzero(level >= 0)
+        remap = np.full(n_nodes, -1, dtype=np.int64)
+        remap[kept] = np.arange(len(kept))
+        cut = level[kept] == depth
+        new_ids = remap[kept]
+        return CompiledPipeline(
+            features=self.features,
+            medians=self.medians,
+            scale=self.scale,
+            keep=self.keep,
+            left=np.where(cut, new_ids, remap[left[kept]]),
+            right=np.where(cut, new_ids, remap[right[kept]]),
+            feature=np.where(cut, 0, np.asarray(self.feature[:n_nodes])[kept]),
+            threshold=np.where(cut, np.inf, np.asarray(self.threshold[:n_nodes])[kept]),
+            leaf_proba=np.asarray(self.leaf_proba[:n_nodes])[kept],
+            roots=remap[np.asarray(self.roots[:n_trees])],
+            depth=int(depth),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Tamaño de los arrays tal como los escribe `save` (índices en int32)."""
+        return sum(getattr(self, name).size * (4 if name in INDEX_ARRAYS else 8) for name in ARRAYS)
+
+    # ---------------------- Artefacto ----------------------
+
+    def save(self, out_dir: Path, source: Optional[str] = None, model_path: Optional[Path] = None) -> Dict[str, Any]:
+        """
+        Escribe out_dir/compiled/<versión>/*.npy y out_dir/manifest.json; devuelve el manifest.
+        Cada versión va en su propio directorio y el manifest se reemplaza al final
+        (os.replace): los workers que tienen mapeada la versión anterior no la ven cambiar.
+        `model_path`: el model.pkl del que sale; su sha256 queda en el manifest (ver `load`).
+        """
+        out_dir = Path(out_dir)
+        digest = hashlib.sha256(features_hash(self.features).encode("ascii"))
+        arrays: Dict[str, np.ndarray] = {}
+        for name in ARRAYS:
+            arr = np.ascontiguousarray(getattr(self, name))
+            if name in INDEX_ARRAYS:
+                if len(self.left) >= np.iinfo(np.int32).max:
+                    raise ValueError("Demasiados nodos para índices int32.")
+                arr = arr.astype(np.int32)
+            digest.update(arr.tobytes())
+            arrays[name] = arr
+        version = digest.hexdigest()[:16]
+
+        version_dir = out_dir / COMPILED_DIR / version
+        if not version_dir.exists():
+            tmp_dir = out_dir / COMPILED_DIR / f".{version}.tmp"
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+            for name, arr in arrays.items():
+                np.save(tmp_dir / f"{name}.npy", arr)
+            os.replace(tmp_dir, version_dir)
+
+        manifest = {
+            "format": "compiled-forest",
+            "format_version": FORMAT_VERSION,
+            "version": version,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "source": source,
+            "features_sha256": features_hash(self.features),
+            "model_sha256": file_sha256(model_path) if model_path is not None else None,
+            "n_features": len(self.features),
+            "n_trees": self.n_trees,
+            "n_nodes": int(len(self.left)),
+            "depth": self.depth,
+            "arrays": {
+                name: {"file": f"{COMPILED_DIR}/{version}/{name}.npy", "dtype": str(arr.dtype), "shape": list(arr.shape)}
+                for name, arr in arrays.items()
+            },
+        }
+        tmp = out_dir / f"{MANIFEST}.tmp"
+        tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, out_dir / MANIFEST)
+        self.version = version
+        return manifest
+
+    @classmethod
+    def load(cls, art_dir: Path, mmap: bool = True) -> "CompiledPipeline":
+        """
+        Abre el artefacto de `save` (con mmap de solo lectura por defecto).
+        ValueError si el formato o el hash de feature_names.json no coinciden, o si
+        el model.pkl de art_dir ya no es el que se compiló (manifest sin regenerar).
+        """
+        art_dir = Path(art_dir)
+        manifest = json.loads((art_dir / MANIFEST).read_text(encoding="utf-8"))
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Formato de artefacto no soportado: {manifest.get('format_version')}")
+        features = json.loads((art_dir / "feature_names.json").read_text(encoding="utf-8"))
+        if features_hash(features) != manifest.get("features_sha256"):
+            raise ValueError("feature_names.json no coincide con el manifest del modelo compilado.")
+        model_sha = manifest.get("model_sha256")
+        if model_sha and (art_dir / "model.pkl").exists() and file_sha256(art_dir / "model.pkl") != model_sha:
+            raise ValueError("model.pkl cambió y el manifest del modelo compilado no se regeneró.")
+
+        mode = "r" if mmap else None
+        arrays = {name: np.load(art_dir / manifest["arrays"][name]["file"], mmap_mode=mode) for name in ARRAYS}
+        return cls(features=features, depth=int(manifest["depth"]), version=manifest["version"], **arrays)
+
+    # ---------------------- Alineación ----------------------
+
+    def align(self, features: Dict[str, Any]) -> np.ndarray:
+        """dict de features -> vector float64 en el orden de FEATURES (NaN si falta)."""
+        x = np.full(len(self.features), np.nan)
+        index = self.index
+        for k, v in (features or {}).items():
+            i = index.get(k)
+            if i is not None:
+                x[i] = _coerce(v)
+        return x
+
+    def align_many(self, rows: Iterable[Dict[str, Any]]) -> np.ndarray:
+        rows = list(rows)
+        X = np.full((len(rows), len(self.features)), np.nan)
+        index = self.index
+        for r, features in enumerate(rows):
+            for k, v in (features or {}).items():
+                i = index.get(k)
+                if i is not None:
+                    X[r, i] = _coerce(v)
+        return X
+
+    # ---------------------- Scoring ----------------------
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Imputación por mediana + escalado, igual que el ColumnTransformer."""
+        X = np.asarray(X, dtype=np.float64)[:, self.keep]
+        X = np.where(np.isnan(X), self.medians, X) / self.scale
+        # Los árboles de sklearn comparan en float32.
+        return X.astype(np.float32)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidad de la clase positiva para una matriz alineada (n, len(FEATURES))."""
+        Xt = self.transform(np.atleast_2d(X))
+        out = np.empty(len(Xt))
+        for start in range(0, len(Xt), BLOCK_ROWS):
+            out[start:start + BLOCK_ROWS] = self._walk(Xt[start:start + BLOCK_ROWS])
+        return out
+
+    def _walk(self, Xt: np.ndarray) -> np.ndarray:
+        """
+        Recorre todos los árboles para un bloque de filas. Solo avanzan los pares
+        (fila, árbol) que no llegaron a una hoja, así el trabajo es la suma de los
+        largos de camino y no filas x árboles x profundidad máxima.
+        """
+        n, n_trees = len(Xt), self.n_trees
+        nodes = np.tile(np.asarray(self.roots, dtype=np.int64), n)
+        rows = np.repeat(np.arange(n), n_trees)
+        active = np.arange(n * n_trees)
+        while active.size:
+            current = nodes[active]
+            go_left = Xt[rows[active], self.feature[current]] <= self.threshold[current]
+            nxt = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = nxt
+            active = active[nxt != current]
+        return self.leaf_proba[nodes].reshape(n, n_trees).mean(axis=1)
+
+    def predict_one(self, features: Dict[str, Any]) -> float:
+        return float(self.predict_proba(self.align(features)[None, :])[0])
+
+
+# ---------------------- Exportación ----------------------
+
+def main():
+    import joblib
+
+    # La paridad contra pipe.predict_proba se verifica en tests/test_compiled.py
+    ap = argparse.ArgumentParser(description="Exporta model.pkl a compiled/ + manifest.json")
+    ap.add_argument("--model", default="artifacts/model.pkl")
+    ap.add_argument("--features", default="artifacts/feature_names.json")
+    args = ap.parse_args()
+
+    features: List[str] = json.loads(Path(args.features).read_text(encoding="utf-8"))
+    compiled = CompiledPipeline.from_pipeline(joblib.load(args.model), features)
+    manifest = compiled.save(Path(args.features).parent, source=Path(args.model).name, model_path=Path(args.model))
+    print(json.dumps({"version": manifest["version"], "trees": compiled.n_trees}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# AI/api/inference.py
+"""
+Inferencia fuera del event loop, en procesos.
+
+Cada worker abre su propia copia del modelo (el artefacto compilado con mmap,
+así que las páginas de los árboles se comparten entre procesos). Las
+predicciones que llegan dentro de `window_ms` se juntan en una sola matriz
+(micro-batch), se puntúan en un worker y cada handler recibe sus filas.
+
+El worker recibe la versión del modelo que tomó el handler y guarda las
+últimas versiones que usó. Una versión desconocida se busca en artifacts/ a
+lo sumo una vez por worker; si tampoco está ahí (rollback a una versión que
+ya no está en disco) el worker devuelve None y el lote se reenvía junto con
+el modelo, que el worker guarda para los lotes siguientes. Sin pool
+(INFERENCE_WORKERS=0 o antes de `start`) todo se puntúa en línea.
+"""
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from api.log import log_event
+from api.registry import COMPILED_MAX_ROWS, ModelVersion, load_version
+
+LOG = logging.getLogger("floodrisk")
+
+# Estado de cada worker
+_WORKER: Dict[str, Any] = {}
+# Versiones que guarda cada worker (la activa + las de un rollback reciente)
+WORKER_MODELS = 4
+
+
+def _keep(model: ModelVersion) -> None:
+    models: "OrderedDict[str, ModelVersion]" = _WORKER["models"]
+    models[model.version] = model
+    models.move_to_end(model.version)
+    while len(models) > WORKER_MODELS:
+        models.popitem(last=False)
+
+
+def _init_worker(art_dir: str, model_format: str) -> None:
+    _WORKER.update(art_dir=Path(art_dir), model_format=model_format, models=OrderedDict(), looked_up=set())
+    _keep(load_version(_WORKER["art_dir"], model_format))
+
+
+def _score(version: str, X: np.ndarray, model: Optional[ModelVersion] = None) -> Optional[np.ndarray]:
+    """Probabilidades con la versión pedida, o None si el worker no la tiene (hay que mandarla)."""
+    if model is not None:
+        _keep(model)
+    found = _WORKER["models"].get(version)
+    if found is None and version not in _WORKER["looked_up"]:
+        # A lo sumo una lectura de artifacts/ por versión desconocida
+        _WORKER["looked_up"].add(version)
+        _keep(load_version(_WORKER["art_dir"], _WORKER["model_format"]))
+        found = _WORKER["models"].get(version)
+    if found is None:
+        return None
+    _WORKER["models"].move_to_end(version)
+    return found.predict_proba(X)
+
+
+class _Batch:
+    def __init__(self, model: ModelVersion):
+        self.model = model
+        self.items: List[Tuple[np.ndarray, "asyncio.Future[np.ndarray]"]] = []
+        self.rows = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class InferenceExecutor:
+    def __init__(self, art_dir: Path, model_format: str = "compiled", workers: int = 2,
+                 window_ms: float = 2.0, max_batch: int = 512):
+        self.art_dir = Path(art_dir)
+        self.model_format = model_format
+        self.workers = workers
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, _Batch] = {}
+        # El event loop solo guarda referencias débiles a las tareas: los lotes en curso viven aquí
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self.queued_rows = 0
+        self.in_flight = 0
+        self.stats = {"requests": 0, "rows": 0, "batches": 0, "inline": 0, "shipped": 0, "fallbacks": 0, "errors": 0}
+
+    def start(self) -> None:
+        if self.workers <= 0 or self._pool is not None:
+            return
+        # spawn: el servidor ya tiene hilos (threadpool, logging) y fork los copiaría a medio estado
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(str(self.art_dir), self.model_format),
+        )
+
+    def close(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def predict(self, model: ModelVersion, X: np.ndarray) -> np.ndarray:
+        """Probabilidades para la matriz alineada X con el modelo `model`."""
+        X = np.atleast_2d(X)
+        self.stats["requests"] += 1
+        if self._pool is None or not len(X):
+            self.stats["inline"] += 1
+            if len(X) > COMPILED_MAX_ROWS:
+                # Lote grande (p.ej. /predict_batch): sklearn en un hilo, fuera del event loop
+                return await asyncio.to_thread(model.predict_proba, X)
+            return model.predict_proba(X)
+
+        loop = asyncio.get_running_loop()
+        fut: "asyncio.Future[np.ndarray]" = loop.create_future()
+        batch = self._pending.get(model.version)
+        if batch is None:
+            batch = self._pending[model.version] = _Batch(model)
+            batch.timer = loop.call_later(self.window_s, self._flush, model.version)
+        batch.items.append((X, fut))
+        batch.rows += len(X)
+        self.queued_rows += len(X)
+        if batch.rows >= self.max_batch:
+            self._flush(model.version)
+        return await fut
+
+    def _flush(self, version: str) -> None:
+        batch = self._pending.pop(version, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self.queued_rows -= batch.rows
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        X = np.vstack([x for x, _ in batch.items])
+        self.in_flight += 1
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(X)
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                proba = await loop.run_in_executor(self._pool, _score, batch.model.version, X)
+                if proba is None:
+                    # El worker no tiene esta versión (rollback): se le manda el modelo una vez
+                    self.stats["shipped"] += 1
+                    proba = await loop.run_in_executor(self._pool, _score, batch.model.version, X, batch.model)
+            except Exception as e:
+                # Pool roto o cerrado: no se pierde la request, se puntúa acá
+                self.stats["errors"] += 1
+                log_event(LOG, "inference_worker_error", logging.WARNING, error=repr(e))
+                if isinstance(e, BrokenProcessPool) and self._pool is not None:
+                    # Un worker murió (p.ej. OOM): pool nuevo para los próximos lotes
+                    self.close()
+                    self.start()
+                proba = None
+            if proba is None:
+                self.stats["fallbacks"] += 1
+                proba = await asyncio.to_thread(batch.model.predict_proba, X)
+        except Exception as e:
+            for _, fut in batch.items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+
+        offset = 0
+        for x, fut in batch.items:
+            if not fut.done():
+                fut.set_result(proba[offset: offset + len(x)])
+            offset += len(x)
+
+    def info(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        return {
+            "workers": self.workers if self._pool is not None else 0,
+            "window_ms": self.window_s * 1000.0,
+            "max_batch": self.max_batch,
+            "queued_rows": self.queued_rows,
+            "in_flight_batches": self.in_flight,
+            "mean_batch_rows": round(self.stats["rows"] / batches, 2) if batches else None,
+            **self.stats,
+        }
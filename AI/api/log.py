@@ -0,0 +1,75 @@
+# AI/api/log.py
+"""
+Logger estructurado (JSON por línea) que no bloquea el hot path.
+
+Los handlers de la app solo encolan el registro (QueueHandler); un hilo
+(QueueListener) hace la escritura a stdout. Los eventos de rutina (INFO o
+menos) se muestrean con LOG_SAMPLE_RATE; WARNING y superiores siempre pasan.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        out.update(getattr(record, "fields", {}) or {})
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+_LISTENER: Optional[QueueListener] = None
+
+
+def setup_logging(name: str = "floodrisk", level: str = "INFO", sample_rate: float = 1.0) -> logging.Logger:
+    global _LISTENER
+    logger = logging.getLogger(name)
+    if _LISTENER is not None:
+        return logger
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _LISTENER = QueueListener(q, stream)
+    _LISTENER.start()
+    atexit.register(stop_logging)
+
+    handler = QueueHandler(q)
+    handler.addFilter(SampleFilter(sample_rate))
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    return logger
+
+
+def stop_logging() -> None:
+    global _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any) -> None:
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
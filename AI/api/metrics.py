@@ -0,0 +1,143 @@
+# AI/api/metrics.py
+"""
+Métricas en proceso con exposición en formato de texto de Prometheus.
+
+- `STAGE_SECONDS`: histograma por etapa (weather_fetch, esp32_fetch,
+  feature_build, model_inference, water_score).
+- `timed(stage)`: context manager / decorador (sync o async) que observa la
+  duración de una etapa.
+- Los colectores registrados con `register_collector` agregan métricas que
+  viven en otros objetos (p.ej. contadores de las cachés) al momento de renderizar.
+"""
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+PREFIX = "floodrisk"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_fmt(k)} {v}" for k, v in sorted(self._values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # [cuentas por bucket..., +Inf, suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[LabelKey, List[float]]:
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.snapshot().items()):
+            for le, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_fmt(key, [('le', repr(le))])} {count}")
+            lines.append(f"{self.name}_bucket{_fmt(key, [('le', '+Inf')])} {series[-2]}")
+            lines.append(f"{self.name}_sum{_fmt(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_fmt(key)} {series[-2]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("stage_seconds", "Duración por etapa del pipeline de predicción.")
+REQUEST_SECONDS = Histogram("http_request_seconds", "Duración de requests HTTP por ruta.")
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Errores al llamar servicios externos.")
+
+_METRICS: List[Any] = [STAGE_SECONDS, REQUEST_SECONDS, UPSTREAM_ERRORS]
+_COLLECTORS: List[Callable[[], List[str]]] = []
+
+
+def register_collector(fn: Callable[[], List[str]]) -> None:
+    _COLLECTORS.append(fn)
+
+
+def gauge_lines(name: str, help: str, values: Dict[LabelKey, float], kind: str = "gauge") -> List[str]:
+    full = f"{PREFIX}_{name}"
+    lines = [f"# HELP {full} {help}", f"# TYPE {full} {kind}"]
+    lines += [f"{full}{_fmt(k)} {v}" for k, v in sorted(values.items())]
+    return lines
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines += metric.render()
+    for collector in _COLLECTORS:
+        lines += collector()
+    return "\n".join(lines) + "\n"
+
+
+class timed:
+    """`with timed("model_inference"):` o `@timed("weather_fetch")` (sync o async)."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "timed":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        STAGE_SECONDS.observe(time.perf_counter() - self._t0, stage=self.stage)
+
+    def __call__(self, fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(self.stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return fn(*args, **kwargs)
+        return wrapper
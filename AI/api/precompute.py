@@ -0,0 +1,128 @@
+# AI/api/precompute.py
+"""
+Precálculo en segundo plano de pronósticos.
+
+Cada job recalcula periódicamente un resultado por clave (p.ej. por
+dispositivo) con el modelo activo y lo publica como snapshot en memoria, ya
+serializado a JSON. Los endpoints GET lo sirven tal cual si es de la misma
+versión del modelo y no es más viejo que `max_age_s`; si no, calculan en
+vivo como antes. Un job que falla deja el snapshot anterior (que expira solo).
+`wake` adelanta la próxima corrida (p.ej. al llegar una lectura del ESP32) y
+los `listeners` reciben cada snapshot nuevo (ver api/stream.py).
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from api.log import log_event
+from api.registry import ModelRegistry, ModelVersion
+
+LOG = logging.getLogger("floodrisk")
+
+Compute = Callable[[Hashable, ModelVersion], Awaitable[Dict[str, Any]]]
+Listener = Callable[[str, Hashable, "Snapshot"], None]
+
+
+class Snapshot(NamedTuple):
+    value: Dict[str, Any]
+    body: bytes            # value serializado (mismo formato que JSONResponse)
+    version: str           # versión del modelo que lo calculó
+    computed_at: float     # time.time()
+    monotonic: float
+
+    def age_s(self) -> float:
+        return time.monotonic() - self.monotonic
+
+
+def encode(value: Dict[str, Any]) -> bytes:
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class Job(NamedTuple):
+    name: str
+    interval_s: float
+    max_age_s: float
+    keys: Sequence[Hashable]
+    compute: Compute
+    min_interval_s: float
+
+
+class Precomputer:
+    def __init__(self, registry: ModelRegistry):
+        self.registry = registry
+        self.jobs: Dict[str, Job] = {}
+        self.listeners: List[Listener] = []
+        self._snapshots: Dict[Tuple[str, Hashable], Snapshot] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+        self.stats = {"runs": 0, "failures": 0, "served": 0, "missed": 0}
+
+    def add_job(self, name: str, interval_s: float, keys: Sequence[Hashable], compute: Compute,
+                max_age_s: Optional[float] = None, min_interval_s: float = 1.0) -> None:
+        """
+        `max_age_s` por defecto: tres intervalos (tolera un par de corridas fallidas).
+        `min_interval_s`: separación mínima entre corridas cuando `wake` se llama seguido.
+        """
+        if interval_s <= 0 or not keys:
+            return
+        self.jobs[name] = Job(name, interval_s, max_age_s or 3 * interval_s, list(keys), compute, min_interval_s)
+
+    async def refresh(self, job: Job) -> None:
+        model = self.registry.active
+        results = await asyncio.gather(*(job.compute(key, model) for key in job.keys), return_exceptions=True)
+        for key, value in zip(job.keys, results):
+            self.stats["runs"] += 1
+            if isinstance(value, BaseException):
+                self.stats["failures"] += 1
+                log_event(LOG, "precompute_failed", logging.WARNING, job=job.name, key=str(key), error=repr(value))
+                continue
+            snap = self._snapshots[(job.name, key)] = Snapshot(
+                value, encode(value), model.version, time.time(), time.monotonic())
+            for listener in self.listeners:
+                listener(job.name, key, snap)
+
+    async def _loop(self, job: Job) -> None:
+        wake = self._wake[job.name] = asyncio.Event()
+        while True:
+            wake.clear()
+            started = time.monotonic()
+            await self.refresh(job)
+            try:
+                await asyncio.wait_for(wake.wait(), job.interval_s)
+            except asyncio.TimeoutError:
+                continue
+            await asyncio.sleep(max(0.0, job.min_interval_s - (time.monotonic() - started)))
+
+    def start(self) -> List["asyncio.Future[None]"]:
+        return [asyncio.ensure_future(self._loop(job)) for job in self.jobs.values()]
+
+    def wake(self, name: str) -> None:
+        """Adelanta la próxima corrida del job (no hace nada si no está corriendo)."""
+        event = self._wake.get(name)
+        if event is not None:
+            event.set()
+
+    def get(self, name: str, key: Hashable) -> Optional[Snapshot]:
+        """Snapshot vigente (misma versión del modelo activo y dentro de max_age_s) o None."""
+        job = self.jobs.get(name)
+        snap = self._snapshots.get((name, key)) if job else None
+        if snap is None or snap.version != self.registry.active.version or snap.age_s() > job.max_age_s:
+            if job:
+                self.stats["missed"] += 1
+            return None
+        self.stats["served"] += 1
+        return snap
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "jobs": {
+                job.name: {"interval_s": job.interval_s, "max_age_s": job.max_age_s, "keys": [str(k) for k in job.keys]}
+                for job in self.jobs.values()
+            },
+            "snapshots": {
+                f"{name}:{key}": {"version": s.version, "age_s": round(s.age_s(), 3)}
+                for (name, key), s in self._snapshots.items()
+            },
+            **self.stats,
+        }
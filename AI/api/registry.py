@@ -0,0 +1,258 @@
+# AI/api/registry.py
+"""
+Registro de modelos con recarga en caliente.
+
+`ModelRegistry.active` es la versión que sirve requests; cada handler la toma
+una sola vez al empezar, así que una recarga nunca mezcla dos modelos dentro
+de la misma respuesta. `reload` carga y valida la versión nueva en un hilo,
+la calienta con unas predicciones y recién entonces la publica con una sola
+asignación. Las versiones anteriores quedan en memoria para `rollback`.
+`watch` revisa artifacts/ periódicamente y recarga cuando los archivos cambian
+y se estabilizan (train.py escribe varios archivos uno tras otro).
+
+`ModelVersion.predict_proba` usa el motor compilado para pocas filas (lo que
+llega por request) y el pipeline de sklearn de model.pkl para matrices más
+grandes que COMPILED_MAX_ROWS: el recorrido en NumPy cuesta O(filas x
+largo de camino) en Python vectorizado y a partir de unos cientos de filas
+el código en C de sklearn es varias veces más rápido. El pickle se abre la
+primera vez que hace falta y solo si su sha256 es el del manifest.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api.compiled import MANIFEST, CompiledPipeline
+from api.log import log_event
+from features import OnlineFeatureEngine
+
+LOG = logging.getLogger("floodrisk")
+DEFAULT_THRESHOLD = 0.25  # corte para riesgo
+WATCHED = (MANIFEST, "feature_names.json", "model.pkl", "metrics.json")
+# Hasta cuántas filas conviene el motor compilado (medido: 64 filas 7 ms vs 21 ms de
+# sklearn, 256 filas ~25 ms ambos, 4096 filas 500 ms vs 65 ms)
+COMPILED_MAX_ROWS = int(os.getenv("COMPILED_MAX_ROWS", 128))
+
+
+class ModelVersion:
+    def __init__(self, engine: CompiledPipeline, threshold: float, source: str,
+                 pipeline: Any = None, pipeline_path: Optional[Path] = None, pipeline_sha256: Optional[str] = None):
+        self.engine = engine
+        self.features = engine.features
+        # Features lag/rolling (mismas definiciones que train.py::build_features)
+        self.specs = OnlineFeatureEngine.for_features(self.features).specs
+        self.threshold = threshold
+        self.source = source
+        self.version = engine.version
+        self.loaded_at = time.time()
+        # Pipeline de sklearn para lotes grandes: ya cargado o (ruta, sha256 esperado)
+        self._pipeline = pipeline
+        self._pipeline_path = pipeline_path if pipeline is None else None
+        self._pipeline_sha256 = pipeline_sha256
+        self._pipeline_lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Se manda a los workers de api/inference.py (pickle): el lock no viaja
+        state = dict(self.__dict__)
+        del state["_pipeline_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._pipeline_lock = threading.Lock()
+
+    def pipeline(self) -> Any:
+        """Pipeline de model.pkl, o None si no hay uno verificado para esta versión."""
+        if self._pipeline is None and self._pipeline_path is not None:
+            with self._pipeline_lock:
+                if self._pipeline is None and self._pipeline_path is not None:
+                    path, self._pipeline_path = self._pipeline_path, None
+                    try:
+                        raw = path.read_bytes()
+                        if hashlib.sha256(raw).hexdigest() != self._pipeline_sha256:
+                            raise ValueError("model.pkl cambió desde que se cargó esta versión.")
+                        import joblib
+                        self._pipeline = joblib.load(io.BytesIO(raw))
+                    except Exception as e:
+                        log_event(LOG, "pipeline_load_failed", logging.WARNING, version=self.version, error=repr(e))
+        return self._pipeline
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidades para una matriz alineada; lotes grandes con sklearn si está disponible."""
+        X = np.atleast_2d(X)
+        if len(X) > COMPILED_MAX_ROWS:
+            pipe = self.pipeline()
+            if pipe is not None:
+                import pandas as pd
+                classes = list(pipe.named_steps["clf"].classes_)
+                return pipe.predict_proba(pd.DataFrame(X, columns=self.features))[:, classes.index(1)]
+        return self.engine.predict_proba(X)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "threshold": self.threshold,
+            "n_features": len(self.features),
+            "n_trees": self.engine.n_trees,
+            "batch_engine": "sklearn" if self._pipeline is not None or self._pipeline_path is not None else "compiled",
+            "loaded_at": round(self.loaded_at, 3),
+        }
+
+
+def decision_threshold(art_dir: Path, default: float = DEFAULT_THRESHOLD) -> float:
+    """Corte elegido por la CV de train.py (metrics.json), o `default` si no se hizo búsqueda."""
+    try:
+        value = json.loads((art_dir / "metrics.json").read_text(encoding="utf-8")).get("decision_threshold")
+    except (OSError, ValueError):
+        return default
+    if not isinstance(value, (int, float)) or not 0.0 < value < 1.0:
+        return default
+    return float(value)
+
+
+def load_version(art_dir: Path, model_format: str = "compiled", default_threshold: float = DEFAULT_THRESHOLD) -> ModelVersion:
+    """
+    Usa el artefacto compilado (mmap) si existe y coincide con feature_names.json;
+    si no, reconstruye desde model.pkl (sklearn se importa solo en ese caso).
+    """
+    threshold = decision_threshold(art_dir, default_threshold)
+    if model_format == "compiled" and (art_dir / MANIFEST).exists():
+        try:
+            engine = CompiledPipeline.load(art_dir)
+        except ValueError as e:
+            log_event(LOG, "compiled_artifact_rejected", logging.WARNING, error=str(e))
+        else:
+            # Solo si el manifest garantiza que model.pkl es el mismo modelo (compact.py no trae pickle)
+            model_sha = json.loads((art_dir / MANIFEST).read_text(encoding="utf-8")).get("model_sha256")
+            has_pkl = bool(model_sha) and (art_dir / "model.pkl").exists()
+            return ModelVersion(engine, threshold, "compiled", pipeline_path=art_dir / "model.pkl" if has_pkl else None,
+                                pipeline_sha256=model_sha)
+    import joblib
+    features = json.loads((art_dir / "feature_names.json").read_text(encoding="utf-8"))
+    # Se carga lo mismo que se hashea: model.pkl puede cambiar en medio de una recarga
+    raw = (art_dir / "model.pkl").read_bytes()
+    pipe = joblib.load(io.BytesIO(raw))
+    if getattr(pipe, "n_features_in_", len(features)) != len(features):
+        raise ValueError("feature_names.json no coincide con model.pkl.")
+    engine = CompiledPipeline.from_pipeline(pipe, features)
+    engine.version = "pkl-" + hashlib.sha256(raw).hexdigest()[:12]
+    return ModelVersion(engine, threshold, "pickle", pipeline=pipe)
+
+
+def warm_up(model: ModelVersion, n: int = 8) -> None:
+    """
+    Predicciones de prueba (fila vacía + medianas de entrenamiento escaladas):
+    valida la forma y el rango de la salida y trae las páginas del mmap a memoria.
+    """
+    engine = model.engine
+    X = np.full((n, len(engine.features)), np.nan)
+    for i in range(1, n):
+        X[i, engine.keep] = np.asarray(engine.medians) * (0.5 + i / n)
+    proba = engine.predict_proba(X)
+    if proba.shape != (n,) or not np.all(np.isfinite(proba)) or proba.min() < 0 or proba.max() > 1:
+        raise ValueError(f"Predicciones de prueba inválidas: {proba!r}")
+
+
+class ModelRegistry:
+    def __init__(self, art_dir: Path, model_format: str = "compiled",
+                 default_threshold: float = DEFAULT_THRESHOLD, keep: int = 3):
+        self.art_dir = Path(art_dir)
+        self.model_format = model_format
+        # Corte cuando metrics.json no trae decision_threshold
+        self.default_threshold = default_threshold
+        self.keep = keep
+        self._active: Optional[ModelVersion] = None
+        self._previous: List[ModelVersion] = []
+        self._lock = asyncio.Lock()
+        self.last_error: Optional[str] = None
+        self.stats = {"reloads": 0, "unchanged": 0, "failures": 0, "rollbacks": 0}
+
+    @property
+    def active(self) -> ModelVersion:
+        if self._active is None:
+            self._active = self._load()
+        return self._active
+
+    def _load(self) -> ModelVersion:
+        model = load_version(self.art_dir, self.model_format, self.default_threshold)
+        warm_up(model)
+        return model
+
+    async def reload(self, reason: str = "manual") -> Dict[str, Any]:
+        """Carga, valida y publica la versión actual de artifacts/; ValueError/OSError si falla."""
+        async with self._lock:
+            try:
+                model = await asyncio.to_thread(self._load)
+            except Exception as e:
+                self.stats["failures"] += 1
+                self.last_error = repr(e)
+                log_event(LOG, "model_reload_failed", logging.WARNING, reason=reason, error=repr(e))
+                raise
+            self.last_error = None
+            current = self.active
+            if (model.version, model.threshold) == (current.version, current.threshold):
+                self.stats["unchanged"] += 1
+                return {"status": "unchanged", "active": current.info()}
+            self._previous = ([current] + self._previous)[: self.keep]
+            self._active = model
+            self.stats["reloads"] += 1
+            log_event(LOG, "model_reloaded", logging.WARNING, reason=reason,
+                      version=model.version, previous=current.version)
+            return {"status": "reloaded", "active": model.info(), "previous": current.version}
+
+    async def rollback(self) -> Dict[str, Any]:
+        """Vuelve a la versión anterior; LookupError si no hay ninguna."""
+        async with self._lock:
+            if not self._previous:
+                raise LookupError("No hay una versión anterior del modelo.")
+            current = self.active
+            self._active = self._previous.pop(0)
+            self.stats["rollbacks"] += 1
+            log_event(LOG, "model_rollback", logging.WARNING,
+                      version=self._active.version, previous=current.version)
+            return {"status": "rolled_back", "active": self._active.info(), "previous": current.version}
+
+    def signature(self) -> Tuple[Optional[Tuple[int, int]], ...]:
+        out = []
+        for name in WATCHED:
+            try:
+                st = (self.art_dir / name).stat()
+                out.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                out.append(None)
+        return tuple(out)
+
+    async def watch(self, interval_s: float) -> None:
+        """Recarga cuando artifacts/ cambia y se mantiene igual durante un intervalo."""
+        seen = self.signature()
+        pending = False
+        while True:
+            await asyncio.sleep(interval_s)
+            sig = self.signature()
+            if sig != seen:
+                seen, pending = sig, True
+                continue
+            if pending:
+                pending = False
+                try:
+                    await self.reload(reason="watch")
+                except Exception:
+                    pass  # ya registrado; se reintenta en el próximo cambio
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "active": self.active.info(),
+            "previous": [m.version for m in self._previous],
+            "artifacts_dir": str(self.art_dir),
+            "last_error": self.last_error,
+            **self.stats,
+        }
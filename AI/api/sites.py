@@ -0,0 +1,47 @@
+# AI/api/sites.py
+"""
+Registro de sitios (sensor + ubicación + geometría del tanque).
+
+Se lee de un JSON con una lista de objetos Site; si el archivo no existe se
+usa un único sitio con el dispositivo y las coordenadas por defecto.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+DEFAULT_LAT, DEFAULT_LON = 15.5645, -88.0286
+# Resolución (grados) de la celda de clima compartida entre sensores cercanos
+GRID_RESOLUTION_DEG = 0.05
+
+
+class Site(BaseModel):
+    device_id: str
+    lat: float = DEFAULT_LAT
+    lon: float = DEFAULT_LON
+    name: Optional[str] = None
+    max_depth_cm: float = 10.0
+    headspace_cm: float = 3.0
+
+
+def load_sites(path: Path, default_device_id: str) -> List[Site]:
+    if not path.exists():
+        return [Site(device_id=default_device_id)]
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return [Site.parse_obj(s) for s in data]
+
+
+def grid_cell(site: Site, resolution: float = GRID_RESOLUTION_DEG) -> Tuple[float, float]:
+    """Centro de la celda de la grilla: sitios en la misma celda comparten el pronóstico."""
+    return (
+        round(round(site.lat / resolution) * resolution, 4),
+        round(round(site.lon / resolution) * resolution, 4),
+    )
+
+
+def group_by_cell(sites: List[Site], resolution: float = GRID_RESOLUTION_DEG) -> Dict[Tuple[float, float], List[Site]]:
+    cells: Dict[Tuple[float, float], List[Site]] = {}
+    for site in sites:
+        cells.setdefault(grid_cell(site, resolution), []).append(site)
+    return cells
@@ -0,0 +1,111 @@
+# AI/api/stream.py
+"""
+Push de actualizaciones de riesgo (Server-Sent Events).
+
+El precálculo (api/precompute.py) publica cada snapshot en `Broadcaster`; solo
+se reenvía si cambió lo que ve el usuario (score combinado redondeado,
+risk_label o la lectura del ESP32), así que un cálculo alimenta a todos los
+clientes. Cada cliente tiene una cola acotada: si no consume a tiempo se
+descartan sus eventos más viejos (solo importa el último estado) y el
+publicador nunca espera.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Hashable, Set, Tuple
+
+Topic = Tuple[str, Hashable]
+
+CHANGE_DECIMALS = 3
+
+
+def change_key(value: Dict[str, Any], decimals: int = CHANGE_DECIMALS) -> Any:
+    """Lo que tiene que cambiar para que valga la pena empujar un evento."""
+    def risk(v: Dict[str, Any]) -> Tuple[Any, ...]:
+        p = v.get("risk_probability")
+        return (v.get("date"), None if p is None else round(p, decimals), v.get("risk_label"))
+
+    days = value.get("daily_predictions")
+    esp32 = (days[0] if days else value).get("esp32") or {}
+    scores = tuple(risk(d) for d in days) if days is not None else risk(value)
+    return scores, tuple(sorted(esp32.items()))
+
+
+class Subscriber:
+    def __init__(self, topic: Topic, max_queue: int):
+        self.topic = topic
+        self.queue: "asyncio.Queue[Tuple[int, bytes]]" = asyncio.Queue(max_queue)
+        self.dropped = 0
+
+    def offer(self, event: Tuple[int, bytes]) -> bool:
+        """Encola sin bloquear; si la cola está llena descarta el evento más viejo."""
+        dropped = False
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return dropped
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+                self.dropped += 1
+                dropped = True
+
+
+class Broadcaster:
+    def __init__(self, max_queue: int = 8):
+        self.max_queue = max_queue
+        self._subscribers: Dict[Topic, Set[Subscriber]] = {}
+        # Último evento por tema: (seq, change_key, body); el cliente nuevo lo recibe al conectarse
+        self._last: Dict[Topic, Tuple[int, Any, bytes]] = {}
+        self._seq = 0
+        self.stats = {"published": 0, "unchanged": 0, "delivered": 0, "dropped": 0}
+
+    def publish(self, topic: Topic, value: Dict[str, Any], body: bytes) -> bool:
+        key = change_key(value)
+        last = self._last.get(topic)
+        if last is not None and last[1] == key:
+            self.stats["unchanged"] += 1
+            return False
+        self._seq += 1
+        self._last[topic] = (self._seq, key, body)
+        self.stats["published"] += 1
+        for sub in self._subscribers.get(topic, ()):
+            self.stats["delivered"] += 1
+            if sub.offer((self._seq, body)):
+                self.stats["dropped"] += 1
+        return True
+
+    def subscribe(self, topic: Topic) -> Subscriber:
+        sub = Subscriber(topic, self.max_queue)
+        self._subscribers.setdefault(topic, set()).add(sub)
+        last = self._last.get(topic)
+        if last is not None:
+            sub.offer((last[0], last[2]))
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        subs = self._subscribers.get(sub.topic)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.topic]
+
+    async def sse(self, topic: Topic, heartbeat_s: float = 15.0, retry_ms: int = 5000) -> AsyncIterator[bytes]:
+        """Stream text/event-stream para un tema; comentario de keep-alive cada `heartbeat_s`."""
+        sub = self.subscribe(topic)
+        try:
+            yield f"retry: {retry_ms}\n\n".encode("ascii")
+            while True:
+                try:
+                    seq, body = await asyncio.wait_for(sub.queue.get(), heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield f": ping {int(time.time())}\n\n".encode("ascii")
+                    continue
+                yield b"event: risk\nid: %d\ndata: %s\n\n" % (seq, body)
+        finally:
+            self.unsubscribe(sub)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "subscribers": {f"{name}:{key}": len(subs) for (name, key), subs in self._subscribers.items()},
+            "max_queue": self.max_queue,
+            **self.stats,
+        }
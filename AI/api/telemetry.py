@@ -0,0 +1,227 @@
+# AI/api/telemetry.py
+"""
+Telemetría del ESP32 en memoria.
+
+Cada device_id tiene un ring buffer de tamaño fijo (matriz float64 + vector
+de timestamps), así que la última lectura se obtiene en O(1) y el historial
+reciente sirve para las features lag/rolling de distance_cm y level_pct.
+Se alimenta por POST /telemetry/{device_id} o suscribiéndose al endpoint de
+streaming (SSE) de Firebase RTDB.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from api.log import log_event
+from api.metrics import UPSTREAM_ERRORS
+
+LOG = logging.getLogger("floodrisk")
+
+FIELDS = (
+    "distance_cm",
+    "level_pct",
+    "fill_pct",
+    "water_height_cm",
+    "max_depth_cm",
+    "headspace_cm",
+    "usable_depth_cm",
+)
+_INDEX = {f: i for i, f in enumerate(FIELDS)}
+
+
+def _to_num(v: Any) -> float:
+    try:
+        return float(v) if v is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _reading_ts(reading: Dict[str, Any]) -> float:
+    """Timestamp en segundos epoch; el ESP32 suele mandar milisegundos."""
+    ts = _to_num(reading.get("timestamp", reading.get("ts")))
+    if np.isnan(ts) or ts <= 0:
+        return time.time()
+    return ts / 1000.0 if ts > 1e11 else ts
+
+
+class DeviceBuffer:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.values = np.full((capacity, len(FIELDS)), np.nan)
+        self.ts = np.zeros(capacity)
+        self.count = 0
+        self._next = 0
+        # Última vez que el polling confirmó que la lectura más reciente sigue vigente
+        self.seen = 0.0
+
+    def append(self, reading: Dict[str, Any], ts: Optional[float] = None) -> bool:
+        row = np.array([_to_num(reading.get(f)) for f in FIELDS])
+        if np.isnan(row).all():
+            return False
+        stamped = ts is not None or reading.get("timestamp", reading.get("ts")) is not None
+        ts = _reading_ts(reading) if ts is None else ts
+        if self.count:
+            last = (self._next - 1) % self.capacity
+            # El stream de RTDB repite el nodo completo al reconectar: lo ya visto se ignora
+            if stamped and ts < self.ts[last]:
+                return False
+            # El polling a RTDB devuelve la misma lectura varias veces: no duplicar,
+            # pero sí anotar que sigue vigente (TelemetryStore.latest con max_age_s)
+            same = np.array_equal(row, self.values[last], equal_nan=True)
+            if same and not stamped:
+                self.seen = max(self.seen, ts)
+                return False
+            if same and ts == self.ts[last]:
+                return False
+        self.values[self._next] = row
+        self.ts[self._next] = ts
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return True
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        if not self.count:
+            return None
+        row = self.values[(self._next - 1) % self.capacity]
+        return {f: (None if np.isnan(v) else float(v)) for f, v in zip(FIELDS, row)}
+
+    def latest_ts(self) -> Optional[float]:
+        return float(self.ts[(self._next - 1) % self.capacity]) if self.count else None
+
+    def fresh_ts(self) -> Optional[float]:
+        """Timestamp de la última lectura o de su última confirmación, el más reciente."""
+        return max(self.latest_ts(), self.seen) if self.count else None
+
+    def history(self, field: str, n: Optional[int] = None) -> np.ndarray:
+        """Últimos n valores de un campo en orden cronológico (vista copiada)."""
+        n = self.count if n is None else min(n, self.count)
+        idx = (np.arange(self._next - n, self._next)) % self.capacity
+        return self.values[idx, _INDEX[field]]
+
+    def timestamps(self, n: Optional[int] = None) -> np.ndarray:
+        n = self.count if n is None else min(n, self.count)
+        return self.ts[(np.arange(self._next - n, self._next)) % self.capacity]
+
+    def daily_last(self, utc_offset_s: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Última lectura de cada día (hora local), en orden: (día ordinal, matriz de FIELDS).
+        Es la granularidad de las filas con las que se entrenó el modelo.
+        """
+        ts = self.timestamps()
+        if not len(ts):
+            return np.empty(0, dtype=np.int64), np.empty((0, len(FIELDS)))
+        values = self.values[(np.arange(self._next - self.count, self._next)) % self.capacity]
+        order = np.argsort(ts, kind="stable")
+        days = np.floor((ts[order] + utc_offset_s) / 86400.0).astype(np.int64)
+        last = np.append(days[1:] != days[:-1], True)
+        return days[last], values[order][last]
+
+
+class TelemetryStore:
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self._devices: Dict[str, DeviceBuffer] = {}
+        # Se llaman con el device_id cada vez que entra una lectura nueva
+        self.listeners: List[Callable[[str], None]] = []
+        # Dispositivos con el stream de RTDB conectado: su buffer está al día sin consultar RTDB
+        self.streaming: Set[str] = set()
+        self.stats = {"ingested": 0, "duplicates": 0}
+
+    def buffer(self, device_id: str) -> DeviceBuffer:
+        buf = self._devices.get(device_id)
+        if buf is None:
+            buf = self._devices[device_id] = DeviceBuffer(self.capacity)
+        return buf
+
+    def append(self, device_id: str, reading: Dict[str, Any], ts: Optional[float] = None) -> bool:
+        added = self.buffer(device_id).append(reading, ts)
+        self.stats["ingested" if added else "duplicates"] += 1
+        if added:
+            for listener in self.listeners:
+                listener(device_id)
+        return added
+
+    def extend(self, device_id: str, readings: Iterable[Dict[str, Any]]) -> int:
+        ordered = sorted(readings, key=_reading_ts)
+        return sum(self.append(device_id, r) for r in ordered)
+
+    def latest(self, device_id: str, max_age_s: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        buf = self._devices.get(device_id)
+        if buf is None or not buf.count:
+            return None
+        if max_age_s is not None and time.time() - buf.fresh_ts() > max_age_s:
+            return None
+        return buf.latest()
+
+    def get(self, device_id: str) -> Optional[DeviceBuffer]:
+        return self._devices.get(device_id)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "devices": {d: {"count": b.count, "last_ts": b.latest_ts()} for d, b in self._devices.items()},
+            "capacity": self.capacity,
+            "streaming": sorted(self.streaming),
+            **self.stats,
+        }
+
+
+# ---------------------- Suscripción a RTDB (SSE) ----------------------
+
+def _apply_rtdb_event(store: TelemetryStore, device_id: str, path: str, data: Any) -> None:
+    """
+    Traduce un evento put/patch del nodo devices/{id} a lecturas:
+      "/" -> nodo completo; "/last" o "/latest" -> paquete; "/telemetry[/key]" -> lecturas.
+    """
+    if not isinstance(data, dict):
+        return
+    parts = [p for p in path.split("/") if p]
+    if not parts:
+        if isinstance(data.get("telemetry"), dict):
+            store.extend(device_id, [v for v in data["telemetry"].values() if isinstance(v, dict)])
+        for key in ("last", "latest"):
+            if isinstance(data.get(key), dict):
+                store.append(device_id, data[key])
+    elif parts[0] in ("last", "latest") and len(parts) == 1:
+        store.append(device_id, data)
+    elif parts[0] == "telemetry":
+        if len(parts) == 1:
+            store.extend(device_id, [v for v in data.values() if isinstance(v, dict)])
+        else:
+            store.append(device_id, data)
+
+
+async def subscribe_rtdb(client, store: TelemetryStore, db_url: str, device_id: str,
+                         retry_s: float = 5.0) -> None:
+    """Mantiene abierto el stream SSE de devices/{id}; reconecta ante errores."""
+    url = f"{db_url}/devices/{device_id}.json"
+    while True:
+        try:
+            async with client.stream("GET", url, headers={"Accept": "text/event-stream"}, timeout=None) as res:
+                res.raise_for_status()
+                store.streaming.add(device_id)
+                event: Optional[str] = None
+                async for line in res.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:") and event in ("put", "patch"):
+                        msg = json.loads(line[5:].strip())
+                        if isinstance(msg, dict):
+                            _apply_rtdb_event(store, device_id, msg.get("path", "/"), msg.get("data"))
+                    elif line.startswith("data:") and event == "cancel":
+                        break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(service="firebase_stream", error=type(e).__name__)
+            log_event(LOG, "rtdb_stream_error", logging.WARNING, device_id=device_id, error=repr(e))
+        finally:
+            store.streaming.discard(device_id)
+        await asyncio.sleep(retry_s)
+
+
+def start_subscribers(client, store: TelemetryStore, db_url: str, device_ids: List[str]) -> List[asyncio.Task]:
+    return [asyncio.ensure_future(subscribe_rtdb(client, store, db_url, d)) for d in device_ids]
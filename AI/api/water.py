@@ -0,0 +1,126 @@
+# AI/api/water.py
+"""
+Score de nivel de agua a partir de las lecturas del ESP32.
+
+`compute_water_scores` trabaja sobre columnas (arrays) y es la
+implementación de referencia; `compute_water_score` es el envoltorio para un
+solo paquete del ESP32 que usan los endpoints.
+"""
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+DEFAULT_MAX_DEPTH_CM = 10.0
+DEFAULT_HEADSPACE_CM = 3.0
+
+# Pesos del ensamble agua/clima (API y backfill.py)
+WEIGHT_WATER = 0.7
+WEIGHT_CLIMATE = 0.3
+
+
+# Conversión segura
+def _to_float(x, default=None):
+    try:
+        if x is None: return default
+        if isinstance(x, (int, float)): return float(x)
+        return float(str(x).strip())
+    except Exception:
+        return default
+
+
+def _col(x: Any) -> np.ndarray:
+    if x is None:
+        return np.array(np.nan)
+    return np.asarray(x, dtype=np.float64)
+
+
+def compute_water_scores(
+    level_pct: Any = None,
+    fill_pct: Any = None,
+    water_height_cm: Any = None,
+    distance_cm: Any = None,
+    usable_depth_cm: Any = None,
+    max_depth_cm: Any = None,
+    headspace_cm: Any = None,
+    default_max_depth_cm: Any = DEFAULT_MAX_DEPTH_CM,
+    default_headspace_cm: Any = DEFAULT_HEADSPACE_CM,
+) -> np.ndarray:
+    """
+    Versión vectorizada: cada argumento es un array (o escalar/None que se
+    difunde) y NaN significa "sin dato". Devuelve scores ∈ [0,1] donde
+    1 = nivel crítico, tomando el MÁXIMO entre las señales disponibles:
+      - level_pct / 100
+      - fill_pct / 100
+      - water_height_cm / usable_depth
+      - (max_depth - distance_cm) / usable_depth
+    Filas sin ninguna señal -> 0.
+    """
+    lp, fp, wh, d, usable, md, hs = np.broadcast_arrays(*(
+        _col(x) for x in (level_pct, fill_pct, water_height_cm, distance_cm,
+                          usable_depth_cm, max_depth_cm, headspace_cm)
+    ))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Geometría (para normalizar alturas/distancia)
+        md = np.where(np.isnan(md), default_max_depth_cm, md)
+        hs = np.where(np.isnan(hs), default_headspace_cm, hs)
+        usable = np.where(np.isnan(usable), np.maximum(0.0, md - hs), usable)
+        geo = usable > 0
+
+        candidates = np.stack([
+            lp / 100.0,
+            fp / 100.0,
+            np.where(geo, wh / usable, np.nan),
+            np.where(geo, np.minimum(usable, np.maximum(0.0, md - d)) / usable, np.nan),
+        ])
+
+    # Clamp y selección ignorando NaN
+    candidates = np.clip(candidates, 0.0, 1.0)
+    score = np.where(np.isnan(candidates), -np.inf, candidates).max(axis=0)
+    return np.where(np.isneginf(score), 0.0, score)
+
+
+WATER_FIELDS = (
+    "level_pct",
+    "fill_pct",
+    "water_height_cm",
+    "distance_cm",
+    "usable_depth_cm",
+    "max_depth_cm",
+    "headspace_cm",
+)
+
+
+def compute_water_scores_from_packets(
+    packets: Sequence[Dict[str, Any]],
+    max_depth_cm: Any = DEFAULT_MAX_DEPTH_CM,
+    headspace_cm: Any = DEFAULT_HEADSPACE_CM,
+) -> np.ndarray:
+    """
+    Scores para una lista de paquetes del ESP32. max_depth_cm/headspace_cm son
+    los valores por defecto cuando el paquete no los trae (escalar o uno por paquete).
+    Paquetes vacíos -> 0.
+    """
+    cols = {k: np.full(len(packets), np.nan) for k in WATER_FIELDS}
+    for i, esp in enumerate(packets):
+        for k in WATER_FIELDS:
+            v = _to_float((esp or {}).get(k))
+            if v is not None:
+                cols[k][i] = v
+    scores = compute_water_scores(
+        **cols,
+        default_max_depth_cm=np.asarray(max_depth_cm, dtype=np.float64),
+        default_headspace_cm=np.asarray(headspace_cm, dtype=np.float64),
+    )
+    return np.where([bool(esp) for esp in packets], scores, 0.0)
+
+
+def compute_water_score(
+    esp32: Dict[str, Any],
+    max_depth_cm: float = DEFAULT_MAX_DEPTH_CM,
+    headspace_cm: float = DEFAULT_HEADSPACE_CM,
+) -> float:
+    """Score ∈ [0,1] de un paquete del ESP32 (ver compute_water_scores)."""
+    if not esp32:
+        return 0.0
+    return float(compute_water_scores_from_packets([esp32], max_depth_cm, headspace_cm)[0])
@@ -0,0 +1,254 @@
+# AI/backfill.py
+"""
+Scoring masivo de historial (backfill / replay).
+
+  python backfill.py --input eta_iota.csv --output eta_iota_scored.csv
+  python backfill.py --input "data/*.csv" --output scored.ndjson --workers 4
+  python backfill.py --input archive --start 2024-06-01 --end 2024-08-31 --output verano.csv
+
+Lee CSV (por bloques, ver data.py) o NDJSON (una fila por línea, con o sin
+{"payload": {...}}), calcula las mismas features lag/rolling que
+build_features (por estación/dispositivo, sin cruzar grupos) y puntúa cada
+bloque con una sola llamada vectorizada al modelo (pipeline de sklearn para
+bloques grandes, ver ModelVersion.predict_proba). Escribe la
+probabilidad climática, el score de agua y el ensamble de la API, en el mismo
+orden que la entrada, y reporta filas por segundo al terminar.
+
+Los bloques se encadenan guardando las últimas filas de cada grupo, así que
+las filas de un mismo grupo deben venir en orden cronológico.
+
+Con --start/--end se puntúa solo ese rango: del archivo de series
+(api/archive.py) se lee el slice del índice más la historia que necesitan
+las features (una fila por día), sin recorrer el resto.
+"""
+import argparse, json, sys, time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from api.registry import ModelVersion, load_version
+from api.water import (DEFAULT_HEADSPACE_CM, DEFAULT_MAX_DEPTH_CM, WATER_FIELDS, WEIGHT_CLIMATE, WEIGHT_WATER,
+                       compute_water_scores)
+from data import expand_sources, filter_range, iter_chunks
+from features import apply_specs, group_starts
+from train import GROUP_COLUMNS
+
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+# Filas por bloque: 51k filas en bloques de 20k -> ~25k filas/s y 260 MB de pico
+# (200k: 31k filas/s y 360 MB; 5k: 18k filas/s y 190 MB)
+CHUNK_ROWS = 20_000
+
+
+# ---------------------- Entrada ----------------------
+
+def _iter_ndjson(path: Path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    rows: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            if isinstance(obj, dict) and isinstance(obj.get("payload"), dict):
+                obj = {**{k: v for k, v in obj.items() if k != "payload"}, **obj["payload"]}
+            rows.append(obj)
+            if len(rows) >= chunk_rows:
+                yield pd.DataFrame.from_records(rows)
+                rows = []
+    if rows:
+        yield pd.DataFrame.from_records(rows)
+
+
+def iter_input(paths: Sequence[Path], chunk_rows: int, start: Any = None, end: Any = None) -> Iterator[pd.DataFrame]:
+    for path in paths:
+        if path.suffix.lower() in NDJSON_SUFFIXES:
+            yield from (filter_range(chunk, start, end) for chunk in _iter_ndjson(path, chunk_rows))
+        else:
+            yield from iter_chunks([path], chunk_rows, start, end)
+
+
+def _group_column(columns: Sequence[str]) -> Optional[str]:
+    return next((c for c in GROUP_COLUMNS if c in columns), None)
+
+
+class ChunkLinker:
+    """
+    Antepone a cada bloque las últimas `lookback` filas de cada grupo del bloque
+    anterior, para que lags y ventanas vean la historia. Las filas nuevas se
+    marcan con su posición en la entrada (_row >= 0); las arrastradas con -1.
+    """
+
+    def __init__(self, lookback: int):
+        self.lookback = lookback
+        self.carry: Optional[pd.DataFrame] = None
+        self.offset = 0
+
+    def link(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk = chunk.assign(_row=np.arange(self.offset, self.offset + len(chunk)))
+        self.offset += len(chunk)
+        frame = chunk if self.carry is None else pd.concat([self.carry, chunk], ignore_index=True)
+
+        group = _group_column(frame.columns)
+        keys = [k for k in (group, "datetime") if k]
+        if group:
+            frame[group] = frame[group].astype(object)
+        if "datetime" in frame.columns:
+            frame["datetime"] = pd.to_datetime(frame["datetime"])
+        if keys:
+            frame = frame.sort_values(keys, kind="stable").reset_index(drop=True)
+
+        tail = frame.groupby(group, sort=False, dropna=False).tail(self.lookback) if group else frame.tail(self.lookback)
+        self.carry = tail.assign(_row=-1)
+        return frame
+
+
+# ---------------------- Scoring ----------------------
+
+# Estado de cada proceso (el modelo se abre una vez por worker, con mmap compartido)
+_STATE: Dict[str, Any] = {}
+
+
+def _init_state(art_dir: str, max_depth_cm: float, headspace_cm: float) -> None:
+    _STATE.update(
+        model=load_version(Path(art_dir)),
+        max_depth_cm=max_depth_cm,
+        headspace_cm=headspace_cm,
+    )
+
+
+def _column(df: pd.DataFrame, name: str) -> Optional[np.ndarray]:
+    if name not in df.columns:
+        return None
+    return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def feature_matrix(df: pd.DataFrame, features: Sequence[str]) -> np.ndarray:
+    """Columnas de `features` como matriz float64 (NaN donde falta la columna o el valor)."""
+    X = np.full((len(df), len(features)), np.nan)
+    for j, name in enumerate(features):
+        col = _column(df, name)
+        if col is not None:
+            X[:, j] = col
+    return X
+
+
+def score_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Features + modelo + agua para un bloque ya enlazado; devuelve solo las filas nuevas."""
+    model: ModelVersion = _STATE["model"]
+    group = _group_column(frame.columns)
+    start = group_starts(pd.factorize(frame[group])[0]) if group else None
+    feats = apply_specs(frame, model.specs, groups=start)
+    feats = feats[feats["_row"].to_numpy() >= 0]
+
+    climate = model.predict_proba(feature_matrix(feats, model.features)) if len(feats) else np.empty(0)
+    water = compute_water_scores(
+        **{k: _column(feats, k) for k in WATER_FIELDS},
+        default_max_depth_cm=_STATE["max_depth_cm"],
+        default_headspace_cm=_STATE["headspace_cm"],
+    )
+    water = np.broadcast_to(water, climate.shape)
+    combined = WEIGHT_WATER * water + WEIGHT_CLIMATE * climate
+
+    out = {"row": feats["_row"].to_numpy()}
+    if group:
+        out[group] = feats[group].to_numpy()
+    if "datetime" in feats.columns:
+        out["datetime"] = feats["datetime"].astype(str).to_numpy()
+    out.update({
+        "climate_probability": climate,
+        "climate_label": (climate >= model.threshold).astype(int),
+        "water_score": water,
+        "risk_probability": combined,
+        "risk_label": (combined >= model.threshold).astype(int),
+    })
+    return pd.DataFrame(out).sort_values("row", kind="stable")
+
+
+# ---------------------- Salida ----------------------
+
+class Writer:
+    def __init__(self, path: str):
+        self.ndjson = path.lower().endswith(NDJSON_SUFFIXES)
+        self.f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+        self.header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.ndjson:
+            if len(df):
+                self.f.write(df.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n") + "\n")
+        else:
+            df.to_csv(self.f, index=False, header=self.header)
+            self.header = False
+
+    def close(self) -> None:
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+# ---------------------- CLI ----------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Puntúa historial completo (CSV/NDJSON) con el modelo de artifacts/")
+    ap.add_argument("--input", nargs="+", required=True, help="CSV, NDJSON (se aceptan globs) o un archivo de series")
+    ap.add_argument("--output", required=True, help=".csv, .ndjson/.jsonl o - (stdout, CSV)")
+    ap.add_argument("--artifacts", default="artifacts")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--workers", type=int, default=0, help="procesos para features+scoring (0 = en proceso)")
+    ap.add_argument("--max-depth-cm", type=float, default=DEFAULT_MAX_DEPTH_CM)
+    ap.add_argument("--headspace-cm", type=float, default=DEFAULT_HEADSPACE_CM)
+    ap.add_argument("--start", type=pd.Timestamp, default=None, help="primer día a puntuar (YYYY-MM-DD)")
+    ap.add_argument("--end", type=pd.Timestamp, default=None, help="último día a puntuar (YYYY-MM-DD)")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    init_args = (args.artifacts, args.max_depth_cm, args.headspace_cm)
+    _init_state(*init_args)
+    model: ModelVersion = _STATE["model"]
+    lookback = max((s.window for s in model.specs), default=0)
+    linker = ChunkLinker(lookback)
+    writer = Writer(args.output)
+    rows = 0
+    # Historia previa a --start para lags/rolling; esas filas se puntúan pero no se escriben
+    read_from = None if args.start is None else args.start - pd.Timedelta(days=lookback)
+    chunks = iter_input(expand_sources(args.input), args.chunk_rows, read_from, args.end)
+
+    def emit(out: pd.DataFrame) -> int:
+        if args.start is not None:
+            out = filter_range(out, args.start)
+        writer.write(out)
+        return len(out)
+
+    try:
+        if args.workers > 0:
+            # Orden de salida = orden de entrada; a lo sumo 2 bloques por worker en vuelo
+            with ProcessPoolExecutor(args.workers, initializer=_init_state, initargs=init_args) as pool:
+                pending: Deque["Future[pd.DataFrame]"] = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(score_frame, linker.link(chunk)))
+                    while len(pending) >= 2 * args.workers:
+                        rows += emit(pending.popleft().result())
+                while pending:
+                    rows += emit(pending.popleft().result())
+        else:
+            for chunk in chunks:
+                rows += emit(score_frame(linker.link(chunk)))
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+        "model_version": model.version,
+        "threshold": model.threshold,
+        "workers": args.workers,
+        "output": args.output,
+    }, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+# AI/bench.py
+"""
+Benchmarks reproducibles de latencia/throughput.
+
+  python bench.py model    # run_model: sklearn vs CompiledPipeline, 1 fila y lotes
+  python bench.py startup  # arranque en frío de la API: modelo compilado (mmap) vs model.pkl
+  python bench.py api      # /predict, /predict_daily, /predict_realtime con carga concurrente
+  python bench.py features # build_features sobre datos sintéticos multi-estación (1x..1000x)
+  python bench.py train    # train.py de punta a punta sobre el CSV y copias escaladas (10x..1000x)
+  python bench.py all
+
+La API corre en proceso (httpx.ASGITransport) y Visual Crossing / Firebase se
+reemplazan por un transporte local (httpx.MockTransport) con latencia
+configurable, así que no se hace ninguna llamada de red. Cada corrida reporta
+p50/p95/p99, requests (o filas) por segundo y RSS máximo, y se guarda como
+JSON; `--compare OTRO.json` imprime la diferencia contra una corrida anterior.
+"""
+import argparse, asyncio, json, os, platform, subprocess, sys, tempfile, time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+HERE = Path(__file__).resolve().parent
+
+
+# ---------------------- Medición ----------------------
+
+def _rss_mb(maxrss: float) -> float:
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    return round(maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024, 1)
+
+
+def peak_rss_mb() -> float:
+    import resource
+    return _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def summarize(latencies_s: Sequence[float], wall_s: float, units: int) -> Dict[str, Any]:
+    """Percentiles en ms y `units` (requests o filas) por segundo de reloj."""
+    import numpy as np
+    ms = np.asarray(latencies_s, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (np.nan,) * 3
+    return {
+        "n": int(len(ms)),
+        "latency_ms": {
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "mean": round(float(ms.mean()), 3) if len(ms) else None,
+            "max": round(float(ms.max()), 3) if len(ms) else None,
+        },
+        "per_second": round(units / wall_s, 1) if wall_s > 0 else None,
+        "wall_s": round(wall_s, 3),
+    }
+
+
+def run_child(cmd: List[str], timeout: Optional[float] = None, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Subproceso con tiempo de reloj, CPU y RSS máximo del propio hijo (os.wait4)."""
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t0 = time.perf_counter()
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if timeout is not None and time.perf_counter() - t0 > timeout:
+            proc.kill()
+            proc.wait()
+            return {"ok": False, "error": "timeout", "wall_s": round(time.perf_counter() - t0, 3)}
+        time.sleep(0.005)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "ok": proc.returncode == 0,
+        "exit_code": proc.returncode,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        "peak_rss_mb": _rss_mb(usage.ru_maxrss),
+    }
+
+
+def _ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+# ---------------------- Modelo ----------------------
+
+def bench_model(args) -> List[Dict[str, Any]]:
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from api.compiled import CompiledPipeline
+    from train import build_features
+
+    pipe = joblib.load(args.model)
+    features = json.loads(Path(args.features).read_text(encoding="utf-8"))
+    compiled = CompiledPipeline.from_pipeline(pipe, features)
+
+    df, _, _ = build_features(pd.read_csv(args.csv))
+    X = df.apply(pd.to_numeric, errors="coerce").reindex(columns=features)
+    rows = [{k: v for k, v in r.items() if v == v} for r in X.to_dict("records")]
+
+    # Mismo camino que run_model antes y después del predictor compilado
+    engines: Dict[str, Callable[[List[Dict[str, Any]]], np.ndarray]] = {
+        "sklearn": lambda b: pipe.predict_proba(
+            pd.DataFrame(b).apply(pd.to_numeric, errors="coerce").reindex(columns=features))[:, 1],
+        "compiled": lambda b: compiled.predict_proba(compiled.align_many(b)),
+    }
+
+    results = []
+    for engine, fn in engines.items():
+        for size in _ints(args.batch_sizes):
+            batches = [[rows[(i * size + j) % len(rows)] for j in range(size)] for i in range(args.iterations)]
+            for b in batches[: args.warmup]:
+                fn(b)
+            lat = []
+            started = time.perf_counter()
+            for b in batches:
+                t0 = time.perf_counter()
+                fn(b)
+                lat.append(time.perf_counter() - t0)
+            wall = time.perf_counter() - started
+            out = summarize(lat, wall, units=size * len(batches))
+            results.append({
+                "suite": "model",
+                "name": f"model/{engine}/batch={size}",
+                "engine": engine,
+                "batch_size": size,
+                "rows_per_second": out.pop("per_second"),
+                **out,
+                "peak_rss_mb": peak_rss_mb(),
+            })
+            print(f"  {results[-1]['name']:32s} p50={out['latency_ms']['p50']:.3f}ms "
+                  f"rows/s={results[-1]['rows_per_second']}", file=sys.stderr)
+    return results
+
+
+# ---------------------- API ----------------------
+
+def _stub_weather(include: str) -> Dict[str, Any]:
+    """Respuesta mínima con la forma de Visual Crossing (horas del día o 15 días)."""
+    base = {
+        "temp": 27.5, "feelslike": 30.1, "humidity": 84.0, "precip": 12.4, "windspeed": 18.0,
+        "windgust": 35.2, "cloudcover": 76.0, "visibility": 9.1, "sealevelpressure": 1009.4,
+        "solarradiation": 180.0, "solarenergy": 15.2, "dew": 24.1, "uvindex": 6,
+        "conditions": "Rain, Partially cloudy", "icon": "rain", "description": "stub",
+    }
+    if "hours" in include:
+        hours = [{**base, "datetime": f"{h:02d}:00:00", "precip": 0.5 * h} for h in range(24)]
+        days = [{**base, "datetime": datetime.now().strftime("%Y-%m-%d"), "hours": hours}]
+    else:
+        days = [{**base, "datetime": f"2025-01-{d + 1:02d}", "precip": 2.0 * d} for d in range(15)]
+    return {"resolvedAddress": "stub", "days": days}
+
+
+STUB_ESP32 = {"distance_cm": 6.2, "level_pct": 42.0, "max_depth_cm": 10.0, "headspace_cm": 3.0}
+
+
+def make_stub_transport(latency_s: float, calls: Dict[str, int]):
+    import httpx
+
+    async def handler(request: "httpx.Request") -> "httpx.Response":
+        if latency_s > 0:
+            await asyncio.sleep(latency_s)
+        url = str(request.url)
+        if "visualcrossing" in url:
+            calls["visualcrossing"] += 1
+            include = request.url.params.get("include", "")
+            return httpx.Response(200, json=_stub_weather(include))
+        calls["firebase"] += 1
+        if url.split("?")[0].endswith("/last.json"):
+            return httpx.Response(200, json={**STUB_ESP32, "timestamp": int(time.time() * 1000)})
+        return httpx.Response(200, content=b"null")
+
+    return httpx.MockTransport(handler)
+
+
+API_ENDPOINTS = {
+    "predict": ("POST", "/predict"),
+    "predict_daily": ("GET", "/predict_daily"),
+    "predict_realtime": ("GET", "/predict_realtime"),
+}
+
+
+async def _load(client, method: str, path: str, body: Optional[Dict[str, Any]], total: int, concurrency: int):
+    lat: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            res = await client.request(method, path, json=body)
+            lat.append(time.perf_counter() - t0)
+            if res.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return lat, time.perf_counter() - started, errors
+
+
+async def _bench_api(args) -> List[Dict[str, Any]]:
+    import httpx
+
+    if args.cold:
+        # Sin caché de clima ni telemetría reciente: cada request llega al upstream (stub)
+        for var in ("VC_REALTIME_TTL_S", "VC_DAILY_TTL_S", "VC_STALE_TTL_S", "TELEMETRY_MAX_AGE_S",
+                    "TELEMETRY_POLL_MAX_AGE_S"):
+            os.environ[var] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from api import app as api
+
+    calls = {"visualcrossing": 0, "firebase": 0}
+    api.HTTP_CLIENT = httpx.AsyncClient(transport=make_stub_transport(args.upstream_latency_ms / 1000.0, calls))
+    # El lifespan no corre con ASGITransport: el pool de inferencia se arranca a mano
+    api.INFERENCE.start()
+    body = json.loads(Path(args.payload).read_text(encoding="utf-8"))
+    body["use_esp32"] = True
+
+    results = []
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in args.endpoints.split(","):
+            method, path = API_ENDPOINTS[name]
+            req_body = body if method == "POST" else None
+            await _load(client, method, path, req_body, args.warmup, 1)
+            for conc in _ints(args.concurrency):
+                before = dict(calls)
+                lat, wall, errors = await _load(client, method, path, req_body, args.requests, conc)
+                out = summarize(lat, wall, units=len(lat))
+                results.append({
+                    "suite": "api",
+                    "name": f"api/{name}/c={conc}" + ("/cold" if args.cold else ""),
+                    "endpoint": path,
+                    "concurrency": conc,
+                    "cold": args.cold,
+                    "upstream_latency_ms": args.upstream_latency_ms,
+                    "requests_per_second": out.pop("per_second"),
+                    **out,
+                    "errors": errors,
+                    "upstream_calls": {k: calls[k] - before[k] for k in calls},
+                    "inference_workers": api.INFERENCE.info()["workers"],
+                    "peak_rss_mb": peak_rss_mb(),
+                })
+                print(f"  {results[-1]['name']:32s} p50={out['latency_ms']['p50']:.3f}ms "
+                      f"p99={out['latency_ms']['p99']:.3f}ms rps={results[-1]['requests_per_second']}",
+                      file=sys.stderr)
+    await api.HTTP_CLIENT.aclose()
+    api.INFERENCE.close()
+    return results
+
+
+def bench_api(args) -> List[Dict[str, Any]]:
+    return asyncio.run(_bench_api(args))
+
+
+# ---------------------- Arranque ----------------------
+
+def _dir_mb(paths: Sequence[Path]) -> float:
+    return round(sum(p.stat().st_size for p in paths if p.is_file()) / (1024 * 1024), 2)
+
+
+def bench_startup(args) -> List[Dict[str, Any]]:
+    """Arranque en frío: proceso nuevo que importa api.app, por formato de modelo."""
+    art = Path(args.features).parent
+    compiled_files = [art / "manifest.json"]
+    if compiled_files[0].exists():
+        manifest = json.loads(compiled_files[0].read_text(encoding="utf-8"))
+        compiled_files += [art / a["file"] for a in manifest["arrays"].values()]
+    sizes = {"compiled": _dir_mb(compiled_files), "pickle": _dir_mb([art / "model.pkl"])}
+    results = []
+    for fmt in ("compiled", "pickle"):
+        if fmt == "compiled" and not (art / "manifest.json").exists():
+            print("  (sin manifest.json: correr train.py o api/compiled.py)", file=sys.stderr)
+            continue
+        env = {**os.environ, "MODEL_FORMAT": fmt, "LOG_LEVEL": "WARNING", "ARTIFACTS_DIR": str(art.resolve())}
+        runs = [run_child([sys.executable, "-c", "import api.app"], env=env) for _ in range(args.startup_runs)]
+        ok = [r for r in runs if r["ok"]]
+        out = summarize([r["wall_s"] for r in ok], sum(r["wall_s"] for r in ok), units=len(ok))
+        out.pop("per_second")
+        results.append({
+            "suite": "startup",
+            "name": f"startup/{fmt}",
+            "model_format": fmt,
+            "artifact_mb": sizes[fmt],
+            **out,
+            "errors": len(runs) - len(ok),
+            "peak_rss_mb": max((r["peak_rss_mb"] for r in ok), default=None),
+        })
+        print(f"  {results[-1]['name']:32s} p50={out['latency_ms']['p50']:.1f}ms "
+              f"rss={results[-1]['peak_rss_mb']}MB size={sizes[fmt]}MB", file=sys.stderr)
+    return results
+
+
+# ---------------------- Features ----------------------
+
+_FEATURES_CHILD = """
+import json, sys, time
+from bench import scaled_frame
+from train import build_features
+df = scaled_frame(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+t0 = time.perf_counter()
+out, _, _ = build_features(df)
+json.dump({"build_s": time.perf_counter() - t0, "rows": len(out), "columns": out.shape[1],
+           "frame_mb": float(out.memory_usage(index=False).sum()) / 2 ** 20}, open(sys.argv[4], "w"))
+"""
+
+
+def bench_features(args) -> List[Dict[str, Any]]:
+    """
+    build_features sobre datos sintéticos de varias estaciones (ver scaled_frame),
+    cada escala en un proceso nuevo para medir su RSS máximo por separado.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_features_") as tmp:
+        for scale in _ints(args.feature_scales):
+            report = Path(tmp) / f"x{scale}.json"
+            cmd = [sys.executable, "-c", _FEATURES_CHILD, args.csv, str(scale), str(args.stations), str(report)]
+            run = run_child(cmd, args.train_timeout)
+            out = json.loads(report.read_text()) if run["ok"] else {}
+            results.append({
+                "suite": "features",
+                "name": f"features/x{scale}",
+                "scale": scale,
+                "stations": max(1, min(args.stations, scale)),
+                "rows": out.get("rows"),
+                "build_s": round(out["build_s"], 3) if out else None,
+                "rows_per_second": round(out["rows"] / out["build_s"], 1) if out else None,
+                "frame_mb": round(out["frame_mb"], 1) if out else None,
+                **run,
+            })
+            print(f"  {results[-1]['name']:32s} rows={out.get('rows')} build={results[-1]['build_s']}s "
+                  f"rss={run.get('peak_rss_mb')}MB ok={run['ok']}", file=sys.stderr)
+    return results
+
+
+# ---------------------- Entrenamiento ----------------------
+
+def scaled_frame(src: Path, scale: int, stations: int = 1):
+    """
+    Repite el CSV `scale` veces: las copias se reparten entre `stations`
+    estaciones (columna name) y, dentro de cada una, se desplazan las fechas
+    para que siga siendo una serie diaria continua (más larga).
+    """
+    import pandas as pd
+    df = pd.read_csv(src)
+    dt = pd.to_datetime(df["datetime"])
+    span = (dt.max() - dt.min()) + pd.Timedelta(days=1)
+    stations = max(1, min(stations, scale))
+    parts = []
+    for k in range(scale):
+        part = df.copy()
+        part["datetime"] = (dt + (k // stations) * span).dt.strftime("%Y-%m-%d")
+        if stations > 1:
+            part["name"] = f"station-{k % stations:04d}"
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def scaled_csv(src: Path, scale: int, dst: Path, stations: int = 1) -> int:
+    out = scaled_frame(src, scale, stations)
+    out.to_csv(dst, index=False)
+    return len(out)
+
+
+def bench_train(args) -> List[Dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_train_") as tmp:
+        tmp = Path(tmp)
+        for scale in _ints(args.scales):
+            csv = tmp / f"x{scale}.csv"
+            n_rows = scaled_csv(Path(args.csv), scale, csv, args.stations)
+            cmd = [sys.executable, str(HERE / "train.py"), "--csv", str(csv), "--out", str(tmp / f"out_x{scale}"), "--no-cache"]
+            run = run_child(cmd, args.train_timeout)
+            results.append({
+                "suite": "train",
+                "name": f"train/x{scale}",
+                "scale": scale,
+                "rows": n_rows,
+                "rows_per_second": round(n_rows / run["wall_s"], 1) if run.get("ok") else None,
+                **run,
+            })
+            print(f"  {results[-1]['name']:32s} rows={n_rows} wall={run['wall_s']}s "
+                  f"rss={run.get('peak_rss_mb')}MB ok={run['ok']}", file=sys.stderr)
+    return results
+
+
+# ---------------------- Reporte ----------------------
+
+def _meta(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    versions = {}
+    for mod in ("numpy", "pandas", "sklearn", "fastapi", "httpx"):
+        try:
+            versions[mod] = __import__(mod).__version__
+        except Exception:
+            versions[mod] = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+        "args": {k: v for k, v in vars(args).items() if k != "func"},
+    }
+
+
+def _headline(r: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    lat = r.get("latency_ms") or {}
+    return {
+        "p50_ms": lat.get("p50"),
+        "p99_ms": lat.get("p99"),
+        "per_s": r.get("requests_per_second", r.get("rows_per_second")),
+        "wall_s": r.get("wall_s") if r.get("suite") == "train" else r.get("build_s"),
+        "mb": r.get("artifact_mb"),
+        "rss_mb": r.get("peak_rss_mb"),
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """Tabla de cambios relativos por benchmark (mismo `name` en ambas corridas)."""
+    before = {r["name"]: _headline(r) for r in old.get("results", [])}
+    print(f"\ncomparado con {old.get('meta', {}).get('commit')} ({old.get('meta', {}).get('timestamp')})")
+    for r in new["results"]:
+        prev = before.get(r["name"])
+        if prev is None:
+            continue
+        cur = _headline(r)
+        cells = []
+        for k, v in cur.items():
+            p = prev.get(k)
+            if v is None or not p:
+                continue
+            cells.append(f"{k}={v} ({(v - p) / p * 100:+.1f}%)")
+        print(f"  {r['name']:32s} " + "  ".join(cells))
+
+
+SUITES = {"model": bench_model, "startup": bench_startup, "api": bench_api, "features": bench_features,
+          "train": bench_train}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarks de latencia/throughput de la API y el entrenamiento")
+    ap.add_argument("suite", choices=[*SUITES, "all"])
+    ap.add_argument("--csv", default="weather_2years_with_esp_filled.csv")
+    ap.add_argument("--model", default="artifacts/model.pkl")
+    ap.add_argument("--features", default="artifacts/feature_names.json")
+    ap.add_argument("--payload", default="sample_payload.json")
+    ap.add_argument("--out", default=None, help="JSON de resultados (por defecto bench_results/<fecha>_<suite>.json)")
+    ap.add_argument("--compare", default=None, help="JSON de una corrida anterior para comparar")
+    # modelo
+    ap.add_argument("--batch-sizes", default="1,16,256,4096")
+    ap.add_argument("--iterations", type=int, default=200)
+    # API
+    ap.add_argument("--endpoints", default=",".join(API_ENDPOINTS))
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--requests", type=int, default=500, help="requests por endpoint y nivel de concurrencia")
+    ap.add_argument("--upstream-latency-ms", type=float, default=50.0)
+    ap.add_argument("--cold", action="store_true", help="sin caché de clima ni telemetría reciente")
+    # arranque
+    ap.add_argument("--startup-runs", type=int, default=10)
+    # features
+    ap.add_argument("--feature-scales", default="1,10,100,1000")
+    ap.add_argument("--stations", type=int, default=10, help="estaciones sintéticas en features/train")
+    # entrenamiento
+    ap.add_argument("--scales", default="1,10,100", help="p.ej. 1,10,100,1000")
+    ap.add_argument("--train-timeout", type=float, default=None)
+    ap.add_argument("--warmup", type=int, default=10)
+    args = ap.parse_args()
+
+    # Rutas relativas a AI/, igual que la API y train.py
+    os.chdir(HERE)
+    sys.path.insert(0, str(HERE))
+
+    results: List[Dict[str, Any]] = []
+    for name in (SUITES if args.suite == "all" else [args.suite]):
+        print(f"[{name}]", file=sys.stderr)
+        results += SUITES[name](args)
+
+    report = {"meta": _meta(args), "results": results}
+    out = Path(args.out or f"bench_results/{datetime.now():%Y%m%d_%H%M%S}_{args.suite}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"[OK] Resultados guardados en {out}", file=sys.stderr)
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+
+
+if __name__ == "__main__":
+    main()
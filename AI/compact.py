@@ -0,0 +1,244 @@
+# AI/compact.py
+"""
+Compactación del modelo con presupuesto de métricas.
+
+  python compact.py --csv weather_2years_with_esp_filled.csv
+  ARTIFACTS_DIR=artifacts_compact uvicorn api.app:app
+
+Busca el modelo más barato (árboles x profundidad = pasos de
+CompiledPipeline.predict_proba) que se mantenga dentro de la tolerancia de
+ROC-AUC / average precision del bosque completo en el split de test de
+train.py, y que coincida con sus etiquetas (al corte de decisión) en al menos
+`--min-agreement` de las filas: el test tiene muy pocos positivos, así que la
+métrica sola no alcanza para decidir.
+
+Candidatos:
+- sub-ensamble (primeros N árboles) podado a una profundidad máxima
+  (CompiledPipeline.compact, sin reentrenar);
+- destilado: RandomForestRegressor poco profundo ajustado a las
+  probabilidades del bosque sobre el tramo de entrenamiento (más copias con
+  ruido, para que las etiquetas blandas no sean solo las del ajuste). Se
+  ajusta una vez con el máximo de árboles/profundidad y los tamaños menores
+  salen del mismo corte que los sub-ensambles.
+
+Escribe el artefacto compilado del elegido en --out (manifest.json +
+compiled/, feature_names.json y metrics.json con el corte de decisión) y
+compaction_report.json con tamaño, latencia de una fila, throughput por lote
+y deltas de métricas de todos los candidatos.
+"""
+import argparse, json, shutil, sys, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import average_precision_score, roc_auc_score
+from sklearn.pipeline import Pipeline
+
+from api.compiled import CompiledPipeline
+from api.registry import decision_threshold
+from data import DEFAULT_CACHE_DIR, load_features
+from train import time_split
+
+TREES = [10, 25, 50, 100, 150, 200, 300, 400, 600]
+DEPTHS = [4, 6, 8, 10, 12, 16, None]
+DISTILL_TREES = [10, 25, 50]
+DISTILL_DEPTHS = [4, 6, 8]
+
+
+def _metric(fn, y: np.ndarray, proba: np.ndarray) -> Optional[float]:
+    return float(fn(y, proba)) if 0 < y.sum() < len(y) else None
+
+
+def _delta(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return None if a is None or b is None else round(a - b, 6)
+
+
+def latency(engine: CompiledPipeline, X: np.ndarray, single_iters: int, batch_rows: int) -> Dict[str, float]:
+    """p50 de una fila (ms) y filas/s con un lote de `batch_rows`."""
+    rows = X[np.arange(single_iters) % len(X)]
+    times = []
+    for x in rows:
+        t0 = time.perf_counter()
+        engine.predict_proba(x[None, :])
+        times.append(time.perf_counter() - t0)
+    batch = X[np.arange(batch_rows) % len(X)]
+    t0 = time.perf_counter()
+    engine.predict_proba(batch)
+    wall = time.perf_counter() - t0
+    return {"single_row_p50_ms": round(float(np.median(times)) * 1e3, 4),
+            "batch_rows_per_second": round(batch_rows / wall, 1)}
+
+
+def staged_tree_proba(engine: CompiledPipeline, X: np.ndarray, depths: List[int]) -> Dict[int, np.ndarray]:
+    """
+    Probabilidad de cada árbol (filas x árboles) al cortar en cada profundidad
+    de `depths`, con un solo recorrido del bosque: cualquier sub-ensamble de
+    los primeros N árboles es después un promedio acumulado.
+    """
+    Xt = engine.transform(X)
+    rows = np.arange(len(Xt))[:, None]
+    nodes = np.broadcast_to(engine.roots, (len(Xt), engine.n_trees)).copy()
+    out = {}
+    for step in range(1, engine.depth + 1):
+        go_left = Xt[rows, engine.feature[nodes]] <= engine.threshold[nodes]
+        nodes = np.where(go_left, engine.left[nodes], engine.right[nodes])
+        if step in depths or step == engine.depth:
+            out[step] = np.asarray(engine.leaf_proba)[nodes]
+    return out
+
+
+def distill(pipe: Pipeline, X_train: np.ndarray, features: List[str], n_trees: int, depth: int,
+            augment: int, noise: float, seed: int) -> CompiledPipeline:
+    """Bosque de regresión poco profundo sobre las probabilidades del bosque (espacio ya escalado)."""
+    pre = pipe.named_steps["pre"]
+    teacher = pipe.named_steps["clf"]
+    Xt = pre.transform(_frame(X_train, features))
+    rng = np.random.default_rng(seed)
+    Xa = np.vstack([Xt] + [Xt + rng.normal(0.0, noise, Xt.shape) for _ in range(augment)])
+    soft = teacher.predict_proba(Xa)[:, list(teacher.classes_).index(1)]
+    student = RandomForestRegressor(n_estimators=n_trees, max_depth=depth, min_samples_leaf=2,
+                                    random_state=seed, n_jobs=-1).fit(Xa, soft)
+    return CompiledPipeline.from_pipeline(Pipeline([("pre", pre), ("clf", student)]), features)
+
+
+def _frame(X: np.ndarray, features: List[str]):
+    import pandas as pd
+    return pd.DataFrame(X, columns=features)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Busca el modelo compilado más chico dentro de una tolerancia de métricas")
+    ap.add_argument("--csv", nargs="+", required=True, help="uno o varios CSV (se aceptan globs) o un archivo de series")
+    ap.add_argument("--artifacts", default="artifacts")
+    ap.add_argument("--out", default="artifacts_compact")
+    ap.add_argument("--tol-auc", type=float, default=0.01, help="caída máxima de ROC-AUC en test")
+    ap.add_argument("--tol-ap", type=float, default=0.02, help="caída máxima de average precision en test")
+    ap.add_argument("--min-agreement", type=float, default=0.99,
+                    help="fracción mínima de filas con la misma etiqueta que el bosque completo")
+    ap.add_argument("--augment", type=int, default=4, help="copias con ruido para destilar")
+    ap.add_argument("--noise", type=float, default=0.1, help="desvío del ruido (en unidades escaladas)")
+    ap.add_argument("--no-distill", action="store_true")
+    ap.add_argument("--single-iters", type=int, default=200)
+    ap.add_argument("--batch-rows", type=int, default=4096)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    ap.add_argument("--no-cache", action="store_true")
+    args = ap.parse_args()
+
+    art = Path(args.artifacts)
+    features = json.loads((art / "feature_names.json").read_text(encoding="utf-8"))
+    pipe = joblib.load(art / "model.pkl")
+    cut = decision_threshold(art)
+    full = CompiledPipeline.from_pipeline(pipe, features)
+
+    df, _, _, _ = load_features(args.csv, None if args.no_cache else Path(args.cache_dir))
+    train_df, test_df = time_split(df)
+    X_all = df.reindex(columns=features).to_numpy(dtype=np.float64)
+    X_train = train_df.reindex(columns=features).to_numpy(dtype=np.float64)
+    X_test = test_df.reindex(columns=features).to_numpy(dtype=np.float64)
+    y_test = test_df["risk_next_day"].to_numpy()
+
+    ref_test = full.predict_proba(X_test)
+    ref_labels = full.predict_proba(X_all) >= cut
+    ref = {"roc_auc": _metric(roc_auc_score, y_test, ref_test),
+           "avg_precision": _metric(average_precision_score, y_test, ref_test)}
+
+    candidates: List[Dict[str, Any]] = []
+
+    def add(kind: str, engine: CompiledPipeline, proba_all: np.ndarray, **params: Any) -> None:
+        proba = proba_all[len(train_df):]
+        auc = _metric(roc_auc_score, y_test, proba)
+        apr = _metric(average_precision_score, y_test, proba)
+        agreement = float(np.mean((proba_all >= cut) == ref_labels))
+        ok = (agreement >= args.min_agreement
+              and (ref["roc_auc"] is None or (auc is not None and auc >= ref["roc_auc"] - args.tol_auc))
+              and (ref["avg_precision"] is None or (apr is not None and apr >= ref["avg_precision"] - args.tol_ap)))
+        candidates.append({
+            "kind": kind,
+            **params,
+            "n_trees": engine.n_trees,
+            "depth": engine.depth,
+            "n_nodes": int(len(engine.left)),
+            "cost": engine.n_trees * engine.depth,
+            "bytes": engine.nbytes,
+            "roc_auc": auc,
+            "avg_precision": apr,
+            "delta_roc_auc": _delta(auc, ref["roc_auc"]),
+            "delta_avg_precision": _delta(apr, ref["avg_precision"]),
+            "label_agreement": round(agreement, 6),
+            "max_abs_diff_test": round(float(np.max(np.abs(proba - ref_test))), 6),
+            "within_tolerance": ok,
+            "_engine": engine,
+        })
+
+    t0 = time.perf_counter()
+    staged = {d: np.cumsum(p, axis=1) for d, p in staged_tree_proba(full, X_all, DEPTHS).items()}
+    for n in TREES:
+        for d in DEPTHS:
+            if n <= full.n_trees and (d is None or d < full.depth):
+                proba_all = staged[d or full.depth][:, n - 1] / n
+                add("subset", full.compact(n, d), proba_all, trees=n, max_depth=d)
+    if not args.no_distill:
+        student = distill(pipe, X_train, features, max(DISTILL_TREES), max(DISTILL_DEPTHS),
+                          args.augment, args.noise, args.seed)
+        staged = {d: np.cumsum(p, axis=1) for d, p in staged_tree_proba(student, X_all, DISTILL_DEPTHS).items()}
+        for n in DISTILL_TREES:
+            for d in DISTILL_DEPTHS:
+                d = min(d, student.depth)
+                add("distilled", student.compact(n, d), staged[d][:, n - 1] / n, trees=n, max_depth=d)
+    search_s = time.perf_counter() - t0
+
+    passing = [c for c in candidates if c["within_tolerance"]]
+    best = min(passing, key=lambda c: (c["cost"], c["n_nodes"])) if passing else None
+
+    best_engine = best["_engine"] if best else None
+    for c in candidates:
+        del c["_engine"]
+    if best is not None:
+        best.update(latency(best_engine, X_all, args.single_iters, args.batch_rows))
+    full_info = {
+        "n_trees": full.n_trees, "depth": full.depth, "n_nodes": int(len(full.left)),
+        "cost": full.n_trees * full.depth, "bytes": full.nbytes,
+        "pickle_bytes": (art / "model.pkl").stat().st_size, **ref,
+        **latency(full, X_all, args.single_iters, args.batch_rows),
+    }
+    report = {
+        "full": full_info,
+        "decision_threshold": cut,
+        "tolerance": {"roc_auc": args.tol_auc, "avg_precision": args.tol_ap, "label_agreement": args.min_agreement},
+        "test_rows": int(len(y_test)),
+        "test_positives": int(y_test.sum()),
+        "search_seconds": round(search_s, 3),
+        "selected": best,
+        "candidates": candidates,
+    }
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    if best is not None:
+        # Mismo layout que artifacts/: la API lo sirve con ARTIFACTS_DIR=<out>
+        shutil.copyfile(art / "feature_names.json", out / "feature_names.json")
+        best["version"] = best_engine.save(out, source=f"{best['kind']}:{art / 'model.pkl'}")["version"]
+        metrics = json.loads((art / "metrics.json").read_text(encoding="utf-8"))
+        metrics["decision_threshold"] = cut
+        metrics["compaction"] = best
+        (out / "metrics.json").write_text(json.dumps(metrics, indent=2, ensure_ascii=False), encoding="utf-8")
+    (out / "compaction_report.json").write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"[INFO] Bosque completo: {full.n_trees} árboles, profundidad {full.depth}, "
+          f"{full_info['bytes'] / 1e6:.2f} MB, 1 fila p50 {full_info['single_row_p50_ms']} ms, "
+          f"{full_info['batch_rows_per_second']} filas/s")
+    if best is None:
+        print(f"[WARN] Ningún candidato ({len(candidates)}) cumple la tolerancia; ver {out}/compaction_report.json")
+        sys.exit(1)
+    print(f"[OK] Elegido {best['kind']} trees={best['trees']} max_depth={best['max_depth']}: "
+          f"{best['bytes'] / 1e6:.2f} MB, 1 fila p50 {best['single_row_p50_ms']} ms, "
+          f"{best['batch_rows_per_second']} filas/s, ΔROC-AUC={best['delta_roc_auc']} "
+          f"ΔAP={best['delta_avg_precision']}, acuerdo={best['label_agreement']}")
+    print(f"[OK] Artefacto compacto {best['version']} en {out}/")
+
+
+if __name__ == "__main__":
+    main()
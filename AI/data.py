@@ -0,0 +1,209 @@
+# AI/data.py
+"""
+Carga de datos de entrenamiento.
+
+- `read_sources` lee uno o varios CSV por bloques (chunksize) y solo las
+  columnas que usa el modelo, con dtypes explícitos: las columnas de texto de
+  Visual Crossing (description, stations, sunrise, ...) ni se parsean.
+- `load_features` devuelve la salida de train.py::build_features y la guarda
+  en una caché columnar (.npy por columna + meta.json) cuya clave es el hash
+  del contenido de los CSV y de la versión de las features; las corridas
+  siguientes (y los folds de la CV) la abren con mmap sin parsear ni recalcular.
+- Donde va un CSV también puede ir el directorio del archivo de series
+  (api/archive.py, ver get_weather.py): se leen las series de clima como
+  vistas de sus memmap, solo el rango pedido, sin parsear texto.
+"""
+import argparse, glob, hashlib, json, os, shutil, time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from api.archive import Archive, iter_frames
+
+# Formato de la caché; el código de las features entra solo en la clave (ver sources_key)
+CACHE_VERSION = 1
+# Junto al código (AI/.cache), como artifacts/ y sites.json: no depende del directorio de trabajo
+DEFAULT_CACHE_DIR = str(Path(__file__).resolve().parent / ".cache" / "features")
+CHUNK_ROWS = 200_000
+
+# Texto que train.py descarta igual (ver `exclude` en train.main)
+SKIP_COLUMNS = {"description", "icon", "stations", "sunrise", "sunset", "preciptype", "conditions"}
+
+# Columnas conocidas del export diario de Visual Crossing + ESP32
+DTYPES: Dict[str, Any] = {
+    "name": "category", "station": "category", "device_id": "category",
+    "datetime": str,
+    **{c: "float64" for c in (
+        "tempmax", "tempmin", "temp", "feelslikemax", "feelslikemin", "feelslike", "dew", "humidity",
+        "precip", "precipprob", "precipcover", "snow", "snowdepth", "windgust", "windspeed", "winddir",
+        "sealevelpressure", "cloudcover", "visibility", "solarradiation", "solarenergy", "uvindex",
+        "severerisk", "moonphase", "distance_cm", "level_pct", "fill_pct", "water_height_cm",
+        "max_depth_cm", "headspace_cm", "usable_depth_cm",
+    )},
+}
+
+
+def expand_sources(patterns: Iterable[str]) -> List[Path]:
+    """Rutas o globs -> lista ordenada de CSV / archivos de series (error si un patrón no encuentra nada)."""
+    paths: List[Path] = []
+    for pattern in patterns:
+        found = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not found or not all(Path(p).is_file() or Archive.is_archive(Path(p)) for p in found):
+            raise FileNotFoundError(f"No se encontró ningún CSV para {pattern!r}.")
+        paths += [Path(p) for p in found]
+    return paths
+
+
+def filter_range(df: pd.DataFrame, start: Any = None, end: Any = None) -> pd.DataFrame:
+    """Filas con start <= datetime <= end (extremos opcionales)."""
+    if start is None and end is None:
+        return df
+    dt = pd.to_datetime(df["datetime"])
+    keep = np.ones(len(df), dtype=bool)
+    if start is not None:
+        keep &= (dt >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        keep &= (dt <= pd.Timestamp(end)).to_numpy()
+    return df[keep]
+
+
+def iter_chunks(paths: Sequence[Path], chunksize: int = CHUNK_ROWS, start: Any = None,
+                end: Any = None) -> Iterator[pd.DataFrame]:
+    """Bloques de cada fuente, solo las filas con start <= datetime <= end."""
+    for path in paths:
+        if Archive.is_archive(path):
+            yield from iter_frames(Archive(path), start=start, end=end, chunk_rows=chunksize)
+            continue
+        for chunk in pd.read_csv(path, usecols=lambda c: c not in SKIP_COLUMNS, dtype=DTYPES, chunksize=chunksize):
+            yield filter_range(chunk, start, end)
+
+
+def read_sources(paths: Sequence[Path], chunksize: int = CHUNK_ROWS) -> pd.DataFrame:
+    chunks = list(iter_chunks(paths, chunksize))
+    if not chunks:
+        raise ValueError("Los CSV no tienen filas.")
+    # Bloques con categorías distintas se concatenan como object: se vuelven a categorizar
+    df = pd.concat(chunks, ignore_index=True)
+    for col in ("name", "station", "device_id"):
+        if col in df.columns and df[col].dtype != "category":
+            df[col] = df[col].astype("category")
+    return df
+
+
+# ---------------------- Caché ----------------------
+
+def sources_key(paths: Sequence[Path]) -> str:
+    """
+    Hash del contenido de los CSV (en orden), del formato de la caché, de cómo
+    se leen (DTYPES, SKIP_COLUMNS, iter_chunks, read_sources) y del código que
+    arma las features (features.py y build_features, group_column,
+    GROUP_COLUMNS y _detect_water_cols de train.py): cambiar cualquiera de
+    ellos invalida las entradas anteriores.
+    """
+    import inspect
+    import features
+    import train
+
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode("ascii"))
+    digest.update(Path(features.__file__).read_bytes())
+    for fn in (iter_chunks, read_sources, train.build_features, train.group_column, train._detect_water_cols):
+        digest.update(inspect.getsource(fn).encode("utf-8"))
+    settings = {"dtypes": DTYPES, "skip": sorted(SKIP_COLUMNS), "groups": train.GROUP_COLUMNS}
+    digest.update(json.dumps(settings, sort_keys=True, default=lambda t: t.__name__).encode("utf-8"))
+    for path in paths:
+        digest.update(b"\0")
+        if Archive.is_archive(path):
+            # Append-only: filas, último timestamp y columnas de cada serie identifican el contenido
+            digest.update(json.dumps(Archive(path).state()).encode("utf-8"))
+            continue
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:24]
+
+
+def save_frame(df: pd.DataFrame, out_dir: Path, meta: Dict[str, Any]) -> None:
+    """Una columna por .npy; texto/categorías como unicode de ancho fijo."""
+    tmp = out_dir.with_name(f".{out_dir.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    columns = []
+    for i, col in enumerate(df.columns):
+        s = df[col]
+        categorical = isinstance(s.dtype, pd.CategoricalDtype)
+        if pd.api.types.is_datetime64_any_dtype(s):
+            arr, kind = s.to_numpy(), "datetime"
+        elif pd.api.types.is_numeric_dtype(s) and not categorical:
+            arr, kind = s.to_numpy(), "numeric"
+        else:
+            # Texto sin pickle: unicode de ancho fijo + máscara de nulos
+            arr, kind = s.astype(str).to_numpy(dtype=str), "category" if categorical else "text"
+            np.save(tmp / f"{i}.null.npy", s.isna().to_numpy())
+        np.save(tmp / f"{i}.npy", arr)
+        columns.append({"name": col, "kind": kind})
+    (tmp / "meta.json").write_text(json.dumps({**meta, "columns": columns}, ensure_ascii=False, indent=2),
+                                   encoding="utf-8")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+
+
+def load_frame(out_dir: Path) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    meta = json.loads((out_dir / "meta.json").read_text(encoding="utf-8"))
+    cols: Dict[str, Any] = {}
+    for i, c in enumerate(meta["columns"]):
+        arr = np.load(out_dir / f"{i}.npy", mmap_mode="r" if c["kind"] == "numeric" else None)
+        if c["kind"] in ("category", "text"):
+            arr = arr.astype(object)
+            arr[np.load(out_dir / f"{i}.null.npy")] = None
+            if c["kind"] == "category":
+                arr = pd.Categorical(arr)
+        cols[c["name"]] = arr
+    return pd.DataFrame(cols, copy=False), meta
+
+
+def load_features(
+    patterns: Iterable[str], cache_dir: Optional[Path] = Path(DEFAULT_CACHE_DIR), chunksize: int = CHUNK_ROWS
+) -> Tuple[pd.DataFrame, float, List[str], Dict[str, Any]]:
+    """
+    (df, threshold_mm, water_cols, info) de build_features para los CSV dados.
+    Con cache_dir=None siempre parsea y recalcula.
+    """
+    from train import build_features
+
+    paths = expand_sources(patterns)
+    t0 = time.perf_counter()
+    key = sources_key(paths)
+    entry = Path(cache_dir) / key if cache_dir is not None else None
+    if entry is not None and (entry / "meta.json").exists():
+        df, meta = load_frame(entry)
+        info = {"cache": "hit", "key": key, "seconds": round(time.perf_counter() - t0, 3)}
+        return df, meta["threshold_mm"], meta["water_cols"], info
+
+    df, threshold_mm, water_cols = build_features(read_sources(paths, chunksize))
+    info = {"cache": "miss" if entry is not None else "off", "key": key}
+    if entry is not None:
+        save_frame(df, entry, {
+            "threshold_mm": threshold_mm,
+            "water_cols": water_cols,
+            "sources": [str(p) for p in paths],
+            "rows": len(df),
+        })
+    info["seconds"] = round(time.perf_counter() - t0, 3)
+    return df, threshold_mm, water_cols, info
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Precalcula (o muestra) la caché de features de train.py")
+    ap.add_argument("--csv", nargs="+", required=True, help="uno o varios CSV (se aceptan globs) o un archivo de series")
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = ap.parse_args()
+
+    df, threshold_mm, water_cols, info = load_features(args.csv, Path(args.cache_dir))
+    print(json.dumps({**info, "rows": len(df), "columns": df.shape[1], "threshold_mm": threshold_mm,
+                      "water_cols": water_cols}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
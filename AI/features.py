@@ -0,0 +1,312 @@
+# AI/features.py
+"""
+Definición única de las features derivadas (rolling/lag) del modelo.
+
+- `feature_specs` genera la lista ordenada de features a partir de las
+  columnas disponibles; train.py::build_features la aplica en lote con
+  `apply_specs` (NumPy, por bloques y por estación/dispositivo).
+- `OnlineFeatureEngine` calcula las mismas features de forma incremental
+  (sumas/varianzas móviles en O(1) y deques monótonos para max/min), para
+  servir requests en tiempo real sin recalcular rollings de pandas.
+"""
+import copy
+from collections import deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+WINDOWS = [3, 5, 7, 14]
+STD_WINDOW = 7
+
+# (columna fuente, estadístico, prefijo del nombre)
+CLIMATE_ROLLING = [
+    ("precip", "sum", "precip_sum"),
+    ("precip", "max", "precip_max"),
+    ("humidity", "mean", "humidity_mean"),
+    ("sealevelpressure", "mean", "slp_mean"),
+]
+
+
+class FeatureSpec(NamedTuple):
+    name: str
+    source: str
+    kind: str            # sum | mean | max | min | std | lag | diff | roc
+    window: int          # tamaño de ventana o desplazamiento
+    min_periods: int = 1
+
+
+def feature_specs(columns: Iterable[str], water_cols: Sequence[str]) -> List[FeatureSpec]:
+    """Features derivadas en el mismo orden en que build_features las agrega."""
+    columns = set(columns)
+    specs: List[FeatureSpec] = []
+    for w in WINDOWS:
+        for source, stat, prefix in CLIMATE_ROLLING:
+            if source in columns:
+                specs.append(FeatureSpec(f"{prefix}_{w}d", source, stat, w))
+
+    for col in water_cols:
+        specs += [
+            FeatureSpec(f"{col}_lag1", col, "lag", 1),
+            FeatureSpec(f"{col}_lag3", col, "lag", 3),
+            FeatureSpec(f"{col}_diff1", col, "diff", 1),
+            FeatureSpec(f"{col}_roc3", col, "roc", 3),
+        ]
+        for w in WINDOWS:
+            specs += [
+                FeatureSpec(f"{col}_mean_{w}d", col, "mean", w),
+                FeatureSpec(f"{col}_max_{w}d", col, "max", w),
+                FeatureSpec(f"{col}_min_{w}d", col, "min", w),
+            ]
+        specs.append(FeatureSpec(f"{col}_std_{STD_WINDOW}d", col, "std", STD_WINDOW, 2))
+    return specs
+
+
+def water_cols_from_features(features: Sequence[str]) -> List[str]:
+    """Columnas de agua usadas en entrenamiento, deducidas de feature_names.json."""
+    return [f[: -len("_lag1")] for f in features if f.endswith("_lag1")]
+
+
+# ---------------------- Lote (NumPy) ----------------------
+
+# Filas por bloque al armar ventanas (n, w): acota la memoria a BLOCK_ROWS * w valores
+BLOCK_ROWS = 1 << 16
+
+
+def group_starts(groups) -> np.ndarray:
+    """Para cada fila, el índice de la primera fila de su grupo (filas de un grupo contiguas)."""
+    codes = np.asarray(groups)
+    n = len(codes)
+    new = np.ones(n, dtype=bool)
+    new[1:] = codes[1:] != codes[:-1]
+    return np.maximum.accumulate(np.where(new, np.arange(n), 0))
+
+
+def _shift(x: np.ndarray, start: np.ndarray, k: int) -> np.ndarray:
+    """x desplazado k filas dentro de cada grupo (NaN al inicio del grupo), como groupby().shift(k)."""
+    i = np.arange(len(x)) - k
+    out = x[np.maximum(i, 0)].copy()
+    out[i < start] = np.nan
+    return out
+
+
+def _window_stats(x: np.ndarray, start: np.ndarray, w: int, kinds: Iterable[str]) -> Dict[str, np.ndarray]:
+    """
+    Todos los estadísticos de una ventana de tamaño w en una sola pasada, por
+    bloques de filas. Misma semántica que pandas rolling(w, min_periods) por
+    grupo: NaN se ignora; el min_periods se aplica en apply_specs.
+    """
+    kinds = set(kinds)
+    n = len(x)
+    out = {k: np.empty(n) for k in kinds | {"count"}}
+    offsets = np.arange(w) - (w - 1)
+    for b0 in range(0, n, BLOCK_ROWS):
+        rows = np.arange(b0, min(n, b0 + BLOCK_ROWS))
+        idx = rows[:, None] + offsets[None, :]
+        win = x[np.maximum(idx, 0)]
+        win[idx < start[rows, None]] = np.nan
+        valid = ~np.isnan(win)
+        count = valid.sum(axis=1)
+        total = np.where(valid, win, 0.0).sum(axis=1)
+        out["count"][rows] = count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            if "sum" in kinds:
+                out["sum"][rows] = total
+            if "mean" in kinds:
+                out["mean"][rows] = mean
+            if "max" in kinds:
+                out["max"][rows] = np.where(valid, win, -np.inf).max(axis=1)
+            if "min" in kinds:
+                out["min"][rows] = np.where(valid, win, np.inf).min(axis=1)
+            if "std" in kinds:
+                dev = np.where(valid, win - mean[:, None], 0.0)
+                out["std"][rows] = np.sqrt((dev * dev).sum(axis=1) / (count - 1))
+    return out
+
+
+def apply_specs(df, specs: Sequence[FeatureSpec], groups=None, dtype=np.float32):
+    """
+    Devuelve df con las columnas de `specs` agregadas. df debe venir ordenado
+    por fecha dentro de cada grupo (estación/dispositivo) y con los grupos
+    contiguos; `groups` es la columna (o array) de grupo, None = una sola serie.
+
+    Cada columna fuente se recorre una vez por tamaño de ventana calculando
+    todos sus estadísticos juntos, y las columnas nuevas se agregan con un solo
+    concat (en `dtype`) en lugar de insertarlas una por una.
+    """
+    import pandas as pd
+
+    if groups is None:
+        start = np.zeros(len(df), dtype=np.int64)
+    else:
+        start = group_starts(df[groups].to_numpy() if isinstance(groups, str) else groups)
+    by_source: Dict[str, List[FeatureSpec]] = {}
+    for s in specs:
+        by_source.setdefault(s.source, []).append(s)
+
+    cols: Dict[str, np.ndarray] = {}
+    for source, source_specs in by_source.items():
+        x = pd.to_numeric(df[source], errors="coerce").to_numpy(dtype=np.float64)
+        windows: Dict[int, set] = {}
+        for s in source_specs:
+            if s.kind not in ("lag", "diff", "roc"):
+                windows.setdefault(s.window, set()).add(s.kind)
+        stats = {w: _window_stats(x, start, w, kinds) for w, kinds in windows.items()}
+        for s in source_specs:
+            if s.kind == "lag":
+                v = _shift(x, start, s.window)
+            elif s.kind == "diff":
+                v = x - _shift(x, start, s.window)
+            elif s.kind == "roc":
+                v = (x - _shift(x, start, s.window)) / float(s.window)
+            else:
+                st = stats[s.window]
+                v = np.where(st["count"] >= max(s.min_periods, 1), st[s.kind], np.nan)
+            cols[s.name] = v.astype(dtype, copy=False)
+
+    # Mismo orden que specs (define el orden de feature_names.json). Si una columna
+    # ya existía (p.ej. un CSV con features precalculadas) se reemplaza.
+    cols = {s.name: cols[s.name] for s in specs}
+    base = df.drop(columns=[c for c in cols if c in df.columns])
+    return pd.concat([base, pd.DataFrame(cols, index=df.index)], axis=1)
+
+
+# ---------------------- Incremental ----------------------
+
+class _Window:
+    """Ventana móvil de tamaño fijo sobre una serie con NaN (mismas reglas que pandas)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values: deque = deque()
+        self.t = 0
+        self.n = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.maxq: deque = deque()  # (t, valor) decreciente
+        self.minq: deque = deque()  # (t, valor) creciente
+
+    def push(self, x: float) -> None:
+        t = self.t
+        self.t += 1
+        self.values.append(x)
+        if x == x:
+            self.n += 1
+            self.total += x
+            delta = x - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (x - self.mean)
+            while self.maxq and self.maxq[-1][1] <= x:
+                self.maxq.pop()
+            self.maxq.append((t, x))
+            while self.minq and self.minq[-1][1] >= x:
+                self.minq.pop()
+            self.minq.append((t, x))
+
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            if old == old:
+                self.n -= 1
+                self.total -= old
+                if self.n:
+                    delta = old - self.mean
+                    self.mean -= delta / self.n
+                    self.m2 -= delta * (old - self.mean)
+                else:
+                    self.mean = self.m2 = 0.0
+        start = self.t - self.size
+        while self.maxq and self.maxq[0][0] < start:
+            self.maxq.popleft()
+        while self.minq and self.minq[0][0] < start:
+            self.minq.popleft()
+
+    def stat(self, kind: str, min_periods: int) -> float:
+        if self.n < min_periods or self.n == 0:
+            return np.nan
+        if kind == "sum":
+            return self.total
+        if kind == "mean":
+            return self.total / self.n
+        if kind == "max":
+            return self.maxq[0][1]
+        if kind == "min":
+            return self.minq[0][1]
+        if kind == "std":
+            return float(np.sqrt(max(self.m2, 0.0) / (self.n - 1)))
+        raise ValueError(kind)
+
+
+class _Series:
+    def __init__(self, windows: Iterable[int], max_lag: int):
+        self.windows = {w: _Window(w) for w in windows}
+        self.recent: deque = deque(maxlen=max_lag + 1)
+
+    def push(self, x: float) -> None:
+        self.recent.append(x)
+        for win in self.windows.values():
+            win.push(x)
+
+    def lag(self, k: int) -> float:
+        return self.recent[-1 - k] if len(self.recent) > k else np.nan
+
+
+def _num(v: Any) -> float:
+    try:
+        return float(v) if v is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class OnlineFeatureEngine:
+    """
+    Estado incremental por serie fuente. `push` registra una fila (un día) y
+    devuelve sus features derivadas; `peek` calcula las de una fila sin
+    registrarla (p.ej. la lectura actual de un request).
+    """
+
+    def __init__(self, specs: Sequence[FeatureSpec]):
+        self.specs = list(specs)
+        windows: Dict[str, set] = {}
+        lags: Dict[str, int] = {}
+        for s in self.specs:
+            if s.kind in ("lag", "diff", "roc"):
+                lags[s.source] = max(lags.get(s.source, 0), s.window)
+            else:
+                windows.setdefault(s.source, set()).add(s.window)
+        self.sources = sorted(set(windows) | set(lags))
+        self.series = {src: _Series(windows.get(src, ()), lags.get(src, 0)) for src in self.sources}
+
+    @classmethod
+    def for_features(cls, features: Sequence[str]) -> "OnlineFeatureEngine":
+        wanted = set(features)
+        return cls([s for s in feature_specs(features, water_cols_from_features(features)) if s.name in wanted])
+
+    def push_value(self, source: str, value: Any) -> None:
+        self.series[source].push(_num(value))
+
+    def push(self, row: Dict[str, Any], sources: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        for src in (self.sources if sources is None else sources):
+            self.series[src].push(_num(row.get(src)))
+        return self.current(sources)
+
+    def peek(self, row: Dict[str, Any], sources: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        return copy.deepcopy(self).push(row, sources)
+
+    def current(self, sources: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """Features derivadas de la última fila registrada."""
+        wanted = set(self.sources if sources is None else sources)
+        out: Dict[str, float] = {}
+        for s in self.specs:
+            if s.source not in wanted:
+                continue
+            ser = self.series[s.source]
+            if s.kind == "lag":
+                out[s.name] = ser.lag(s.window)
+            elif s.kind == "diff":
+                out[s.name] = ser.lag(0) - ser.lag(s.window)
+            elif s.kind == "roc":
+                out[s.name] = (ser.lag(0) - ser.lag(s.window)) / float(s.window)
+            else:
+                out[s.name] = ser.windows[s.window].stat(s.kind, s.min_periods)
+        return out
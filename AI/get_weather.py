@@ -1,28 +1,100 @@
-import requests
+# AI/get_weather.py
+"""
+Histórico diario de Visual Crossing -> archivo local de series (api/archive.py).
+
+  python get_weather.py --start 2020-11-01 --end 2020-11-16
+  python get_weather.py --import weather_2years_with_esp_filled.csv eta_iota.csv
+  python get_weather.py --start 2020-11-01 --end 2020-11-16 --csv eta_iota.csv
+
+Solo pide los rangos de fechas que todavía no están en el archivo para ese
+sitio (una request por rango contiguo faltante); los días ya archivados no
+se vuelven a descargar. --import carga CSV existentes (mismo formato) y
+--csv exporta el rango del archivo a CSV. train.py / backfill.py leen el
+archivo directo con --csv archive / --input archive.
+"""
+import argparse, io, json, os
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from api.archive import WEATHER, Archive, append_frame, read_frame
+from data import DTYPES, SKIP_COLUMNS, expand_sources, iter_chunks
 
 # Coordenadas de ubicación
 lat, lon = 15.5645, -88.0286
 
-API_KEY = "HHPMJQETSARBF4BUCVZMRPBH8"
-
-#fechas modificables
-start_date = "2020-11-01"
-end_date   = "2020-11-16"
-
-url = (
-    f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
-    f"{lat},{lon}/{start_date}/{end_date}"
-    f"?unitGroup=metric&include=days&key={API_KEY}&contentType=csv"
-)
-
-print("⏳ Descargando datos desde Visual Crossing...")
-response = requests.get(url)
-
-if response.status_code == 200:
-    filename = "eta_iota.csv"
-    with open(filename, "wb") as f:
-        f.write(response.content)
-    print(f"✅ Datos guardados en {filename}")
-else:
-    print("❌ Error al descargar:")
-    print(response.status_code, response.text)
+API_KEY = os.getenv("VISUAL_CROSSING_KEY", "HHPMJQETSARBF4BUCVZMRPBH8")
+BASE_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
+
+DEFAULT_ARCHIVE = "archive"
+
+
+def missing_ranges(archive: Archive, key: str, start: pd.Timestamp, end: pd.Timestamp) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Rangos contiguos de días de [start, end] que no están en la serie `key`."""
+    days = pd.date_range(start, end, freq="D")
+    have = archive.series(WEATHER, key, "name").read(start, end, columns=[])[0]
+    missing = ~np.isin(days.to_numpy(dtype="datetime64[s]").astype(np.int64), have.astype(np.int64))
+    # Cortes donde cambia faltante/presente
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], missing, [False]]).astype(np.int8)))
+    return [(days[a], days[b - 1]) for a, b in zip(edges[::2], edges[1::2])]
+
+
+def fetch_days(start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    import requests
+
+    url = (
+        f"{BASE_URL}{lat},{lon}/{start.date()}/{end.date()}"
+        f"?unitGroup=metric&include=days&key={API_KEY}&contentType=csv"
+    )
+    response = requests.get(url, timeout=60)
+    if response.status_code != 200:
+        raise SystemExit(f"❌ Error al descargar {start.date()}..{end.date()}: {response.status_code} {response.text}")
+    return pd.read_csv(io.BytesIO(response.content), usecols=lambda c: c not in SKIP_COLUMNS, dtype=DTYPES)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Descarga al archivo local solo los días de clima que faltan")
+    ap.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    ap.add_argument("--start", type=pd.Timestamp, default=None, help="primer día (YYYY-MM-DD)")
+    ap.add_argument("--end", type=pd.Timestamp, default=None, help="último día (por defecto, ayer)")
+    ap.add_argument("--import", dest="import_csv", nargs="+", default=None, metavar="CSV",
+                    help="carga CSV ya descargados al archivo (se aceptan globs)")
+    ap.add_argument("--csv", default=None, help="exporta el rango [start, end] del archivo a este CSV")
+    ap.add_argument("--dry-run", action="store_true", help="solo muestra los rangos que faltan")
+    args = ap.parse_args()
+
+    archive = Archive(Path(args.archive))
+    key = f"{lat},{lon}"
+
+    if args.import_csv:
+        for path in expand_sources(args.import_csv):
+            added = {}
+            for chunk in iter_chunks([path]):
+                for k, n in append_frame(archive, chunk).items():
+                    added[k] = added.get(k, 0) + n
+            print(f"✅ {path}: {json.dumps(added, ensure_ascii=False)} días nuevos")
+
+    if args.start is not None:
+        end = args.end or pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+        ranges = missing_ranges(archive, key, args.start, end)
+        if not ranges:
+            print(f"✅ {key}: {args.start.date()}..{end.date()} ya está en {args.archive}/")
+        for a, b in ranges:
+            print(f"⏳ Descargando {a.date()}..{b.date()} desde Visual Crossing...")
+            if args.dry_run:
+                continue
+            # La serie se identifica por las coordenadas pedidas, no por el nombre que resuelva la API
+            added = append_frame(archive, fetch_days(a, b).assign(name=key))
+            print(f"✅ {sum(added.values())} días agregados a {args.archive}/")
+
+    if args.csv:
+        df = read_frame(archive, WEATHER, args.start, args.end)
+        df["datetime"] = df["datetime"].dt.strftime("%Y-%m-%d")
+        df.to_csv(args.csv, index=False)
+        print(f"✅ {len(df)} filas exportadas a {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
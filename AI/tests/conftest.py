@@ -0,0 +1,53 @@
+# AI/tests/conftest.py
+import os
+import shutil
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+AI_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_DIR))
+
+# api.app lee la configuración al importarse: sin tareas de fondo, pool de procesos ni escrituras a disco
+os.environ.setdefault("PRECOMPUTE_REALTIME_S", "0")
+os.environ.setdefault("PRECOMPUTE_DAILY_S", "0")
+os.environ.setdefault("INFERENCE_WORKERS", "0")
+os.environ.setdefault("MODEL_WATCH_S", "0")
+
+CSV = AI_DIR / "weather_2years_with_esp_filled.csv"
+ARTIFACTS = AI_DIR / "artifacts"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj manual para api/cache.py: el del event loop sigue siendo el real."""
+    from api import cache
+
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def art_dir(tmp_path: Path) -> Path:
+    """Copia de artifacts/ que cada test puede modificar."""
+    return Path(shutil.copytree(ARTIFACTS, tmp_path / "artifacts"))
+
+
+@pytest.fixture(scope="session")
+def features_df():
+    from train import build_features
+    from data import read_sources
+
+    df, _, _ = build_features(read_sources([CSV]))
+    return df
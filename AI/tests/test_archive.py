@@ -0,0 +1,121 @@
+# AI/tests/test_archive.py
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from api.archive import SENSORS, WEATHER, Archive, SensorArchiver, append_frame, read_frame
+from data import load_features, read_sources
+from tests.conftest import AI_DIR, CSV
+
+
+def test_append_read_and_idempotent(tmp_path):
+    s = Archive(tmp_path / "a").series(WEATHER, "site", "name")
+    assert s.append([10.0, 20.0, 30.0], {"x": [1.0, 2.0, 3.0]}) == 3
+    assert s.append([20.0, 30.0], {"x": [9.0, 9.0]}) == 0  # ya archivados
+    assert s.append([40.0], {"x": 4.0, "y": 40.0}) == 1  # columna nueva: NaN hacia atrás
+
+    reopened = Archive(tmp_path / "a").series(WEATHER, "site")
+    ts, cols = reopened.read(15, 40)
+    np.testing.assert_array_equal(ts, [20.0, 30.0, 40.0])
+    np.testing.assert_array_equal(cols["x"], [2.0, 3.0, 4.0])
+    np.testing.assert_array_equal(cols["y"], [np.nan, np.nan, 40.0])
+    ts, _ = reopened.read(30, 40, columns=[], lookback=2)
+    np.testing.assert_array_equal(ts, [10.0, 20.0, 30.0, 40.0])
+    assert reopened.group == "name" and reopened.last_ts() == 40.0
+
+
+def test_backfilled_rows_rewrite_in_order(tmp_path):
+    s = Archive(tmp_path / "a").series(WEATHER, "site")
+    s.append([10.0, 40.0], {"x": [1.0, 4.0]})
+    assert s.append([30.0, 20.0, 40.0], {"x": [3.0, 2.0, 0.0]}) == 2
+    ts, cols = s.read()
+    np.testing.assert_array_equal(ts, [10.0, 20.0, 30.0, 40.0])
+    np.testing.assert_array_equal(cols["x"], [1.0, 2.0, 3.0, 4.0])
+
+
+def test_uncommitted_column_bytes_are_trimmed(tmp_path):
+    archive = Archive(tmp_path / "a")
+    archive.series(WEATHER, "site").append([10.0], {"x": 1.0})
+    # Un proceso que murió después de escribir la columna y antes del índice
+    with open(tmp_path / "a" / WEATHER / "site" / "columns" / "x.f8", "ab") as f:
+        f.write(np.array([99.0]).tobytes())
+
+    s = Archive(tmp_path / "a").series(WEATHER, "site")
+    assert len(s) == 1
+    s.append([20.0], {"x": 2.0})
+    np.testing.assert_array_equal(s.read()[1]["x"], [1.0, 2.0])
+
+
+def test_archive_source_matches_csv(tmp_path):
+    archive = Archive(tmp_path / "archive")
+    raw = read_sources([CSV])
+    added = append_frame(archive, raw)
+    assert sum(added.values()) == len(raw)
+    assert append_frame(archive, raw) == {k: 0 for k in added}
+
+    from_csv, thr_csv, water_csv, _ = load_features([str(CSV)], None)
+    from_archive, thr_archive, water_archive, _ = load_features([str(tmp_path / "archive")], None)
+    assert (thr_csv, water_csv) == (thr_archive, water_archive)
+    cols = [c for c in from_csv.columns if c not in ("name", "datetime")]
+    # Las columnas del archivo son vistas de memmap: se comparan los valores
+    np.testing.assert_array_equal(from_archive[cols].to_numpy(np.float64), from_csv[cols].to_numpy(np.float64))
+    assert (from_archive["datetime"] == from_csv["datetime"]).all()
+
+    day = read_frame(archive, WEATHER, "2024-02-29", "2024-02-29")
+    assert len(day) == 1 and day["datetime"].iloc[0] == pd.Timestamp("2024-02-29")
+
+
+def test_sensor_archiver_restore(tmp_path):
+    archiver = SensorArchiver(Archive(tmp_path / "a"), ["distance_cm", "level_pct"], flush_s=0.01)
+    for i in range(5):
+        archiver.record("dev", 100.0 + i, {"distance_cm": float(i), "level_pct": None})
+
+    async def go():
+        task = asyncio.ensure_future(archiver.run())
+        await asyncio.sleep(0.05)
+        archiver.record("dev", 200.0, {"distance_cm": 9.0})
+        task.cancel()  # lo pendiente se escribe al cancelar
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(go())
+    assert archiver.stats["written"] == 5
+    assert archiver.archive.keys(SENSORS) == ["dev"]
+    restored = list(archiver.restore("dev", 3))
+    assert [ts for ts, _ in restored] == [103.0, 104.0, 200.0]
+    assert restored[-1][1]["distance_cm"] == 9.0 and np.isnan(restored[-1][1]["level_pct"])
+    assert list(archiver.restore("other", 3)) == []
+
+
+def test_archive_is_opt_in(tmp_path):
+    env = {k: v for k, v in os.environ.items() if k != "ARCHIVE_DIR"}
+    probe = "import json; from api import app; print(json.dumps(app.ARCHIVE is None))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=tmp_path, env={**env, "PYTHONPATH": str(AI_DIR)},
+                         capture_output=True, text=True, check=True)
+    assert json.loads(out.stdout.strip().splitlines()[-1]) is True
+
+
+def test_health_reads_archive_off_the_event_loop(tmp_path, monkeypatch):
+    from api import app as api
+
+    archiver = SensorArchiver(Archive(tmp_path / "a"), ["distance_cm"], flush_s=1)
+    archiver.archive.series(SENSORS, "dev").append([100.0], {"distance_cm": 5.0})
+    threads = []
+    info = archiver.info
+    monkeypatch.setattr(archiver, "info", lambda: threads.append(threading.current_thread()) or info())
+    monkeypatch.setattr(api, "SENSOR_ARCHIVE", archiver)
+
+    async def go():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/health")).json()
+
+    health = asyncio.run(go())
+    assert health["archive"]["series"][f"{SENSORS}:dev"]["rows"] == 1
+    assert threads and threads[0] is not threading.main_thread()
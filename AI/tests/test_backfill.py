@@ -0,0 +1,26 @@
+# AI/tests/test_backfill.py
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+import backfill
+from tests.conftest import ARTIFACTS, CSV
+
+
+@pytest.mark.parametrize("chunk_rows", [97, backfill.CHUNK_ROWS])
+def test_chunked_backfill_matches_build_features(features_df, chunk_rows):
+    backfill._init_state(str(ARTIFACTS), 10.0, 3.0)
+    model = backfill._STATE["model"]
+    linker = backfill.ChunkLinker(max(s.window for s in model.specs))
+    out = pd.concat([backfill.score_frame(linker.link(chunk))
+                     for chunk in backfill.iter_input([CSV], chunk_rows)], ignore_index=True)
+
+    pipe = joblib.load(ARTIFACTS / "model.pkl")
+    expected = pipe.predict_proba(features_df.reindex(columns=model.features))[:, 1]
+    expected = pd.Series(expected, index=features_df["datetime"].dt.strftime("%Y-%m-%d"))
+
+    assert len(out) == len(features_df)
+    assert out["row"].tolist() == list(range(len(out)))
+    got = out.set_index(pd.to_datetime(out["datetime"]).dt.strftime("%Y-%m-%d"))["climate_probability"]
+    np.testing.assert_allclose(got.loc[expected.index].to_numpy(), expected.to_numpy(), rtol=0, atol=1e-9)
@@ -0,0 +1,37 @@
+# AI/tests/test_batch.py
+import asyncio
+
+import httpx
+import joblib
+import numpy as np
+
+from api.registry import COMPILED_MAX_ROWS
+from tests.conftest import ARTIFACTS
+
+
+def test_predict_batch_large_chunks_use_sklearn(features_df, monkeypatch):
+    from api import app as api
+
+    model = api.REGISTRY.active
+    rows = features_df.reindex(columns=model.features).head(600)
+    items = [{"payload": {k: v for k, v in r.items() if v == v}, "use_esp32": False}
+             for r in rows.to_dict(orient="records")]
+
+    sizes = []
+    original = model.engine.predict_proba
+    monkeypatch.setattr(model.engine, "predict_proba", lambda X: sizes.append(len(X)) or original(X))
+    api.PREDICTION_CACHE.clear()
+
+    async def go():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+            return await client.post("/predict_batch?chunk_size=500", json={"items": items})
+
+    res = asyncio.run(go())
+    assert res.status_code == 200
+    got = np.array([r["climate_probability"] for r in res.json()["predictions"]])
+
+    pipe = joblib.load(ARTIFACTS / "model.pkl")
+    np.testing.assert_allclose(got, pipe.predict_proba(rows)[:, 1], rtol=0, atol=1e-9)
+    # El bloque de 500 no pasa por el motor compilado; el resto (100 filas) sí
+    assert all(n <= COMPILED_MAX_ROWS for n in sizes)
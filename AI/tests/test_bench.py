@@ -0,0 +1,39 @@
+# AI/tests/test_bench.py
+import json
+import subprocess
+import sys
+
+import pandas as pd
+
+import bench
+from tests.conftest import AI_DIR, CSV
+
+
+def test_summarize_percentiles():
+    out = bench.summarize([0.001 * i for i in range(1, 101)], wall_s=2.0, units=100)
+    assert out["n"] == 100 and out["per_second"] == 50.0
+    assert out["latency_ms"]["p50"] == 50.5 and out["latency_ms"]["max"] == 100.0
+
+
+def test_scaled_frame_keeps_each_station_continuous():
+    df = bench.scaled_frame(CSV, scale=4, stations=2)
+    src = pd.read_csv(CSV)
+    assert len(df) == 4 * len(src) and set(df["name"]) == {"station-0000", "station-0001"}
+    for _, g in df.groupby("name"):
+        dt = pd.to_datetime(g["datetime"])
+        assert dt.is_unique and dt.is_monotonic_increasing and len(g) == 2 * len(src)
+
+
+def test_model_suite_writes_report_and_compares(tmp_path, capsys):
+    out = tmp_path / "run.json"
+    cmd = [sys.executable, "bench.py", "model", "--batch-sizes", "1,8", "--iterations", "3", "--warmup", "1",
+           "--out", str(out)]
+    subprocess.run(cmd, cwd=AI_DIR, check=True, capture_output=True, timeout=300)
+
+    report = json.loads(out.read_text(encoding="utf-8"))
+    assert report["meta"]["args"]["suite"] == "model"
+    names = {r["name"] for r in report["results"]}
+    assert {"model/sklearn/batch=1", "model/compiled/batch=8"} <= names, names
+
+    bench.compare(report, report)
+    assert "model/compiled/batch=8" in capsys.readouterr().out
@@ -0,0 +1,44 @@
+# AI/tests/test_build_features.py
+import numpy as np
+import pandas as pd
+
+from data import read_sources
+from features import feature_specs
+from tests.conftest import CSV
+from train import build_features
+
+
+def _reference(df: pd.DataFrame, spec) -> np.ndarray:
+    """La misma feature con groupby().rolling/shift de pandas (la implementación anterior)."""
+    g = df.groupby("name", observed=True, sort=False)[spec.source]
+    x = df[spec.source]
+    if spec.kind == "lag":
+        return g.shift(spec.window).to_numpy()
+    if spec.kind in ("diff", "roc"):
+        d = x - g.shift(spec.window)
+        return (d if spec.kind == "diff" else d / spec.window).to_numpy()
+    rolled = g.rolling(spec.window, min_periods=spec.min_periods).agg(spec.kind)
+    return rolled.reset_index(level=0, drop=True).sort_index().to_numpy()
+
+
+def test_matches_pandas_groupby_rolling():
+    raw = read_sources([CSV])
+    # Dos estaciones mezcladas y desordenadas, con huecos en una columna de agua
+    other = raw.assign(name="otra", precip=raw["precip"] * 1.5)
+    other.loc[::7, "distance_cm"] = np.nan
+    mixed = pd.concat([raw, other], ignore_index=True).sample(frac=1.0, random_state=0)
+    mixed["name"] = mixed["name"].astype(str).astype("category")
+
+    df, threshold_mm, water_cols = build_features(mixed)
+    assert len(df) == len(mixed) and water_cols
+    assert list(df.groupby("name", observed=True, sort=False).size()) == [len(raw), len(raw)]
+
+    specs = feature_specs(df.columns, water_cols)
+    for spec in specs:
+        np.testing.assert_allclose(df[spec.name].to_numpy(np.float64), _reference(df, spec),
+                                   rtol=1e-5, atol=1e-4, equal_nan=True, err_msg=spec.name)
+
+    # Etiqueta: lluvia del día siguiente dentro de la misma estación
+    nxt = df.groupby("name", observed=True, sort=False)["precip"].shift(-1)
+    np.testing.assert_array_equal(df["precip_next_day"].to_numpy(), nxt.to_numpy())
+    np.testing.assert_array_equal(df["risk_next_day"].to_numpy(), (nxt >= threshold_mm).astype(int).to_numpy())
@@ -0,0 +1,35 @@
+# AI/tests/test_cache.py
+import asyncio
+
+import httpx
+
+
+def test_visualcrossing_fetch_through_cache(clock, monkeypatch):
+    from api import app as api
+
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"n": len(requests)})
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(api, "HTTP_CLIENT", client)
+            api.VC_REALTIME_CACHE.clear()
+            first = await asyncio.gather(*(api.fetch_visualcrossing_realtime() for _ in range(10)))
+            clock.now += api.VC_REALTIME_TTL_S + 1
+            stale = await api.fetch_visualcrossing_realtime()
+            await asyncio.sleep(0.05)
+            fresh = await api.fetch_visualcrossing_realtime()
+            clock.now += api.VC_REALTIME_TTL_S + api.VC_STALE_TTL_S + 1
+            expired = await api.fetch_visualcrossing_realtime()
+            api.VC_REALTIME_CACHE.clear()
+            return first, stale, fresh, expired
+
+    first, stale, fresh, expired = asyncio.run(go())
+    assert [r["n"] for r in first] == [1] * 10
+    assert stale == {"n": 1} and fresh == {"n": 2} and expired == {"n": 3}
+    assert len(requests) == 3
+    assert all(str(u).startswith(api.VC_BASE_URL) for u in requests)
@@ -0,0 +1,52 @@
+# AI/tests/test_compact.py
+import json
+
+import joblib
+import numpy as np
+import pytest
+
+from api.compiled import CompiledPipeline
+from compact import _frame, staged_tree_proba
+from tests.conftest import ARTIFACTS
+
+
+@pytest.fixture(scope="module")
+def setup(features_df):
+    features = json.loads((ARTIFACTS / "feature_names.json").read_text(encoding="utf-8"))
+    pipe = joblib.load(ARTIFACTS / "model.pkl")
+    X = features_df.reindex(columns=features).to_numpy(dtype=np.float64)[::3]
+    return pipe, CompiledPipeline.from_pipeline(pipe, features), X
+
+
+def test_subset_matches_first_sklearn_trees(setup):
+    pipe, full, X = setup
+    clf = pipe.named_steps["clf"]
+    Xt = pipe.named_steps["pre"].transform(_frame(X, full.features))
+    for n in (1, 10, full.n_trees):
+        expected = np.mean([t.predict_proba(Xt)[:, 1] for t in clf.estimators_[:n]], axis=0)
+        np.testing.assert_allclose(full.compact(n).predict_proba(X), expected, rtol=0, atol=1e-12)
+
+
+def test_pruned_candidates_match_staged_proba(setup):
+    _, full, X = setup
+    depths = [2, 4, 8]
+    staged = {d: np.cumsum(p, axis=1) for d, p in staged_tree_proba(full, X, depths).items()}
+    assert set(staged) == {*depths, full.depth}
+    for d in depths + [None]:
+        for n in (1, 25, full.n_trees):
+            small = full.compact(n, d)
+            assert small.n_trees == n and small.depth == (d or full.depth)
+            assert small.nbytes <= full.nbytes
+            np.testing.assert_allclose(small.predict_proba(X), staged[d or full.depth][:, n - 1] / n,
+                                       rtol=0, atol=1e-12, err_msg=f"n={n} d={d}")
+
+
+def test_depth_one_is_root_split(setup):
+    pipe, full, X = setup
+    stump = full.compact(1, 1)
+    tree = pipe.named_steps["clf"].estimators_[0].tree_
+    assert len(stump.left) == 3  # raíz + dos hojas
+    value = tree.value[:, 0, 1] / tree.value[:, 0, :].sum(axis=1)
+    assert set(np.round(stump.predict_proba(X), 12)) <= {round(value[tree.children_left[0]], 12),
+                                                        round(value[tree.children_right[0]], 12)}
+
@@ -0,0 +1,109 @@
+# AI/tests/test_compiled.py
+import json
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import compiled as compiled_mod
+from api.compiled import CompiledPipeline
+from api.registry import COMPILED_MAX_ROWS, load_version
+
+from tests.conftest import ARTIFACTS
+
+
+@pytest.fixture(scope="module")
+def pipe():
+    return joblib.load(ARTIFACTS / "model.pkl")
+
+
+@pytest.fixture(scope="module")
+def X(features_df):
+    features = json.loads((ARTIFACTS / "feature_names.json").read_text(encoding="utf-8"))
+    return features_df.apply(pd.to_numeric, errors="coerce").reindex(columns=features)
+
+
+def _expected(pipe, X):
+    return pipe.predict_proba(X)[:, list(pipe.named_steps["clf"].classes_).index(1)]
+
+
+def test_compiled_artifact_matches_pipeline(pipe, X):
+    got = CompiledPipeline.load(ARTIFACTS).predict_proba(X.to_numpy(dtype=np.float64))
+    np.testing.assert_allclose(got, _expected(pipe, X), rtol=0, atol=1e-9)
+
+
+def test_export_cli(pipe, X, art_dir, monkeypatch):
+    # Un manifest regenerado desde otro model.pkl queda atado a ese pickle
+    clf = pipe.named_steps["clf"]
+    small = joblib.load(art_dir / "model.pkl")
+    small.named_steps["clf"].estimators_ = clf.estimators_[:30]
+    small.named_steps["clf"].n_estimators = 30
+    joblib.dump(small, art_dir / "model.pkl")
+    monkeypatch.setattr(sys, "argv", ["compiled.py", "--model", str(art_dir / "model.pkl"),
+                                      "--features", str(art_dir / "feature_names.json")])
+    compiled_mod.main()
+
+    loaded = CompiledPipeline.load(art_dir)
+    assert loaded.n_trees == 30
+    np.testing.assert_allclose(loaded.predict_proba(X.to_numpy(dtype=np.float64)), _expected(small, X), rtol=0, atol=1e-9)
+
+
+def test_single_rows_and_blocks_match(pipe, X, monkeypatch):
+    engine = CompiledPipeline.load(ARTIFACTS)
+    A = X.to_numpy(dtype=np.float64)
+    expected = _expected(pipe, X)
+    for i in (0, len(A) // 2, len(A) - 1):
+        assert engine.predict_proba(A[i]) == pytest.approx(expected[i], abs=1e-9)
+    # Bloques de filas más chicos que la matriz dan lo mismo
+    monkeypatch.setattr(compiled_mod, "BLOCK_ROWS", 100)
+    np.testing.assert_allclose(engine.predict_proba(A), expected, rtol=0, atol=1e-9)
+
+
+def test_empty_matrix(X):
+    engine = CompiledPipeline.load(ARTIFACTS)
+    assert engine.predict_proba(np.empty((0, len(engine.features)))).shape == (0,)
+
+
+def test_model_version_dispatch(pipe, X, monkeypatch):
+    model = load_version(ARTIFACTS)
+    A = np.tile(X.to_numpy(dtype=np.float64), (2, 1))
+    assert len(A) > COMPILED_MAX_ROWS
+    calls = []
+    monkeypatch.setattr(model.engine, "predict_proba", lambda M: calls.append(len(M)) or np.zeros(len(M)))
+
+    np.testing.assert_allclose(model.predict_proba(A), _expected(pipe, pd.DataFrame(A, columns=X.columns)),
+                               rtol=0, atol=1e-12)
+    assert calls == []  # lote grande: sklearn
+    model.predict_proba(A[:COMPILED_MAX_ROWS])
+    assert calls == [COMPILED_MAX_ROWS]  # pocas filas: motor compilado
+    assert model.info()["batch_engine"] == "sklearn"
+
+
+def test_model_version_without_verified_pickle_stays_compiled(art_dir, X):
+    manifest = json.loads((art_dir / "manifest.json").read_text(encoding="utf-8"))
+    manifest["model_sha256"] = None
+    (art_dir / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    model = load_version(art_dir)
+    assert model.pipeline() is None
+    A = np.tile(X.to_numpy(dtype=np.float64), (2, 1))
+    np.testing.assert_array_equal(model.predict_proba(A), model.engine.predict_proba(A))
+
+
+def test_pickle_fallback_loads_the_bytes_it_hashed(art_dir, monkeypatch):
+    import hashlib
+
+    (art_dir / "manifest.json").unlink()
+    raw = (art_dir / "model.pkl").read_bytes()
+    original = joblib.load
+
+    def load_during_swap(f, *args, **kwargs):
+        # Otro proceso reemplaza model.pkl justo después de la lectura
+        (art_dir / "model.pkl").write_bytes(b"not a pickle")
+        return original(f, *args, **kwargs)
+
+    monkeypatch.setattr(joblib, "load", load_during_swap)
+    model = load_version(art_dir, "pickle")
+    assert model.source == "pickle"
+    assert model.version == "pkl-" + hashlib.sha256(raw).hexdigest()[:12]
@@ -0,0 +1,49 @@
+# AI/tests/test_daily.py
+import asyncio
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from data import read_sources
+from tests.conftest import CSV
+
+
+def test_daily_scores_all_days_in_one_call(features_df, monkeypatch):
+    from api import app as api
+
+    raw = read_sources([CSV]).iloc[-20:]
+    raw["datetime"] = pd.to_datetime(raw["datetime"]).dt.strftime("%Y-%m-%d")
+    days = raw.to_dict("records")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if "/20" in request.url.path:  # rango histórico previo al pronóstico
+            return httpx.Response(200, json={"days": days[:5]})
+        return httpx.Response(200, json={"resolvedAddress": "test", "days": days[5:]})
+
+    model = api.REGISTRY.active
+    calls = []
+    original = model.predict_proba
+    monkeypatch.setattr(model, "predict_proba", lambda X: calls.append(len(X)) or original(X))
+    for cache in (api.VC_DAILY_CACHE, api.VC_HISTORY_CACHE):
+        cache.clear()
+    api.PREDICTION_CACHE.clear()
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as upstream:
+            monkeypatch.setattr(api, "HTTP_CLIENT", upstream)
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.get("/predict_daily", params={"use_esp32": False})
+
+    res = asyncio.run(go())
+    assert res.status_code == 200
+    out = res.json()["daily_predictions"]
+    assert len(out) == api.DAILY_DAYS and calls == [api.DAILY_DAYS]
+
+    # Mismas probabilidades que puntuar cada día por separado
+    single = [float(original(model.engine.align(d["features"])[None, :])[0]) for d in out]
+    np.testing.assert_allclose([d["climate_probability"] for d in out], single, rtol=0, atol=1e-12)
+    assert [d["date"] for d in out] == [d["datetime"] for d in days[5:]]
+    assert all(d["water_score"] == 0.0 and d["risk_probability"] == d["climate_probability"] * api.WEIGHT_CLIMATE
+               for d in out)
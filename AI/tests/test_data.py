@@ -0,0 +1,78 @@
+# AI/tests/test_data.py
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data import SKIP_COLUMNS, expand_sources, load_features, read_sources, sources_key
+from tests.conftest import CSV
+
+
+def _assert_same(a: pd.DataFrame, b: pd.DataFrame) -> None:
+    assert list(a.columns) == list(b.columns) and len(a) == len(b)
+    for col in a.columns:
+        if pd.api.types.is_numeric_dtype(a[col]):
+            np.testing.assert_array_equal(a[col].to_numpy(np.float64), b[col].to_numpy(np.float64), err_msg=col)
+        else:
+            assert (a[col].astype(object).fillna("") == b[col].astype(object).fillna("")).all(), col
+
+
+def test_read_sources_prunes_text_and_chunks_agree():
+    df = read_sources([CSV])
+    assert not SKIP_COLUMNS & set(df.columns)
+    assert df["name"].dtype == "category"
+    _assert_same(read_sources([CSV], chunksize=97), df)
+
+
+def test_feature_cache_hit_matches_miss(tmp_path):
+    miss, thr, water, info = load_features([str(CSV)], tmp_path)
+    assert info["cache"] == "miss"
+    hit, thr_hit, water_hit, info_hit = load_features([str(CSV)], tmp_path)
+    assert info_hit["cache"] == "hit" and info_hit["key"] == info["key"]
+    assert (thr_hit, water_hit) == (thr, water)
+    _assert_same(hit, miss)
+
+
+def test_cache_key_follows_content(tmp_path):
+    copy = tmp_path / "copy.csv"
+    copy.write_bytes(CSV.read_bytes())
+    assert sources_key([copy]) == sources_key([CSV])
+    copy.write_bytes(CSV.read_bytes().replace(b"2025-09-01", b"2025-09-02"))
+    assert sources_key([copy]) != sources_key([CSV])
+    assert sources_key([CSV, copy]) != sources_key([copy, CSV])
+
+
+def test_cache_key_follows_parsing_and_feature_code(monkeypatch):
+    import data
+    import train
+
+    key = sources_key([CSV])
+    monkeypatch.setattr(train, "GROUP_COLUMNS", ["station", "device_id", "name"])
+    assert sources_key([CSV]) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(data, "DTYPES", {**data.DTYPES, "precip": "float32"})
+    assert sources_key([CSV]) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(data, "SKIP_COLUMNS", data.SKIP_COLUMNS - {"icon"})
+    assert sources_key([CSV]) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(train, "_detect_water_cols", lambda df: [])
+    assert sources_key([CSV]) != key
+    monkeypatch.undo()
+    assert sources_key([CSV]) == key
+
+
+def test_default_cache_dir_is_next_to_the_code():
+    from data import DEFAULT_CACHE_DIR
+    from tests.conftest import AI_DIR
+
+    assert Path(DEFAULT_CACHE_DIR) == AI_DIR / ".cache" / "features"
+
+
+def test_expand_sources(tmp_path):
+    for name in ("b.csv", "a.csv"):
+        (tmp_path / name).write_text("datetime,precip\n", encoding="utf-8")
+    assert expand_sources([str(tmp_path / "*.csv")]) == [tmp_path / "a.csv", tmp_path / "b.csv"]
+    with pytest.raises(FileNotFoundError):
+        expand_sources([str(tmp_path / "*.parquet")])
@@ -0,0 +1,77 @@
+# AI/tests/test_esp32.py
+import asyncio
+from typing import Dict, Optional
+
+import httpx
+
+ROUTES = ("last", "latest", "telemetry")
+
+
+def _rtdb(answers: Dict[str, Optional[dict]], delays: Dict[str, float], log: Dict[str, list]):
+    """RTDB falso: cada ruta responde con su paquete (None = nodo vacío) tras su demora."""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        route = request.url.path.rsplit("/", 1)[-1].removesuffix(".json")
+        log["started"].append(route)
+        try:
+            await asyncio.sleep(delays[route])
+        except asyncio.CancelledError:
+            log["cancelled"].append(route)
+            raise
+        log["answered"].append(route)
+        packet = answers[route]
+        if route == "telemetry" and packet is not None:
+            packet = {"-key": packet}
+        return httpx.Response(200, json=packet) if packet is not None else httpx.Response(200, content=b"null")
+    return handler
+
+
+def _fetch(monkeypatch, device, answers, delays):
+    from api import app as api
+
+    log = {"started": [], "answered": [], "cancelled": []}
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_rtdb(answers, delays, log))) as client:
+            monkeypatch.setattr(api, "HTTP_CLIENT", client)
+            result = await api.get_latest_esp32(device)
+            await asyncio.sleep(0.05)  # deja correr la cancelación de las demás
+            # Copia antes de salir: asyncio.run cancela al cerrar lo que quede pendiente
+            return result, {k: list(v) for k, v in log.items()}
+
+    return asyncio.run(go())
+
+
+def test_routes_are_requested_concurrently(monkeypatch):
+    answers = {r: {"distance_cm": float(i + 1)} for i, r in enumerate(ROUTES)}
+    result, log = _fetch(monkeypatch, "esp32-fallback-concurrent", answers, {r: 0.1 for r in ROUTES})
+    # Las tres consultas arrancan antes de que responda cualquiera
+    assert sorted(log["started"]) == sorted(ROUTES)
+    assert result["distance_cm"] == 1.0
+
+
+def test_last_wins_even_when_lower_priority_answers_first(monkeypatch):
+    answers = {"last": {"distance_cm": 1.0}, "latest": {"distance_cm": 2.0}, "telemetry": {"distance_cm": 3.0}}
+    delays = {"last": 0.2, "latest": 0.1, "telemetry": 0.0}
+    result, log = _fetch(monkeypatch, "esp32-fallback-priority", answers, delays)
+    assert log["answered"][:2] == ["telemetry", "latest"]
+    assert result["distance_cm"] == 1.0
+
+
+def test_latest_wins_over_telemetry_when_last_is_empty(monkeypatch):
+    answers = {"last": None, "latest": {"distance_cm": 2.0}, "telemetry": {"distance_cm": 3.0}}
+    delays = {"last": 0.0, "latest": 0.2, "telemetry": 0.0}
+    result, _ = _fetch(monkeypatch, "esp32-fallback-latest", answers, delays)
+    assert result["distance_cm"] == 2.0
+
+    answers = {"last": None, "latest": None, "telemetry": {"distance_cm": 3.0}}
+    result, _ = _fetch(monkeypatch, "esp32-fallback-telemetry", answers, delays)
+    assert result["distance_cm"] == 3.0
+
+
+def test_losing_requests_are_cancelled(monkeypatch):
+    answers = {r: {"distance_cm": float(i + 1)} for i, r in enumerate(ROUTES)}
+    delays = {"last": 0.0, "latest": 5.0, "telemetry": 5.0}
+    result, log = _fetch(monkeypatch, "esp32-fallback-cancel", answers, delays)
+    assert result["distance_cm"] == 1.0
+    assert log["answered"] == ["last"]
+    assert sorted(log["cancelled"]) == ["latest", "telemetry"]
@@ -0,0 +1,118 @@
+# AI/tests/test_features.py
+import asyncio
+
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.archive import Archive, append_frame
+from data import read_sources
+from features import OnlineFeatureEngine, feature_specs
+from tests.conftest import CSV
+from train import group_column
+
+
+def test_online_engine_matches_build_features(features_df):
+    df = features_df
+    water_cols = [c[: -len("_lag1")] for c in df.columns if c.endswith("_lag1")]
+    specs = feature_specs(df.columns, water_cols)
+    names = [s.name for s in specs]
+
+    # Un motor por estación/dispositivo, igual que los grupos de build_features
+    group = group_column(df)
+    online = []
+    for _, part in (df.groupby(group, sort=False, dropna=False) if group else [(None, df)]):
+        engine = OnlineFeatureEngine(specs)
+        online += [[r[n] for n in names] for r in (engine.push(row) for row in part.to_dict("records"))]
+
+    # build_features guarda las features en float32
+    np.testing.assert_allclose(np.array(online, dtype=np.float32), df[names].to_numpy(),
+                               rtol=1e-6, atol=1e-5, equal_nan=True)
+
+
+@pytest.fixture
+def api_history():
+    from api import app as api
+
+    api.VC_HISTORY_CACHE.clear()
+    yield api
+    api.VC_HISTORY_CACHE.clear()
+
+
+def _climate(api, model, df, day):
+    """Features climáticas de build_features para `day` y la fila de clima de ese día."""
+    names = [s.name for s in model.specs if s.source not in api.TELEMETRY_FIELDS]
+    row = df[df["datetime"] == pd.Timestamp(day)].iloc[0]
+    return row[names].astype(np.float64).to_dict(), {k: row[k] for k in api.weather_sources(model)}
+
+
+def test_realtime_history_from_archive(api_history, features_df, tmp_path, monkeypatch):
+    api = api_history
+    model = api.REGISTRY.active
+    archive = Archive(tmp_path / "archive")
+    append_frame(archive, read_sources([CSV]))
+    monkeypatch.setattr(api, "ARCHIVE", archive)
+
+    day = "2025-06-20"
+    expected, today = _climate(api, model, features_df, day)
+    history = asyncio.run(api.weather_history(api.DEFAULT_LAT, api.DEFAULT_LON, day, model))
+    assert len(history) == api.history_days(model) == 13
+
+    got = api.weather_history_features([today], model, history)[0]
+    assert got.keys() == expected.keys()
+    np.testing.assert_allclose([got[k] for k in expected], list(expected.values()), rtol=1e-6, atol=1e-5)
+
+    # Sin historia las ventanas solo ven el día de hoy
+    alone = api.weather_history_features([today], model)[0]
+    assert alone["precip_sum_14d"] == pytest.approx(today["precip"])
+
+
+def test_daily_history_from_visualcrossing(api_history, features_df, monkeypatch):
+    api = api_history
+    model = api.REGISTRY.active
+    monkeypatch.setattr(api, "ARCHIVE", None)
+    raw = read_sources([CSV])
+    raw["datetime"] = pd.to_datetime(raw["datetime"]).dt.strftime("%Y-%m-%d")
+    days = {d["datetime"]: d for d in raw.to_dict("records")}
+
+    urls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        urls.append(str(request.url))
+        start, end = request.url.path.split("/")[-2:]
+        return httpx.Response(200, json={"days": [d for k, d in days.items() if start <= k <= end]})
+
+    forecast = ["2025-06-20", "2025-06-21", "2025-06-22"]
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(api, "HTTP_CLIENT", client)
+            history = await api.weather_history(api.DEFAULT_LAT, api.DEFAULT_LON, forecast[0], model)
+            again = await api.weather_history(api.DEFAULT_LAT, api.DEFAULT_LON, forecast[0], model)
+            return history, again
+
+    history, again = asyncio.run(go())
+    assert len(urls) == 1 and "/2025-06-07/2025-06-19?" in urls[0]
+    assert again == history
+
+    rows = [api.build_weather_payload_from_day(days[d]) for d in forecast]
+    got = api.weather_history_features(rows, model, history)
+    for day, feats in zip(forecast, got):
+        expected, _ = _climate(api, model, features_df, day)
+        np.testing.assert_allclose([feats[k] for k in expected], list(expected.values()), rtol=1e-6, atol=1e-5)
+
+
+def test_missing_history_falls_back(api_history, monkeypatch):
+    api = api_history
+    monkeypatch.setattr(api, "ARCHIVE", None)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(api, "HTTP_CLIENT", client)
+            return await api.weather_history(api.DEFAULT_LAT, api.DEFAULT_LON, "2025-06-20", api.REGISTRY.active)
+
+    assert asyncio.run(go()) == []
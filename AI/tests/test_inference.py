@@ -0,0 +1,114 @@
+# AI/tests/test_inference.py
+import asyncio
+import pickle
+
+import joblib
+import numpy as np
+import pytest
+
+from api import inference
+from api.inference import InferenceExecutor
+from api.registry import ModelRegistry, load_version
+from tests.conftest import ARTIFACTS
+
+
+def _smaller_model(art_dir, n_trees=40):
+    pipe = joblib.load(art_dir / "model.pkl")
+    clf = pipe.named_steps["clf"]
+    clf.estimators_ = clf.estimators_[:n_trees]
+    clf.n_estimators = n_trees
+    joblib.dump(pipe, art_dir / "model.pkl")
+
+
+@pytest.fixture
+def X(features_df):
+    model = load_version(ARTIFACTS)
+    return features_df.reindex(columns=model.features).to_numpy(dtype=np.float64)[:32]
+
+
+def test_model_version_pickles(X):
+    model = load_version(ARTIFACTS)
+    clone = pickle.loads(pickle.dumps(model))
+    np.testing.assert_array_equal(clone.predict_proba(X), model.predict_proba(X))
+
+
+def test_worker_looks_up_unknown_version_once(art_dir, X, monkeypatch):
+    inference._init_worker(str(art_dir), "compiled")
+    current = next(iter(inference._WORKER["models"].values()))
+
+    loads = []
+    original = inference.load_version
+    monkeypatch.setattr(inference, "load_version", lambda *a: loads.append(a) or original(*a))
+
+    # Versión que no está en disco (p.ej. la anterior a un rollback)
+    other_dir = art_dir.parent / "other"
+    other_dir.mkdir()
+    for name in ("model.pkl", "feature_names.json", "metrics.json"):
+        (other_dir / name).write_bytes((art_dir / name).read_bytes())
+    _smaller_model(other_dir)
+    other = load_version(other_dir, "pickle")
+
+    assert inference._score(other.version, X) is None
+    assert inference._score(other.version, X) is None
+    assert len(loads) == 1
+
+    np.testing.assert_array_equal(inference._score(other.version, X, other), other.predict_proba(X))
+    np.testing.assert_array_equal(inference._score(other.version, X), other.predict_proba(X))
+    np.testing.assert_array_equal(inference._score(current.version, X), current.predict_proba(X))
+    assert len(loads) == 1
+
+
+def test_pool_serves_rolled_back_version(art_dir, X):
+    async def go():
+        registry = ModelRegistry(art_dir)
+        first = registry.active
+        executor = InferenceExecutor(art_dir, workers=1, window_ms=1)
+        _smaller_model(art_dir)
+        await registry.reload()
+        executor.start()
+        try:
+            new = await executor.predict(registry.active, X)
+            await registry.rollback()
+            # La versión original ya no está en disco: se manda una vez y queda en el worker
+            old = [await executor.predict(registry.active, X) for _ in range(3)]
+        finally:
+            executor.close()
+        return first, new, old, executor.stats
+
+    first, new, old, stats = asyncio.run(go())
+    for proba in old:
+        np.testing.assert_allclose(proba, first.predict_proba(X), rtol=0, atol=1e-12)
+    assert not np.allclose(new, old[0])
+    assert stats["fallbacks"] == 0
+    assert stats["shipped"] == 1
+
+
+def test_in_flight_batches_are_kept_alive(X, monkeypatch):
+    import gc
+
+    model = load_version(ARTIFACTS)
+    ex = InferenceExecutor(ARTIFACTS, workers=1, window_ms=0.0)
+    monkeypatch.setattr(ex, "_pool", object())  # como si el pool estuviera arrancado
+    release = None
+
+    async def slow_run(batch):
+        await release.wait()
+        for x, fut in batch.items:
+            fut.set_result(model.predict_proba(x))
+
+    monkeypatch.setattr(ex, "_run", slow_run)
+
+    async def go():
+        nonlocal release
+        release = asyncio.Event()
+        request = asyncio.ensure_future(ex.predict(model, X[:2]))
+        await asyncio.sleep(0.01)
+        assert len(ex._tasks) == 1  # lote en curso: la referencia fuerte es del executor
+        gc.collect()
+        release.set()
+        out = await request
+        await asyncio.sleep(0)
+        return out
+
+    np.testing.assert_allclose(asyncio.run(go()), model.predict_proba(X[:2]))
+    assert not ex._tasks
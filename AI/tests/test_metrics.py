@@ -0,0 +1,83 @@
+# AI/tests/test_metrics.py
+import asyncio
+import json
+import logging
+
+import httpx
+
+from api.log import JsonFormatter, SampleFilter, log_event
+from api.metrics import Counter, Histogram, timed
+
+
+def test_histogram_and_counter_render():
+    h = Histogram("test_seconds", "prueba", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 2.0):
+        h.observe(v, stage="x")
+    lines = h.render()
+    assert 'floodrisk_test_seconds_bucket{stage="x",le="0.1"} 1.0' in lines
+    assert 'floodrisk_test_seconds_bucket{stage="x",le="1.0"} 2.0' in lines
+    assert 'floodrisk_test_seconds_bucket{stage="x",le="+Inf"} 3.0' in lines
+    assert 'floodrisk_test_seconds_count{stage="x"} 3.0' in lines
+
+    c = Counter("test_total", "prueba")
+    c.inc(service="vc")
+    c.inc(2, service="vc")
+    assert c.render()[-1] == 'floodrisk_test_total{service="vc"} 3.0'
+
+
+def test_timed_sync_and_async(monkeypatch):
+    from api import metrics
+
+    h = Histogram("stage_test", "prueba")
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", h)
+
+    @timed("sync_stage")
+    def f():
+        return 1
+
+    @timed("async_stage")
+    async def g():
+        await asyncio.sleep(0)
+        return 2
+
+    with timed("block"):
+        pass
+    assert f() == 1 and asyncio.run(g()) == 2
+    stages = {dict(k)["stage"]: v[-2] for k, v in h.snapshot().items()}
+    assert stages == {"sync_stage": 1.0, "async_stage": 1.0, "block": 1.0}
+
+
+def test_json_log_and_sampling():
+    logger = logging.getLogger("floodrisk.test")
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    handler.addFilter(SampleFilter(0.0))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    log_event(logger, "routine", value=1)  # INFO: muestreado (rate 0)
+    log_event(logger, "upstream_error", logging.WARNING, service="vc", error="Timeout()")
+    assert len(records) == 1
+    out = json.loads(JsonFormatter().format(records[0]))
+    assert out["event"] == "upstream_error" and out["level"] == "warning"
+    assert out["service"] == "vc" and out["error"] == "Timeout()"
+
+
+def test_metrics_endpoint_exposes_stages():
+    from api import app as api
+
+    async def go():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/health")
+            return await client.get("/metrics")
+
+    res = asyncio.run(go())
+    assert res.status_code == 200 and res.headers["content-type"].startswith("text/plain")
+    body = res.text
+    assert "# TYPE floodrisk_stage_seconds histogram" in body
+    assert 'floodrisk_http_request_seconds_count{method="GET",path="/health"}' in body
+    for name in ("cache_events_total", "prediction_cache_entries", "inference_events_total"):
+        assert f"# TYPE floodrisk_{name} " in body
@@ -0,0 +1,68 @@
+# AI/tests/test_precompute.py
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from api.precompute import Precomputer
+from api.sites import Site
+
+DEVICE = "esp32-geo"
+
+
+def _vc(request: httpx.Request) -> httpx.Response:
+    if "firebase" in request.url.host:
+        return httpx.Response(200, json=None)
+    day = {"datetime": "2026-10-17", "precip": 2.0, "humidity": 80.0, "sealevelpressure": 1011.0,
+           "hours": [{"datetime": "00:00:00", "precip": 0.5, "humidity": 80.0}]}
+    return httpx.Response(200, json={"resolvedAddress": "test", "days": [day] * 15})
+
+
+@pytest.fixture
+def site_api(monkeypatch):
+    from api import app as api
+
+    # Tanque de 25 cm con 5 cm libres: a 10 cm del sensor hay 15 de 20 cm útiles
+    monkeypatch.setitem(api.SITE_BY_DEVICE, DEVICE, Site(device_id=DEVICE, max_depth_cm=25.0, headspace_cm=5.0))
+    api.TELEMETRY.buffer(DEVICE).append({"distance_cm": 10.0}, ts=time.time())
+    for cache in (api.VC_REALTIME_CACHE, api.VC_DAILY_CACHE, api.VC_HISTORY_CACHE):
+        cache.clear()
+    return api
+
+
+def test_snapshots_use_site_geometry_and_keep_headers(site_api, monkeypatch):
+    api = site_api
+    pre = Precomputer(api.REGISTRY)
+    pre.add_job("realtime", 60, [DEVICE], api.precompute_realtime)
+    pre.add_job("daily", 60, [DEVICE], api.precompute_daily)
+    monkeypatch.setattr(api, "PRECOMPUTE", pre)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_vc)) as upstream:
+            monkeypatch.setattr(api, "HTTP_CLIENT", upstream)
+            for job in pre.jobs.values():
+                await pre.refresh(job)
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return [await client.get(url, params={"device_id": DEVICE, **params}) for url, params in (
+                    ("/predict_realtime", {}),
+                    ("/predict_daily", {}),
+                    ("/predict_daily", {"days": 3}),
+                    ("/predict_daily", {"days": 3, "max_depth_cm": 10, "headspace_cm": 3}),
+                )]
+
+    realtime, daily, sliced, live = asyncio.run(go())
+    assert pre.stats["failures"] == 0
+    for res in (realtime, daily, sliced):
+        assert res.status_code == 200
+        assert "x-snapshot-age" in res.headers and res.headers["x-model-version"] == api.REGISTRY.active.version
+
+    assert realtime.json()["water_score"] == pytest.approx(0.75)
+    assert daily.json()["daily_predictions"][0]["water_score"] == pytest.approx(0.75)
+    assert len(daily.json()["daily_predictions"]) == api.DAILY_DAYS
+    assert sliced.json() == {**daily.json(), "daily_predictions": daily.json()["daily_predictions"][:3]}
+
+    # Otra geometría: se calcula en vivo (sin cabeceras de snapshot)
+    assert live.status_code == 200 and "x-snapshot-age" not in live.headers
+    assert live.json()["daily_predictions"][0]["water_score"] == 0.0
@@ -0,0 +1,124 @@
+# AI/tests/test_prediction_cache.py
+import asyncio
+import types
+
+import numpy as np
+
+from api import cache
+from api.cache import PredictionCache
+
+
+class Model:
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.calls = []
+
+    def __call__(self, X):
+        self.calls.append(len(X))
+        return X[:, 0] * 0.01 + self.offset
+
+
+def test_only_missing_rows_are_scored():
+    c = PredictionCache("p", resolution={"distance_cm": 0.01})
+    features = ["distance_cm", "precip"]
+    model = Model()
+    X = np.array([[1.0, np.nan], [2.0, 0.0], [3.0, 1.0]])
+    np.testing.assert_array_equal(c.predict(X, "v1", model, features), model(X))
+    model.calls.clear()
+
+    # Ruido del sensor por debajo de la resolución, -0.0 y NaN caen en la misma clave
+    Y = np.array([[2.001, -0.0], [1.0, np.nan], [4.0, 1.0]])
+    got = c.predict(Y, "v1", model, features)
+    assert model.calls == [1]
+    np.testing.assert_allclose(got, [0.02, 0.01, 0.04])
+    assert c.stats["hits"] == 2 and c.stats["misses"] == 4
+
+
+def test_only_sensor_columns_are_quantized():
+    c = PredictionCache("p", resolution={"distance_cm": 0.1})
+    features = ["distance_cm", "sealevelpressure", "precip_sum_14d"]
+    base = np.array([[5.0, 1009.4, 12.3]])
+    key = c.keys(base, features)[0]
+    assert c.keys(base + [[0.04, 0.0, 0.0]], features)[0] == key
+    # Clima y ventanas acumuladas: cualquier diferencia es otra entrada
+    assert c.keys(base + [[0.0, 0.001, 0.0]], features)[0] != key
+    assert c.keys(base + [[0.0, 0.0, 0.004]], features)[0] != key
+    # Sin nombres de columnas no se cuantiza nada
+    assert c.keys(base + [[0.04, 0.0, 0.0]])[0] != c.keys(base)[0]
+
+
+def test_version_change_invalidates():
+    c = PredictionCache("p")
+    X = np.array([[1.0], [2.0]])
+    c.predict(X, "v1", Model())
+    new = Model(offset=0.5)
+    np.testing.assert_allclose(c.predict(X, "v2", new), [0.51, 0.52])
+    assert new.calls == [2] and c.stats["invalidations"] == 1 and c.version == "v2"
+
+
+def test_reload_during_predict_does_not_store_old_results():
+    c = PredictionCache("p")
+    X = np.array([[1.0]])
+
+    def slow_old_model(rows):
+        c._check_version("v2")  # un reload llegó mientras se puntuaba con v1
+        return np.array([0.9])
+
+    c.predict(X, "v1", slow_old_model)
+    assert len(c) == 0
+
+
+def test_lru_and_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    c = PredictionCache("p", max_entries=2, ttl=10)
+    model = Model()
+    for v in (1.0, 2.0, 3.0):
+        c.predict(np.array([[v]]), "v1", model)
+    assert len(c) == 2 and c.stats["evictions"] == 1
+    c.predict(np.array([[2.0], [3.0]]), "v1", model)
+    assert model.calls == [1, 1, 1]
+
+    now[0] = 11.0
+    c.predict(np.array([[3.0]]), "v1", model)
+    assert model.calls[-1] == 1 and c.stats["expirations"] == 1
+
+
+def test_async_predict_and_disabled():
+    c = PredictionCache("p")
+    X = np.array([[1.0], [1.0], [2.0]])
+    calls = []
+
+    async def predict(rows):
+        calls.append(len(rows))
+        return rows[:, 0]
+
+    np.testing.assert_array_equal(asyncio.run(c.predict_async(X, "v1", predict)), [1.0, 1.0, 2.0])
+    np.testing.assert_array_equal(asyncio.run(c.predict_async(X, "v1", predict)), [1.0, 1.0, 2.0])
+    assert calls == [3]
+
+    off = PredictionCache("p", max_entries=0)
+    model = Model()
+    off.predict(X, "v1", model)
+    off.predict(X, "v1", model)
+    assert model.calls == [3, 3] and len(off) == 0
+
+
+def test_predict_batch_bypasses_the_cache(features_df):
+    import httpx
+    from api import app as api
+
+    model = api.REGISTRY.active
+    rows = features_df.reindex(columns=model.features).tail(50)
+    items = [{"payload": {k: v for k, v in r.items() if v == v}, "use_esp32": False}
+             for r in rows.to_dict(orient="records")]
+    api.PREDICTION_CACHE.clear()
+    before = dict(api.PREDICTION_CACHE.stats)
+
+    async def go():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/predict_batch", json={"items": items})
+
+    assert asyncio.run(go()).status_code == 200
+    assert len(api.PREDICTION_CACHE) == 0 and api.PREDICTION_CACHE.stats == before
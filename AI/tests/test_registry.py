@@ -0,0 +1,66 @@
+# AI/tests/test_registry.py
+import asyncio
+
+import httpx
+import joblib
+import pytest
+
+from api.compiled import CompiledPipeline
+from api.registry import ModelRegistry, load_version
+
+
+def _replace_model(art_dir, n_trees=50):
+    pipe = joblib.load(art_dir / "model.pkl")
+    clf = pipe.named_steps["clf"]
+    clf.estimators_ = clf.estimators_[:n_trees]
+    clf.n_estimators = n_trees
+    joblib.dump(pipe, art_dir / "model.pkl")
+
+
+def test_manifest_records_model_hash(art_dir):
+    engine = CompiledPipeline.load(art_dir)
+    assert engine.version
+    assert load_version(art_dir).source == "compiled"
+
+
+def test_stale_manifest_is_rejected(art_dir):
+    _replace_model(art_dir)
+    with pytest.raises(ValueError, match="model.pkl"):
+        CompiledPipeline.load(art_dir)
+    model = load_version(art_dir)
+    assert model.source == "pickle"
+    assert model.engine.n_trees == 50
+
+
+def test_reload_picks_up_replaced_model_pkl(art_dir):
+    registry = ModelRegistry(art_dir)
+    before = registry.active.version
+    _replace_model(art_dir)
+    result = asyncio.run(registry.reload())
+    assert result["status"] == "reloaded"
+    assert registry.active.version != before
+    assert registry.active.engine.n_trees == 50
+
+
+def _get(path, headers=None):
+    from api import app as api
+
+    async def go():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers=headers or {})
+    return asyncio.run(go())
+
+
+def test_admin_disabled_without_token(monkeypatch):
+    from api import app as api
+    monkeypatch.setattr(api, "ADMIN_TOKEN", None)
+    assert _get("/admin/model").status_code == 404
+
+
+def test_admin_requires_matching_token(monkeypatch):
+    from api import app as api
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+    assert _get("/admin/model").status_code == 401
+    assert _get("/admin/model", {"x-admin-token": "wrong"}).status_code == 401
+    assert _get("/admin/model", {"x-admin-token": "s3cret"}).status_code == 200
@@ -0,0 +1,18 @@
+# AI/tests/test_sites.py
+import json
+import os
+import subprocess
+import sys
+
+from tests.conftest import AI_DIR
+
+
+def test_sites_file_does_not_depend_on_cwd(tmp_path):
+    # La app arrancada desde otro directorio carga AI/sites.json, no el default de un solo sitio
+    env = {k: v for k, v in os.environ.items() if k != "SITES_FILE"}
+    env["PYTHONPATH"] = str(AI_DIR)
+    code = "import json; from api import app; print(json.dumps([s.name for s in app.SITES]))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env,
+                         capture_output=True, text=True, check=True)
+    expected = [s.get("name") for s in json.loads((AI_DIR / "sites.json").read_text(encoding="utf-8"))]
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == expected
@@ -0,0 +1,29 @@
+# AI/tests/test_startup.py
+import json
+import os
+import subprocess
+import sys
+
+from tests.conftest import AI_DIR
+
+PROBE = (
+    "import json, sys; from api import app; "
+    "print(json.dumps({'source': app.REGISTRY.active.source, "
+    "'loaded': sorted(m for m in ('sklearn', 'joblib', 'pandas') if m in sys.modules)}))"
+)
+
+
+def _start(**env):
+    env = {**os.environ, "PYTHONPATH": str(AI_DIR), **env}
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=AI_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_compiled_startup_skips_sklearn():
+    assert _start() == {"source": "compiled", "loaded": []}
+
+
+def test_without_manifest_falls_back_to_pickle(art_dir):
+    (art_dir / "manifest.json").unlink()
+    started = _start(ARTIFACTS_DIR=str(art_dir))
+    assert started["source"] == "pickle" and "sklearn" in started["loaded"]
@@ -0,0 +1,72 @@
+# AI/tests/test_stream.py
+import asyncio
+
+from api.stream import Broadcaster, change_key
+
+TOPIC = ("realtime", "esp32-water-01")
+
+
+def _value(p, label=0, esp32=None):
+    return {"risk_probability": p, "risk_label": label, "esp32": esp32, "computed_at": p * 1000}
+
+
+def test_publish_only_on_visible_change():
+    b = Broadcaster()
+    assert b.publish(TOPIC, _value(0.41), b"a")
+    assert not b.publish(TOPIC, _value(0.4101), b"b")  # mismo score redondeado
+    assert b.publish(TOPIC, _value(0.4101, esp32={"distance_cm": 3.0}), b"c")
+    assert b.publish(TOPIC, _value(0.4101, label=1, esp32={"distance_cm": 3.0}), b"d")
+    assert b.stats["published"] == 3 and b.stats["unchanged"] == 1
+
+    daily = {"daily_predictions": [{"date": "2026-10-17", **_value(0.2)}, {"date": "2026-10-18", **_value(0.3)}]}
+    shifted = {"daily_predictions": [{"date": "2026-10-18", **_value(0.3)}]}
+    assert change_key(daily) != change_key(shifted)
+
+
+def test_subscriber_gets_last_state_and_drops_oldest():
+    b = Broadcaster(max_queue=2)
+    b.publish(TOPIC, _value(0.1), b"first")
+    sub = b.subscribe(TOPIC)
+    for i in range(2, 5):
+        b.publish(TOPIC, _value(i / 10), b"v%d" % i)
+    events = [sub.queue.get_nowait() for _ in range(sub.queue.qsize())]
+    assert [body for _, body in events] == [b"v3", b"v4"]
+    assert [seq for seq, _ in events] == [3, 4]
+    assert sub.dropped == 2 and b.stats["dropped"] == 2
+
+    b.unsubscribe(sub)
+    assert b.info()["subscribers"] == {}
+
+
+def test_sse_stream():
+    b = Broadcaster()
+    b.publish(TOPIC, _value(0.1), b'{"risk_probability":0.1}')
+
+    async def go():
+        stream = b.sse(TOPIC, heartbeat_s=0.05, retry_ms=1000)
+        chunks = [await stream.__anext__(), await stream.__anext__(), await stream.__anext__()]
+        b.publish(TOPIC, _value(0.2), b'{"risk_probability":0.2}')
+        chunks.append(await stream.__anext__())
+        subscribers = b.info()["subscribers"]
+        await stream.aclose()
+        return chunks, subscribers
+
+    chunks, subscribers = asyncio.run(go())
+    assert chunks[0] == b"retry: 1000\n\n"
+    assert chunks[1] == b'event: risk\nid: 1\ndata: {"risk_probability":0.1}\n\n'
+    assert chunks[2].startswith(b": ping ")
+    assert chunks[3] == b'event: risk\nid: 2\ndata: {"risk_probability":0.2}\n\n'
+    assert subscribers == {"realtime:esp32-water-01": 1}
+    assert b.info()["subscribers"] == {}
+
+
+def test_stream_rejects_unknown_kind():
+    import httpx
+    from api import app as api
+
+    async def go():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/stream/risk", params={"kind": "hourly"})
+
+    assert asyncio.run(go()).status_code == 422
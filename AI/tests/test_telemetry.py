@@ -0,0 +1,212 @@
+# AI/tests/test_telemetry.py
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+from api.telemetry import DeviceBuffer, TelemetryStore, subscribe_rtdb
+
+DAY = 86400.0
+
+
+def test_dedup_and_ring_order():
+    buf = DeviceBuffer(capacity=4)
+    assert buf.append({"distance_cm": 5}, ts=100.0)
+    assert not buf.append({"distance_cm": 5}, ts=100.0)  # re-entrega
+    assert not buf.append({"distance_cm": 4}, ts=90.0)  # anterior a la última: ya vista
+    assert buf.latest_ts() == 100.0
+    assert buf.append({"distance_cm": 5}, ts=110.0)  # misma lectura, timestamp nuevo
+    for i in range(4):
+        assert buf.append({"distance_cm": 6 + i}, ts=200.0 + i)
+    assert buf.count == 4
+    np.testing.assert_array_equal(buf.history("distance_cm"), [6, 7, 8, 9])
+    np.testing.assert_array_equal(buf.timestamps(2), [202.0, 203.0])
+    assert not buf.append({"distance_cm": None, "level_pct": "x"})
+
+
+def test_duplicate_refreshes_freshness():
+    store = TelemetryStore()
+    old = time.time() - 3600
+    assert store.append("d", {"level_pct": 40}, ts=old)
+    assert store.latest("d", max_age_s=600) is None
+    # El polling a RTDB devuelve la misma lectura sin timestamp: no es nueva pero sigue vigente
+    assert not store.append("d", {"level_pct": 40})
+    assert store.latest("d", max_age_s=600) == store.latest("d")
+    assert store.get("d").count == 1
+    assert store.get("d").latest_ts() == old  # el timestamp de la lectura no cambia
+    assert store.stats == {"ingested": 1, "duplicates": 1}
+
+
+def test_extend_sorts_and_daily_last():
+    store = TelemetryStore()
+    t0 = 20000 * DAY
+    readings = [
+        {"distance_cm": 3, "timestamp": (t0 + 2 * DAY + 60) * 1000},  # milisegundos
+        {"distance_cm": 1, "timestamp": t0 + 10},
+        {"distance_cm": 2, "timestamp": t0 + 20},
+        {"distance_cm": 4, "timestamp": t0 + DAY + 5 * 3600},
+    ]
+    assert store.extend("d", readings) == 4
+    buf = store.get("d")
+    np.testing.assert_array_equal(buf.history("distance_cm"), [1, 2, 4, 3])
+
+    days, values = buf.daily_last()
+    np.testing.assert_array_equal(days, [20000, 20001, 20002])
+    np.testing.assert_array_equal(values[:, 0], [2, 4, 3])
+
+    # UTC-6: cada lectura cae en el día local anterior
+    days, values = buf.daily_last(-6 * 3600)
+    np.testing.assert_array_equal(days, [19999, 20000, 20001])
+    np.testing.assert_array_equal(values[:, 0], [2, 4, 3])
+
+
+def _sse(*events):
+    return "".join(f"event: {e}\ndata: {json.dumps(d)}\n\n" for e, d in events).encode()
+
+
+def test_subscribe_rtdb_fake_stream():
+    t0 = 20000 * DAY
+    node = {
+        "telemetry": {
+            "k2": {"distance_cm": 7, "timestamp": t0 + 20},
+            "k1": {"distance_cm": 8, "timestamp": t0 + 10},
+        },
+        "last": {"distance_cm": 7, "timestamp": t0 + 20},
+    }
+    body = _sse(
+        ("put", {"path": "/", "data": node}),
+        ("keep-alive", None),
+        ("patch", {"path": "/telemetry/k3", "data": {"distance_cm": 6, "timestamp": t0 + 30}}),
+        ("put", {"path": "/last", "data": {"distance_cm": 6, "timestamp": t0 + 30}}),
+        ("cancel", None),
+    )
+    connections = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        connections.append(request.url.path)
+        return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+
+    store = TelemetryStore()
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            task = asyncio.ensure_future(subscribe_rtdb(client, store, "https://rtdb.test", "d", retry_s=0.01))
+            while len(connections) < 3:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(go())
+    assert connections[0] == "/devices/d.json"
+    buf = store.get("d")
+    # Cada reconexión repite el nodo completo: nada se duplica
+    np.testing.assert_array_equal(buf.history("distance_cm"), [8, 7, 6])
+    assert buf.latest_ts() == t0 + 30
+    assert store.stats["ingested"] == 3
+    assert not store.streaming
+
+
+def test_subscribe_rtdb_counts_stream_errors():
+    from api.metrics import UPSTREAM_ERRORS
+
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.url.path)
+        return httpx.Response(503)
+
+    def errors() -> float:
+        return sum(v for k, v in UPSTREAM_ERRORS._values.items() if ("service", "firebase_stream") in k)
+
+    store = TelemetryStore()
+    before = errors()
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            task = asyncio.ensure_future(subscribe_rtdb(client, store, "https://rtdb.test", "d", retry_s=0.01))
+            while len(attempts) < 2:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(go())
+    assert errors() - before >= 2
+    assert not store.streaming
+
+
+def test_get_latest_esp32_uses_refreshed_reading(monkeypatch):
+    from api import app as api
+
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path.endswith("/last.json"):
+            return httpx.Response(200, json={"distance_cm": 4.0, "level_pct": 55.0})
+        return httpx.Response(200, json=None)
+
+    device = "esp32-test-stale"
+    api.TELEMETRY.buffer(device).append({"distance_cm": 4.0, "level_pct": 55.0}, ts=time.time() - 2 * api.TELEMETRY_MAX_AGE_S)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(api, "HTTP_CLIENT", client)
+            first = await api.get_latest_esp32(device)
+            n = len(calls)
+            second = await api.get_latest_esp32(device)
+            return first, n, second
+
+    first, n, second = asyncio.run(go())
+    assert first["level_pct"] == 55.0 and second["level_pct"] == 55.0
+    assert n >= 1
+    assert len(calls) == n  # la segunda sale de la memoria (dentro de TELEMETRY_POLL_MAX_AGE_S)
+
+
+def _stamped_rtdb(calls, ts_s):
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path.endswith("/last.json"):
+            return httpx.Response(200, json={"distance_cm": 4.0, "level_pct": 55.0, "timestamp": int(ts_s * 1000)})
+        return httpx.Response(200, content=b"null")
+    return handler
+
+
+def test_get_latest_esp32_polls_rtdb_without_stream(monkeypatch):
+    from api import app as api
+
+    calls = []
+    device = "esp32-test-poll"
+    stamp = time.time() - 60  # el dispositivo reportó hace un minuto
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_stamped_rtdb(calls, stamp))) as client:
+            monkeypatch.setattr(api, "HTTP_CLIENT", client)
+            first = await api.get_latest_esp32(device)
+            n = len(calls)
+            await api.get_latest_esp32(device)
+            return first, n
+
+    first, n = asyncio.run(go())
+    # Sin stream, la frescura sale del reloj del dispositivo: cada request vuelve a consultar RTDB
+    assert first["timestamp"] == int(stamp * 1000)
+    assert len(calls) == 2 * n
+    assert api.TELEMETRY.get(device).latest_ts() == int(stamp * 1000) / 1000
+
+
+def test_get_latest_esp32_uses_memory_while_streaming(monkeypatch):
+    from api import app as api
+
+    calls = []
+    device = "esp32-test-stream"
+    api.TELEMETRY.buffer(device).append({"distance_cm": 4.0, "level_pct": 55.0}, ts=time.time() - 60)
+    monkeypatch.setattr(api.TELEMETRY, "streaming", {device})
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_stamped_rtdb(calls, time.time()))) as client:
+            monkeypatch.setattr(api, "HTTP_CLIENT", client)
+            return await api.get_latest_esp32(device)
+
+    assert asyncio.run(go())["level_pct"] == 55.0
+    assert calls == []
@@ -0,0 +1,37 @@
+# AI/tests/test_threshold.py
+import asyncio
+
+import httpx
+import numpy as np
+
+
+def test_tuned_threshold_applies_to_climate_only(features_df, monkeypatch):
+    from api import app as api
+    from api.water import WEIGHT_CLIMATE
+
+    model = api.REGISTRY.active
+    monkeypatch.setattr(model, "threshold", 0.05)
+    rows = features_df.reindex(columns=model.features).tail(200)
+    items = [{"payload": {k: v for k, v in r.items() if v == v}, "use_esp32": False}
+             for r in rows.to_dict(orient="records")]
+    api.PREDICTION_CACHE.clear()
+
+    async def go():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            batch = await client.post("/predict_batch", json={"items": items})
+            health = await client.get("/health")
+            return batch, health
+
+    batch, health = asyncio.run(go())
+    out = batch.json()["predictions"]
+    climate = np.array([r["climate_probability"] for r in out])
+    assert (climate >= 0.05).any()
+
+    # El corte ajustado en train.py solo decide climate_label
+    assert [r["climate_label"] for r in out] == (climate >= 0.05).astype(int).tolist()
+    assert all(r["climate_threshold"] == 0.05 for r in out)
+    # El riesgo combinado (sin ESP32: 0.3 * clima) conserva RISK_THRESHOLD
+    assert [r["risk_label"] for r in out] == (WEIGHT_CLIMATE * climate >= api.RISK_THRESHOLD).astype(int).tolist()
+    assert all(r["threshold"] == api.RISK_THRESHOLD for r in out)
+    assert health.json()["threshold"] == api.RISK_THRESHOLD and health.json()["climate_threshold"] == 0.05
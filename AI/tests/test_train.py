@@ -0,0 +1,76 @@
+# AI/tests/test_train.py
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import train
+from tests.conftest import CSV
+
+
+def _incremental(monkeypatch, art_dir, *extra):
+    argv = ["train.py", "--csv", str(CSV), "--out", str(art_dir), "--incremental", "--no-cache",
+            "--since", "2025-05-01", "--holdout-days", "30", "--new-trees", "5", "--workers", "1", *extra]
+    monkeypatch.setattr(sys, "argv", argv)
+    train.main()
+    return json.loads((art_dir / "metrics.json").read_text(encoding="utf-8"))["incremental"][0]
+
+
+def test_incremental_reads_only_new_rows(monkeypatch, art_dir):
+    since = []
+    read_since = train.read_since
+    monkeypatch.setattr(train, "read_since", lambda csv, start: since.append(start) or read_since(csv, start))
+    monkeypatch.setattr(train, "load_features", lambda *a, **k: pytest.fail("reajuste completo sin --compare-full"))
+
+    update = _incremental(monkeypatch, art_dir)
+    assert since == [pd.Timestamp("2025-05-01") - pd.Timedelta(days=train.LOOKBACK_DAYS)]
+    assert update["watermark"] == "2025-08-01"
+    # Solo las filas posteriores al watermark entran al ajuste
+    assert update["fit_rows"] == (pd.Timestamp("2025-08-01") - pd.Timestamp("2025-05-01")).days
+    assert "incremental" in update
+    assert "full_refit" not in update and "incremental_vs_full" not in update
+
+
+def test_compare_full(monkeypatch, art_dir):
+    update = _incremental(monkeypatch, art_dir, "--compare-full")
+    full, inc = update["full_refit"], update["incremental"]
+    assert full["rows"] == inc["rows"] == update["previous"]["rows"] > 0
+    assert full["seconds"] > 0
+    for k, gap in update["incremental_vs_full"].items():
+        assert gap == pytest.approx(inc[k] - full[k], abs=1e-6)
+
+
+def test_cross_validate_matches_serial_walk_forward(features_df):
+    from sklearn.metrics import average_precision_score
+    from sklearn.model_selection import TimeSeriesSplit
+
+    numeric = json.loads((CSV.parent / "artifacts" / "feature_names.json").read_text(encoding="utf-8"))
+    X = features_df.reindex(columns=numeric)
+    y = features_df["risk_next_day"].to_numpy()
+    candidates = [{"n_estimators": 15, "max_depth": 4}, {"n_estimators": 15, "min_samples_leaf": 4}]
+
+    results = train.cross_validate(X, y, candidates, n_splits=3, workers=2)
+    assert [r["avg_precision"] for r in results] == sorted((r["avg_precision"] for r in results), reverse=True)
+
+    folds = list(TimeSeriesSplit(n_splits=3).split(X))
+    for r in results:
+        # Cada fold se ajusta solo con el pasado y se evalúa en el bloque siguiente
+        assert all(tr.max() < te.min() for tr, te in folds)
+        probas = []
+        for tr, te in folds:
+            pipe = train.make_pipeline(numeric, n_jobs=1, **r["params"]).fit(X.iloc[tr], y[tr])
+            probas.append(pipe.predict_proba(X.iloc[te])[:, 1])
+        y_oof = np.concatenate([y[te] for _, te in folds])
+        assert r["avg_precision"] == pytest.approx(average_precision_score(y_oof, np.concatenate(probas)))
+        assert r["decision_threshold"] in train.THRESHOLD_GRID
+
+
+def test_candidate_params():
+    assert train.candidate_params("default", 5, 0) == [train.DEFAULT_PARAMS]
+    grid = train.candidate_params("grid", 5, 0)
+    assert len(grid) == int(np.prod([len(v) for v in train.SEARCH_SPACE.values()]))
+    sample = train.candidate_params("random", 5, 7)
+    assert len(sample) == 5 and sample == train.candidate_params("random", 5, 7)
+    assert all(p in grid for p in sample)
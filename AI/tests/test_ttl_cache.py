@@ -0,0 +1,76 @@
+# AI/tests/test_ttl_cache.py
+import asyncio
+
+import pytest
+
+from api.cache import TTLCache
+
+
+def test_single_flight(clock):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def go():
+        c = TTLCache("t", ttl=10)
+        return c, await asyncio.gather(*(c.get_or_fetch("k", fetch) for _ in range(20)))
+
+    c, values = asyncio.run(go())
+    assert values == [1] * 20
+    assert len(calls) == 1
+    assert c.stats["misses"] == 1 and c.stats["coalesced"] == 19
+
+
+def test_ttl_stale_while_revalidate_and_expiry(clock):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def go():
+        c = TTLCache("t", ttl=10, stale_ttl=5)
+        assert await c.get_or_fetch("k", fetch) == 1
+        clock.now += 9
+        assert await c.get_or_fetch("k", fetch) == 1  # hit
+        clock.now += 2
+        assert await c.get_or_fetch("k", fetch) == 1  # viejo, se refresca en segundo plano
+        assert await c.get_or_fetch("k", fetch) == 1  # el refresco sigue en curso: no se lanza otro
+        await asyncio.sleep(0)
+        assert await c.get_or_fetch("k", fetch) == 2  # ya refrescado
+        clock.now += 16
+        assert await c.get_or_fetch("k", fetch) == 3  # vencido del todo: se espera el upstream
+        return c
+
+    c = asyncio.run(go())
+    assert len(calls) == 3
+    assert c.stats["hits"] == 2 and c.stats["stale_hits"] == 2 and c.stats["refreshes"] == 1
+
+
+def test_errors_are_not_cached(clock):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("upstream")
+        return "ok"
+
+    async def go():
+        c = TTLCache("t", ttl=10, stale_ttl=5)
+        with pytest.raises(RuntimeError):
+            await c.get_or_fetch("k", fetch)
+        assert await c.get_or_fetch("k", fetch) == "ok"
+        # Un refresco fallido deja el valor viejo en su lugar
+        clock.now += 12
+        calls.clear()
+        assert await c.get_or_fetch("k", fetch) == "ok"
+        await asyncio.sleep(0)
+        return c
+
+    c = asyncio.run(go())
+    assert c.stats["errors"] == 2
+    assert c._entries["k"][1] == "ok"
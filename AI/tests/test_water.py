@@ -0,0 +1,82 @@
+# AI/tests/test_water.py
+import random
+import warnings
+
+import numpy as np
+import pytest
+
+from api.water import WATER_FIELDS, compute_water_score, compute_water_scores_from_packets
+
+
+def _to_float(x, default=None):
+    try:
+        if x is None: return default
+        if isinstance(x, (int, float)): return float(x)
+        return float(str(x).strip())
+    except Exception:
+        return default
+
+
+def scalar_water_score(esp32, max_depth_cm=10.0, headspace_cm=3.0):
+    """Implementación escalar anterior (app.py), sin logs: referencia de la vectorizada."""
+    if not esp32:
+        return 0.0
+    candidates = []
+    lp = _to_float(esp32.get("level_pct"))
+    if lp is not None:
+        candidates.append(lp / 100.0)
+    fp = _to_float(esp32.get("fill_pct"))
+    if fp is not None:
+        candidates.append(fp / 100.0)
+    usable = _to_float(esp32.get("usable_depth_cm"))
+    md = _to_float(esp32.get("max_depth_cm"), max_depth_cm)
+    hs = _to_float(esp32.get("headspace_cm"), headspace_cm)
+    if usable is None and (md is not None and hs is not None):
+        usable = max(0.0, md - hs)
+    wh = _to_float(esp32.get("water_height_cm"))
+    if wh is not None and usable and usable > 0:
+        candidates.append(wh / usable)
+    d = _to_float(esp32.get("distance_cm"))
+    if d is not None and usable and usable > 0 and md is not None:
+        candidates.append(max(0.0, min(usable, md - d)) / usable)
+    cleaned = [max(0.0, min(1.0, c)) for c in candidates if c is not None]
+    return max(cleaned) if cleaned else 0.0
+
+
+def _value(rng):
+    kind = rng.random()
+    if kind < 0.3:
+        return None
+    if kind < 0.5:
+        return rng.choice([0, 0.0, -1.0, 3, 10])
+    if kind < 0.8:
+        return rng.uniform(-20.0, 150.0)
+    if kind < 0.9:
+        return f" {rng.uniform(-5.0, 30.0):.3f} "
+    return rng.choice(["", "n/a", "abc", "1e2"])
+
+
+def _packet(rng):
+    return {k: v for k in WATER_FIELDS if (v := _value(rng)) is not None or rng.random() < 0.2}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_vectorized_matches_scalar(seed):
+    rng = random.Random(seed)
+    packets = [_packet(rng) for _ in range(2000)]
+    geometry = [(rng.choice([10.0, 25.0, 2.0]), rng.choice([3.0, 0.0, 5.0])) for _ in packets]
+
+    expected = np.array([scalar_water_score(p, md, hs) for p, (md, hs) in zip(packets, geometry)])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        got = compute_water_scores_from_packets(packets, [g[0] for g in geometry], [g[1] for g in geometry])
+        single = [compute_water_score(p, md, hs) for p, (md, hs) in zip(packets[:200], geometry[:200])]
+
+    np.testing.assert_allclose(got, expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(single, expected[:200], rtol=0, atol=1e-12)
+
+
+def test_nan_reading_is_missing():
+    assert compute_water_score({"level_pct": float("nan"), "fill_pct": 40}) == pytest.approx(0.4)
+    assert compute_water_score({"max_depth_cm": float("nan"), "distance_cm": 4}) == pytest.approx(6 / 7)
+    assert compute_water_score({}) == 0.0
@@ -1,4 +1,5 @@
-import argparse, json
+import argparse, itertools, json, random, time, warnings
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -7,9 +8,14 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import roc_auc_score, average_precision_score, classification_report, confusion_matrix
+from sklearn.metrics import roc_auc_score, average_precision_score, classification_report, confusion_matrix, f1_score
+from sklearn.model_selection import TimeSeriesSplit
 import joblib
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.compiled import CompiledPipeline
+from data import DEFAULT_CACHE_DIR, expand_sources, iter_chunks, load_features
+from features import WINDOWS, apply_specs, feature_specs, group_starts
 
 # ------------------------------------------------------------
 # Utilidad: detectar columnas relacionadas con nivel de agua
@@ -23,98 +29,361 @@ def _detect_water_cols(df: pd.DataFrame) -> List[str]:
 # ------------------------------------------------------------
 # Ingeniería de características principal
 # ------------------------------------------------------------
-def build_features(df: pd.DataFrame) -> Tuple[pd.DataFrame, float, List[str]]:
+# Columnas que identifican la serie (estación / dispositivo), en orden de preferencia
+GROUP_COLUMNS = ["device_id", "station", "name"]
+
+
+def group_column(df: pd.DataFrame) -> Optional[str]:
+    return next((c for c in GROUP_COLUMNS if c in df.columns), None)
+
+
+def build_features(df: pd.DataFrame, threshold_mm: Optional[float] = None) -> Tuple[pd.DataFrame, float, List[str]]:
     if "datetime" not in df.columns:
         raise ValueError("El CSV debe incluir una columna 'datetime'.")
     if "precip" not in df.columns:
         raise ValueError("El CSV debe incluir una columna numérica 'precip' (mm/día).")
 
-    df = df.copy()
-    df["datetime"] = pd.to_datetime(df["datetime"])
-    df = df.sort_values("datetime").reset_index(drop=True)
-
-    # Etiqueta proxy: lluvia intensa al día siguiente (p95, mínimo 20 mm)
-    q95 = float(np.nanpercentile(df["precip"].fillna(0), 95))
-    threshold_mm = max(q95, 20.0)
-    df["precip_next_day"] = df["precip"].shift(-1)
-    df["risk_next_day"] = (df["precip_next_day"] >= threshold_mm).astype(int)
-
-    # Features rolling climáticas
-    for w in [3, 5, 7, 14]:
-        df[f"precip_sum_{w}d"] = df["precip"].rolling(window=w, min_periods=1).sum()
-        df[f"precip_max_{w}d"] = df["precip"].rolling(window=w, min_periods=1).max()
-        if "humidity" in df.columns:
-            df[f"humidity_mean_{w}d"] = df["humidity"].rolling(window=w, min_periods=1).mean()
-        if "sealevelpressure" in df.columns:
-            df[f"slp_mean_{w}d"] = df["sealevelpressure"].rolling(window=w, min_periods=1).mean()
-
-    # ---------------------------------------------
-    # NUEVO: Features de nivel de agua (ESP32)
-    # ---------------------------------------------
-    water_cols = _detect_water_cols(df)
-    for col in water_cols:
-        df[f"{col}_lag1"] = df[col].shift(1)
-        df[f"{col}_lag3"] = df[col].shift(3)
-        df[f"{col}_diff1"] = df[col].diff(1)
-        df[f"{col}_roc3"]  = (df[col] - df[col].shift(3)) / 3.0
+    # Varias estaciones/dispositivos: cada uno es su propia serie, contigua y ordenada por fecha
+    group = group_column(df)
+    df = df.assign(datetime=pd.to_datetime(df["datetime"]))
+    df = df.sort_values([group, "datetime"] if group else "datetime", kind="stable").reset_index(drop=True)
+    start = group_starts(pd.factorize(df[group])[0]) if group else np.zeros(len(df), dtype=np.int64)
 
-        for w in [3, 5, 7, 14]:
-            df[f"{col}_mean_{w}d"] = df[col].rolling(w, min_periods=1).mean()
-            df[f"{col}_max_{w}d"]  = df[col].rolling(w, min_periods=1).max()
-            df[f"{col}_min_{w}d"]  = df[col].rolling(w, min_periods=1).min()
+    # Etiqueta proxy: lluvia intensa al día siguiente (p95, mínimo 20 mm; fijo en modo incremental)
+    precip = df["precip"].to_numpy(dtype=np.float64)
+    if threshold_mm is None:
+        q95 = float(np.nanpercentile(np.nan_to_num(precip), 95))
+        threshold_mm = max(q95, 20.0)
+    nxt = np.append(precip[1:], np.nan)
+    nxt[np.append(start[1:] != start[:-1], True)] = np.nan  # último día de cada serie
+    df["precip_next_day"] = nxt
+    df["risk_next_day"] = (nxt >= threshold_mm).astype(int)
 
-        df[f"{col}_std_7d"] = df[col].rolling(7, min_periods=2).std()
+    # Features rolling climáticas y de nivel de agua (ESP32); definiciones en features.py
+    water_cols = _detect_water_cols(df)
+    df = apply_specs(df, feature_specs(df.columns, water_cols), groups=start)
 
     return df, threshold_mm, water_cols
 
+def time_split(df: pd.DataFrame, test_fraction: float = 0.2) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Split temporal: el tramo final queda para evaluación."""
+    split_idx = int(len(df) * (1 - test_fraction))
+    return df.iloc[:split_idx], df.iloc[split_idx:]
+
+# ------------------------------------------------------------
+# Modelo y búsqueda de hiperparámetros
+# ------------------------------------------------------------
+DEFAULT_PARAMS = {"n_estimators": 600, "min_samples_split": 4}
+
+SEARCH_SPACE = {
+    "n_estimators": [200, 400, 600],
+    "max_depth": [None, 8, 16],
+    "min_samples_split": [2, 4, 8],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": ["sqrt", 0.5],
+}
+# Cortes de probabilidad evaluados sobre las predicciones out-of-fold
+THRESHOLD_GRID = [round(t, 2) for t in np.arange(0.05, 0.96, 0.05)]
+
+
+def make_pipeline(numeric_cols: List[str], n_jobs: int = -1, **params: Any) -> Pipeline:
+    pre = ColumnTransformer([
+        ("num", Pipeline([
+            ("imp", SimpleImputer(strategy="median")),
+            ("scaler", StandardScaler(with_mean=False))
+        ]), numeric_cols)
+    ])
+
+    clf = RandomForestClassifier(
+        class_weight="balanced",
+        random_state=42,
+        n_jobs=n_jobs,
+        **{**DEFAULT_PARAMS, **params}
+    )
+    return Pipeline([("pre", pre), ("clf", clf)])
+
+
+def candidate_params(search: str, n_iter: int, seed: int) -> List[Dict[str, Any]]:
+    if search == "default":
+        return [dict(DEFAULT_PARAMS)]
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    if search == "random":
+        grid = random.Random(seed).sample(grid, min(n_iter, len(grid)))
+    return grid
+
+
+# Cada worker recibe X/y una sola vez (initializer) en lugar de con cada tarea
+_CV_DATA: Dict[str, Any] = {}
+
+
+def _init_cv_worker(X: pd.DataFrame, y: np.ndarray, folds: List[Tuple[np.ndarray, np.ndarray]]) -> None:
+    _CV_DATA.update(X=X, y=y, folds=folds)
+
+
+def _fit_fold(task: Tuple[int, int, Dict[str, Any]]) -> Tuple[int, int, np.ndarray]:
+    """Entrena una configuración en un fold y devuelve la probabilidad sobre su bloque de validación."""
+    cand, fold, params = task
+    X, y = _CV_DATA["X"], _CV_DATA["y"]
+    train_idx, test_idx = _CV_DATA["folds"][fold]
+    pipe = make_pipeline(list(X.columns), n_jobs=1, **params)
+    pipe.fit(X.iloc[train_idx], y[train_idx])
+    classes = list(pipe.named_steps["clf"].classes_)
+    if 1 not in classes:  # fold de entrenamiento sin positivos
+        return cand, fold, np.zeros(len(test_idx))
+    return cand, fold, pipe.predict_proba(X.iloc[test_idx])[:, classes.index(1)]
+
+
+def pick_threshold(y: np.ndarray, proba: np.ndarray) -> Tuple[float, float]:
+    """
+    Corte de THRESHOLD_GRID con mejor F1 sobre predicciones out-of-fold. Es un
+    corte de la probabilidad climática: la API lo aplica a climate_label, no al
+    riesgo combinado agua+clima (RISK_THRESHOLD).
+    """
+    scores = [f1_score(y, (proba >= t).astype(int), zero_division=0) for t in THRESHOLD_GRID]
+    best = int(np.argmax(scores))
+    return THRESHOLD_GRID[best], float(scores[best])
+
+
+def _safe_metric(fn, y: np.ndarray, proba: np.ndarray) -> Optional[float]:
+    return float(fn(y, proba)) if 0 < y.sum() < len(y) else None
+
+
+def cross_validate(
+    X: pd.DataFrame, y: np.ndarray, candidates: List[Dict[str, Any]], n_splits: int, workers: Optional[int]
+) -> List[Dict[str, Any]]:
+    """
+    Walk-forward (TimeSeriesSplit) de todas las configuraciones, repartido en un
+    pool de procesos (una tarea por configuración y fold). Las features se
+    calculan una sola vez: build_features solo mira hacia atrás, así que cada
+    fold es un corte de la misma tabla.
+    """
+    folds = list(TimeSeriesSplit(n_splits=n_splits).split(X))
+    tasks = [(c, f, params) for c, params in enumerate(candidates) for f in range(len(folds))]
+    oof = [[None] * len(folds) for _ in candidates]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_cv_worker, initargs=(X, y, folds)) as pool:
+        for cand, fold, proba in pool.map(_fit_fold, tasks):
+            oof[cand][fold] = proba
+
+    results = []
+    for cand, params in enumerate(candidates):
+        y_oof = np.concatenate([y[test_idx] for _, test_idx in folds])
+        p_oof = np.concatenate(oof[cand])
+        per_fold = [_safe_metric(average_precision_score, y[test_idx], oof[cand][f])
+                    for f, (_, test_idx) in enumerate(folds)]
+        threshold, f1 = pick_threshold(y_oof, p_oof)
+        results.append({
+            "params": params,
+            "roc_auc": _safe_metric(roc_auc_score, y_oof, p_oof),
+            "avg_precision": _safe_metric(average_precision_score, y_oof, p_oof),
+            "avg_precision_per_fold": per_fold,
+            "decision_threshold": threshold,
+            "f1_at_threshold": f1,
+            "positives": int(y_oof.sum()),
+        })
+    # Mejor configuración: avg precision out-of-fold (las clases están muy desbalanceadas)
+    results.sort(key=lambda r: (r["avg_precision"] or 0.0, r["roc_auc"] or 0.0), reverse=True)
+    return results
+
+
+# ------------------------------------------------------------
+# Reentrenamiento incremental
+# ------------------------------------------------------------
+# Historia previa que necesitan lags/rolling para la primera fila de la ventana
+LOOKBACK_DAYS = max(WINDOWS)
+
+
+def read_since(patterns: List[str], since: pd.Timestamp) -> pd.DataFrame:
+    """Solo las filas con datetime >= since (CSV: filtrado por bloque; archivo de series: slice del índice)."""
+    chunks = list(iter_chunks(expand_sources(patterns), start=since))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def evaluate(pipe: Pipeline, X: pd.DataFrame, y: np.ndarray, decision_threshold: float) -> Dict[str, Any]:
+    proba = pipe.predict_proba(X)[:, 1]
+    return {
+        "rows": int(len(y)),
+        "positives": int(y.sum()),
+        "roc_auc": _safe_metric(roc_auc_score, y, proba),
+        "avg_precision": _safe_metric(average_precision_score, y, proba),
+        "confusion_matrix@decision_threshold": confusion_matrix(
+            y, (proba >= decision_threshold).astype(int), labels=[0, 1]).tolist(),
+    }
+
+
+def incremental_update(args) -> None:
+    """
+    Actualiza el bosque de artifacts/model.pkl con los días posteriores al
+    watermark del último entrenamiento, sin reajustar el preprocesamiento:
+
+    - Se leen y se calculan features solo desde watermark - LOOKBACK_DAYS (lo que
+      necesitan las ventanas rolling), con el umbral de etiqueta guardado
+      (suggested_threshold_mm); --window-days suma días previos al watermark.
+    - Los últimos holdout_days quedan fuera del ajuste y sirven de evaluación;
+      las filas nuevas hasta ahí son la ventana de ajuste.
+    - Se agregan new_trees árboles ajustados sobre la ventana (warm_start) y se
+      retiran los más viejos para mantener el presupuesto de árboles.
+    - El watermark avanza al final de la ventana: el holdout se usa en la próxima corrida.
+    - Con --compare-full, un reajuste completo hasta fit_end se evalúa en el
+      mismo holdout y queda en metrics.json junto a la versión incremental
+      (lee toda la historia: es para auditar, no para cada actualización).
+    """
+    t0 = time.perf_counter()
+    out = Path(args.out)
+    metrics = json.loads((out / "metrics.json").read_text(encoding="utf-8"))
+    numeric_cols = json.loads((out / "feature_names.json").read_text(encoding="utf-8"))
+    watermark = args.since or metrics.get("watermark")
+    if watermark is None:
+        raise SystemExit("[ERROR] metrics.json no tiene watermark: corré un entrenamiento completo o pasá --since.")
+    watermark = pd.Timestamp(watermark)
+    threshold_mm = float(metrics["suggested_threshold_mm"])
+    decision_threshold = float(metrics.get("decision_threshold", 0.25))
+
+    raw = read_since(args.csv, watermark - pd.Timedelta(days=args.window_days + LOOKBACK_DAYS))
+    if raw.empty:
+        raise SystemExit("[ERROR] Los CSV no tienen filas posteriores al watermark.")
+    df, _, _ = build_features(raw, threshold_mm=threshold_mm)
+    df = df[df["precip_next_day"].notna()]  # el último día de cada serie aún no tiene etiqueta
+    dt = df["datetime"]
+    fit_end = dt.max() - pd.Timedelta(days=args.holdout_days)
+    if not fit_end > watermark:
+        print(f"[INFO] Sin días nuevos fuera del holdout (watermark {watermark.date()}): nada que actualizar.")
+        return
+
+    fit_mask = ((dt > watermark - pd.Timedelta(days=args.window_days)) & (dt <= fit_end)).to_numpy()
+    hold_mask = (dt > fit_end).to_numpy()
+    X = df.reindex(columns=numeric_cols)
+    y = df["risk_next_day"].to_numpy()
+    X_fit, y_fit = X[fit_mask], y[fit_mask]
+    if len(np.unique(y_fit)) < 2:
+        raise SystemExit("[ERROR] La ventana reciente no tiene ambas clases: ampliá --window-days.")
+    t_load = time.perf_counter() - t0
+
+    pipe = joblib.load(out / "model.pkl")
+    clf = pipe.named_steps["clf"]
+    budget = args.budget or len(clf.estimators_)
+    new_trees = min(args.new_trees, budget)
+    X_hold, y_hold = X[hold_mask], y[hold_mask]
+    previous = evaluate(pipe, X_hold, y_hold, decision_threshold) if len(y_hold) else None
+
+    # warm_start agrega árboles nuevos sobre la ventana; luego se descartan los más viejos
+    t1 = time.perf_counter()
+    Xt_fit = pipe.named_steps["pre"].transform(X_fit)
+    clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + new_trees, n_jobs=args.workers or -1)
+    with warnings.catch_warnings():
+        # class_weight="balanced" se recalcula sobre la ventana: es justamente lo buscado
+        warnings.filterwarnings("ignore", message="class_weight presets", category=UserWarning)
+        clf.fit(Xt_fit, y_fit)
+    retired = max(0, len(clf.estimators_) - budget)
+    clf.estimators_ = clf.estimators_[retired:]
+    clf.set_params(warm_start=False, n_estimators=len(clf.estimators_))
+    t_fit = time.perf_counter() - t1
+
+    comparison: Dict[str, Any] = {"previous": previous}
+    if len(y_hold):
+        comparison["incremental"] = evaluate(pipe, X_hold, y_hold, decision_threshold)
+    if args.compare_full and len(y_hold):
+        # Referencia: reajuste completo con la misma configuración y la misma etiqueta
+        # sobre toda la historia hasta fit_end, evaluado en el mismo holdout
+        t2 = time.perf_counter()
+        full_df, _, _, _ = load_features(args.csv, None if args.no_cache else Path(args.cache_dir))
+        full_df = full_df[(full_df["datetime"] <= fit_end) & full_df["precip_next_day"].notna()]
+        full = make_pipeline(numeric_cols, n_jobs=args.workers or -1, **metrics.get("params", DEFAULT_PARAMS))
+        full.fit(full_df.reindex(columns=numeric_cols), (full_df["precip_next_day"] >= threshold_mm).astype(int))
+        comparison["full_refit"] = {**evaluate(full, X_hold, y_hold, decision_threshold),
+                                    "seconds": round(time.perf_counter() - t2, 3)}
+        # Lo que pierde (o gana) la actualización incremental frente al reajuste completo
+        comparison["incremental_vs_full"] = {
+            k: round(comparison["incremental"][k] - comparison["full_refit"][k], 6)
+            for k in ("roc_auc", "avg_precision")
+            if comparison["incremental"].get(k) is not None and comparison["full_refit"].get(k) is not None
+        }
+
+    joblib.dump(pipe, out / "model.pkl")
+    manifest = CompiledPipeline.from_pipeline(pipe, numeric_cols).save(out, source="model.pkl", model_path=out / "model.pkl")
+    update = {
+        "previous_watermark": str(watermark.date()),
+        "watermark": str(fit_end.date()),
+        "fit_rows": int(fit_mask.sum()),
+        "fit_positives": int(y_fit.sum()),
+        "new_trees": new_trees,
+        "retired_trees": retired,
+        "n_trees": len(clf.estimators_),
+        "holdout_days": args.holdout_days,
+        "seconds": {"load_features": round(t_load, 3), "fit": round(t_fit, 3),
+                    "total": round(time.perf_counter() - t0, 3)},
+        "version": manifest["version"],
+        **comparison,
+    }
+    metrics["watermark"] = update["watermark"]
+    metrics["incremental"] = ([update] + metrics.get("incremental", []))[:30]
+    (out / "metrics.json").write_text(json.dumps(metrics, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"[OK] {new_trees} árboles nuevos sobre {update['fit_rows']} filas, {retired} retirados "
+          f"({update['n_trees']} en total) en {update['seconds']['total']} s")
+    for name in ("previous", "incremental", "full_refit"):
+        if comparison.get(name):
+            print(f"[INFO] Holdout {name}: AP={comparison[name].get('avg_precision')} "
+                  f"ROC-AUC={comparison[name].get('roc_auc')}")
+    print(f"[OK] Modelo compilado {manifest['version']}; watermark {update['watermark']}")
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--csv", required=True)
+    ap.add_argument("--csv", nargs="+", required=True, help="uno o varios CSV (se aceptan globs) o un archivo de series")
     ap.add_argument("--out", default="artifacts")  # siempre apunta a artifacts
+    ap.add_argument("--search", choices=["none", "default", "grid", "random"], default="none",
+                    help="none: configuración fija; default/grid/random: CV walk-forward y corte de decisión")
+    ap.add_argument("--cv-splits", type=int, default=5)
+    ap.add_argument("--n-iter", type=int, default=20, help="configuraciones a probar con --search random")
+    ap.add_argument("--workers", type=int, default=None, help="procesos del pool (por defecto, todos los CPU)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="caché de features parseadas")
+    ap.add_argument("--no-cache", action="store_true")
+    inc = ap.add_argument_group("modo incremental")
+    inc.add_argument("--incremental", action="store_true",
+                     help="actualiza model.pkl con los días posteriores al watermark en lugar de reentrenar")
+    inc.add_argument("--new-trees", type=int, default=60, help="árboles nuevos por actualización")
+    inc.add_argument("--budget", type=int, default=None, help="árboles a mantener (por defecto, los actuales)")
+    inc.add_argument("--window-days", type=int, default=0,
+                     help="días previos al watermark que se suman al ajuste (0 = solo filas nuevas)")
+    inc.add_argument("--holdout-days", type=int, default=30, help="días finales reservados para evaluar")
+    inc.add_argument("--since", default=None, help="watermark manual (YYYY-MM-DD) si metrics.json no lo tiene")
+    inc.add_argument("--compare-full", action="store_true",
+                     help="además reajusta desde cero y compara en el holdout (se guarda en metrics.json)")
     args = ap.parse_args()
 
+    if args.incremental:
+        incremental_update(args)
+        return
+
     Path(args.out).mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_csv(args.csv)
-    df, threshold, water_cols = build_features(df)
+    df, threshold, water_cols, load_info = load_features(args.csv, None if args.no_cache else Path(args.cache_dir))
+    print(f"[INFO] Features: {len(df)} filas (caché: {load_info['cache']}, {load_info['seconds']} s)")
 
     # Split temporal 80/20
-    split_idx = int(len(df) * 0.8)
-    train_df, test_df = df.iloc[:split_idx], df.iloc[split_idx:]
+    train_df, test_df = time_split(df)
 
     # Selección de columnas
     exclude = {
         "name","datetime","description","icon","stations","sunrise","sunset",
-        "preciptype","conditions","risk_next_day","precip_next_day"
+        "preciptype","conditions","risk_next_day","precip_next_day", *GROUP_COLUMNS
     }
     numeric_cols = [c for c in df.columns if c not in exclude and pd.api.types.is_numeric_dtype(df[c])]
 
-    # Guardar lista de features
-    (Path(args.out) / "feature_names.json").write_text(
-        json.dumps(numeric_cols, indent=2, ensure_ascii=False),
-        encoding="utf-8"
-    )
-
     X_train, y_train = train_df[numeric_cols], train_df["risk_next_day"]
     X_test,  y_test  = test_df[numeric_cols],  test_df["risk_next_day"]
 
-    # Pipeline
-    pre = ColumnTransformer([
-        ("num", Pipeline([
-            ("imp", SimpleImputer(strategy="median")),
-            ("scaler", StandardScaler(with_mean=False))
-        ]), numeric_cols)
-    ])
-
-    clf = RandomForestClassifier(
-        n_estimators=600,
-        class_weight="balanced",
-        min_samples_split=4,
-        random_state=42,
-        n_jobs=-1
-    )
+    # Búsqueda con CV walk-forward sobre el tramo de entrenamiento (el 20% final queda intacto)
+    params, cv = dict(DEFAULT_PARAMS), None
+    if args.search != "none":
+        candidates = candidate_params(args.search, args.n_iter, args.seed)
+        print(f"[INFO] CV walk-forward: {len(candidates)} configuraciones x {args.cv_splits} folds")
+        cv = cross_validate(X_train, y_train.to_numpy(), candidates, args.cv_splits, args.workers)
+        params = cv[0]["params"]
+        print(f"[INFO] Mejor configuración: {params} (AP out-of-fold={cv[0]['avg_precision']})")
 
-    pipe = Pipeline([("pre", pre), ("clf", clf)])
+    pipe = make_pipeline(numeric_cols, **params)
     pipe.fit(X_train, y_train)
 
     # Evaluación
@@ -126,14 +395,31 @@ def main():
         "confusion_matrix@0.5": confusion_matrix(y_test, y_pred05).tolist(),
         "report@0.5": classification_report(y_test, y_pred05, output_dict=True),
         "suggested_threshold_mm": float(threshold),
-        "water_columns_detected": water_cols
+        "water_columns_detected": water_cols,
+        "params": params,
+        # Último día usado para ajustar: --incremental continúa desde aquí
+        "watermark": str(pd.Timestamp(train_df["datetime"].max()).date()),
     }
+    if cv is not None:
+        # Corte de probabilidad elegido en CV: la API lo toma de aquí en lugar de 0.25
+        metrics["decision_threshold"] = cv[0]["decision_threshold"]
+        y_pred = (proba >= metrics["decision_threshold"]).astype(int)
+        metrics["confusion_matrix@decision_threshold"] = confusion_matrix(y_test, y_pred, labels=[0, 1]).tolist()
+        metrics["cv"] = {"search": args.search, "n_splits": args.cv_splits, "results": cv}
 
-    # Guardado
+    # Guardado (feature_names.json al final: el registro de la API recarga cuando cambia)
+    (Path(args.out) / "feature_names.json").write_text(
+        json.dumps(numeric_cols, indent=2, ensure_ascii=False),
+        encoding="utf-8"
+    )
     joblib.dump(pipe, Path(args.out) / "model.pkl")
+    # Mismo modelo como arrays .npy + manifest.json para carga con mmap en la API
+    manifest = CompiledPipeline.from_pipeline(pipe, numeric_cols).save(
+        Path(args.out), source="model.pkl", model_path=Path(args.out) / "model.pkl")
     (Path(args.out) / "metrics.json").write_text(json.dumps(metrics, indent=2, ensure_ascii=False), encoding="utf-8")
 
     print(f"[OK] Modelo guardado en {args.out}/model.pkl")
+    print(f"[OK] Modelo compilado {manifest['version']} guardado en {args.out}/compiled/")
     print(f"[INFO] Métricas guardadas en {args.out}/metrics.json")
     print(f"[INFO] Umbral sugerido (etiqueta): {threshold:.2f} mm/día")
     if water_cols:
@@ -59,6 +59,8 @@ const formatTs = (ts) => {
   return `${secs}s desde arranque`;
 };
 
+const API_URL = "http://127.0.0.1:8000";
+
 export default function Dashboard() {
   const [data, setData] = useState(null); // respuesta de la API
   const [lastUpdate, setLastUpdate] = useState(new Date().toLocaleTimeString());
@@ -101,34 +103,68 @@ export default function Dashboard() {
     }
   };
 
+  const handleRisk = (json) => {
+    setData(json);
+    setLastUpdate(new Date().toLocaleTimeString());
+    setIsConnected(true);
+    setError(null);
+
+    const risk = getRiskColor(json.risk_probability);
+    if (isTesting || risk.label !== "Bajo") {
+      handleSendAlert(json.risk_probability);
+    }
+  };
+
   const fetchRisk = async () => {
     try {
-      setError(null);
       // ✔️ Ahora la API devuelve weather + esp32 + features + predicción
       const res = await fetch(
-        "http://127.0.0.1:8000/predict_realtime?use_esp32=true&device_id=esp32-water-01"
+        `${API_URL}/predict_realtime?use_esp32=true&device_id=${DEVICE_ID}`
       );
       if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
-
-      const json = await res.json();
-      setData(json);
-      setLastUpdate(new Date().toLocaleTimeString());
-      setIsConnected(true);
-
-      const risk = getRiskColor(json.risk_probability);
-      if (isTesting || risk.label !== "Bajo") {
-        handleSendAlert(json.risk_probability);
-      }
+      handleRisk(await res.json());
     } catch (err) {
       console.error("Error fetching risk:", err);
       setError("No se pudo obtener datos del servidor.");
     }
   };
 
+  // La API empuja el riesgo por SSE solo cuando cambia; si el stream no está
+  // disponible (precálculo desactivado, navegador sin EventSource) se vuelve al polling
   useEffect(() => {
-    fetchRisk();
-    const interval = setInterval(fetchRisk, 5000);
-    return () => clearInterval(interval);
+    let interval = null;
+    const startPolling = () => {
+      if (interval) return;
+      fetchRisk();
+      interval = setInterval(fetchRisk, 5000);
+    };
+
+    if (typeof EventSource === "undefined") {
+      startPolling();
+      return () => clearInterval(interval);
+    }
+
+    let received = false;
+    const source = new EventSource(`${API_URL}/stream/risk?device_id=${DEVICE_ID}`);
+    source.addEventListener("risk", (ev) => {
+      received = true;
+      handleRisk(JSON.parse(ev.data));
+    });
+    source.onerror = () => {
+      // Antes del primer evento: el endpoint no existe o no responde -> polling.
+      // Después: EventSource reconecta solo.
+      if (!received) {
+        source.close();
+        startPolling();
+      } else {
+        setIsConnected(false);
+      }
+    };
+
+    return () => {
+      source.close();
+      clearInterval(interval);
+    };
   }, []);
 
   // ==================== DERIVADOS DE NIVEL (altura útil, % y "lleno") ====================